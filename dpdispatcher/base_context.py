@@ -1,5 +1,6 @@
 from abc import ABCMeta, abstractmethod
-from typing import Any, List, Tuple
+from pathlib import PurePath
+from typing import Any, List, Optional, Set, Tuple
 
 from dargs import Argument
 
@@ -12,6 +13,8 @@ class BaseContext(metaclass=ABCMeta):
     # alias: for subclasses_dict key
     # notes: this attribute can be inherited
     alias: Tuple[str, ...] = tuple()
+    # snapshot of the finish tags taken by refresh_finished_tags
+    finished_tags: Optional[Set[str]] = None
 
     def __new__(cls, *args, **kwargs):
         if cls is BaseContext:
@@ -70,6 +73,119 @@ class BaseContext(metaclass=ABCMeta):
     def read_file(self, fname):
         raise NotImplementedError("abstract method")
 
+    def write_file_stream(self, fname, chunks):
+        """Write the chunks of strings to the given file.
+
+        Contexts that are able to write a remote file piece by piece should
+        override this method, as the chunks are joined by default.
+
+        Parameters
+        ----------
+        fname : str
+            file name relative to the remote root
+        chunks : Iterable[str]
+            the chunks of the content
+        """
+        self.write_file(fname, write_str="".join(chunks))
+
+    def read_file_stream(self, fname, chunk_size=1 << 20):
+        """Read the given file piece by piece.
+
+        Contexts that are able to read a remote file piece by piece should
+        override this method, as the whole file is read by default.
+
+        Parameters
+        ----------
+        fname : str
+            file name relative to the remote root
+        chunk_size : int, default=1 MiB
+            the number of the characters in each chunk
+
+        Yields
+        ------
+        str
+            the chunks of the content
+        """
+        yield self.read_file(fname)
+
+    def append_file(self, fname, write_str):
+        """Append the string to the end of the given file, which is created if missing.
+
+        Contexts that are able to append to a remote file should override
+        this method, as the whole file is read and written again by default.
+
+        Parameters
+        ----------
+        fname : str
+            file name relative to the remote root
+        write_str : str
+            the string to be appended
+        """
+        if self.check_file_exists(fname):
+            write_str = self.read_file(fname) + write_str
+        self.write_file(fname, write_str=write_str)
+
+    def list_finished_tags(self, max_depth: Optional[int] = None) -> Optional[Set[str]]:
+        """List the finish tags of jobs and tasks under the remote root.
+
+        Contexts that are able to list the remote directory at once should
+        override this method.
+
+        Parameters
+        ----------
+        max_depth : int, optional
+            the maximum depth of the tags, where the tags in the remote root
+            have the depth 1
+
+        Returns
+        -------
+        set[str] or None
+            the posix paths of `*_tag_finished` files relative to the remote root,
+            or None if listing is not supported by this context
+        """
+        return None
+
+    def refresh_finished_tags(self):
+        """Take a snapshot of the finish tags under the remote root.
+
+        The snapshot is used by :meth:`check_tag_exists`, so that the tags of
+        all the jobs and tasks are checked with one listing instead of one
+        request for each tag.
+        """
+        max_depth = None
+        submission = getattr(self, "submission", None)
+        if submission is not None and submission.belonging_tasks:
+            max_depth = 1 + max(
+                len(PurePath(task.task_work_path).parts)
+                for task in submission.belonging_tasks
+            )
+        self.finished_tags = self.list_finished_tags(max_depth=max_depth)
+
+    def check_tag_exists(self, fname, verify=True) -> bool:
+        """Check whether the given tag file exists.
+
+        The snapshot taken by :meth:`refresh_finished_tags` is looked up first.
+
+        Parameters
+        ----------
+        fname : str
+            tag file name relative to the remote root
+        verify : bool, default=True
+            whether to check the file itself if it is not in the snapshot,
+            as the tag may be created after the snapshot is taken
+
+        Returns
+        -------
+        bool
+            whether the tag exists
+        """
+        if self.finished_tags is not None:
+            if PurePath(fname).as_posix() in self.finished_tags:
+                return True
+            if not verify:
+                return False
+        return self.check_file_exists(fname)
+
     def check_finish(self, proc):
         raise NotImplementedError("abstract method")
 
@@ -2,6 +2,7 @@ import os
 import subprocess as sp
 
 from dpdispatcher.base_context import BaseContext
+from dpdispatcher.utils.utils import find_finished_tags
 
 
 class SPRetObj:
@@ -135,6 +136,21 @@ class LazyLocalContext(BaseContext):
             ret = fp.read()
         return ret
 
+    def write_file_stream(self, fname, chunks):
+        os.makedirs(self.remote_root, exist_ok=True)
+        with open(os.path.join(self.remote_root, fname), "w") as fp:
+            for chunk in chunks:
+                fp.write(chunk)
+
+    def read_file_stream(self, fname, chunk_size=1 << 20):
+        with open(os.path.join(self.remote_root, fname)) as fp:
+            yield from iter(lambda: fp.read(chunk_size), "")
+
+    def append_file(self, fname, write_str):
+        os.makedirs(self.remote_root, exist_ok=True)
+        with open(os.path.join(self.remote_root, fname), "a") as fp:
+            fp.write(write_str)
+
     def check_file_exists(self, fname):
         # submission_work_base = os.path.join(self.local_root, self.submission.work_base)
         # file_to_be_checked = os.path.join(submission_work_base, fname)
@@ -142,6 +158,9 @@ class LazyLocalContext(BaseContext):
         # return os.path.isfile(file_to_be_checked)
         return os.path.isfile(os.path.join(self.remote_root, fname))
 
+    def list_finished_tags(self, max_depth=None):
+        return find_finished_tags(self.remote_root, max_depth=max_depth)
+
     def call(self, cmd):
         cwd = os.getcwd()
         proc = sp.Popen(
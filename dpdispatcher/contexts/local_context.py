@@ -9,6 +9,7 @@ from dargs import Argument
 
 from dpdispatcher.base_context import BaseContext
 from dpdispatcher.dlog import dlog
+from dpdispatcher.utils.utils import find_finished_tags
 
 
 class SPRetObj:
@@ -324,9 +325,27 @@ class LocalContext(BaseContext):
             ret = fp.read()
         return ret
 
+    def write_file_stream(self, fname, chunks):
+        os.makedirs(self.remote_root, exist_ok=True)
+        with open(os.path.join(self.remote_root, fname), "w") as fp:
+            for chunk in chunks:
+                fp.write(chunk)
+
+    def read_file_stream(self, fname, chunk_size=1 << 20):
+        with open(os.path.join(self.remote_root, fname)) as fp:
+            yield from iter(lambda: fp.read(chunk_size), "")
+
+    def append_file(self, fname, write_str):
+        os.makedirs(self.remote_root, exist_ok=True)
+        with open(os.path.join(self.remote_root, fname), "a") as fp:
+            fp.write(write_str)
+
     def check_file_exists(self, fname):
         return os.path.isfile(os.path.join(self.remote_root, fname))
 
+    def list_finished_tags(self, max_depth=None):
+        return find_finished_tags(self.remote_root, max_depth=max_depth)
+
     def call(self, cmd):
         proc = sp.Popen(
             cmd, cwd=self.remote_root, shell=True, stdout=sp.PIPE, stderr=sp.PIPE
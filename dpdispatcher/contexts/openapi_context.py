@@ -291,6 +291,11 @@ class OpenAPIContext(BaseContext):
         submission_file_name = f"{self.submission.submission_hash}.json"
         submission_json = os.path.join(DP_CLOUD_SERVER_HOME_DIR, submission_file_name)
         os.remove(submission_json)
+        journal_file = os.path.join(
+            DP_CLOUD_SERVER_HOME_DIR, f"{self.submission.submission_hash}.journal"
+        )
+        if os.path.isfile(journal_file):
+            os.remove(journal_file)
         return True
 
     def _check_if_job_has_already_downloaded(self, target, local_root):
@@ -1,18 +1,24 @@
 #!/usr/bin/env python
 
+import codecs
 import fnmatch
+import json
+import math
 import os
 import pathlib
+import posixpath
 import shlex
 import shutil
 import socket
 import tarfile
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 from glob import glob
 from stat import S_ISDIR, S_ISREG
-from typing import List
+from typing import Dict, List, Set, Tuple
 
 import paramiko
 import paramiko.ssh_exception
@@ -20,6 +26,8 @@ from dargs.dargs import Argument
 
 from dpdispatcher.base_context import BaseContext
 from dpdispatcher.dlog import dlog
+from dpdispatcher.utils.cache import FileHashCache
+from dpdispatcher.utils.codec import Codec, is_compressed
 
 # from dpdispatcher.submission import Machine
 from dpdispatcher.utils.utils import (
@@ -31,7 +39,73 @@ from dpdispatcher.utils.utils import (
 )
 
 
+def split_ranges(size: int, parts: int, min_size: int) -> List[Tuple[int, int]]:
+    """Split the bytes of a file into contiguous ranges.
+
+    Parameters
+    ----------
+    size : int
+        the size of the file in bytes
+    parts : int
+        the maximum number of the ranges
+    min_size : int
+        the minimum size of each range except the last one
+
+    Returns
+    -------
+    list[tuple[int, int]]
+        the offset and the length of each range
+    """
+    if size <= 0:
+        return [(0, 0)]
+    parts = max(1, min(parts, size // max(min_size, 1)))
+    step = -(-size // parts)
+    return [(offset, min(step, size - offset)) for offset in range(0, size, step)]
+
+
+def feed_stdin(stdin, data: bytes) -> threading.Thread:
+    """Write the data to the stdin of a remote command in a thread.
+
+    The remote command may fill the SSH window with its output before it has
+    read all of its input, so the output must be read meanwhile.
+
+    Parameters
+    ----------
+    stdin : paramiko.ChannelFile
+        the stdin of the remote command, which is closed after written
+    data : bytes
+        the input
+
+    Returns
+    -------
+    threading.Thread
+        the thread writing the input
+    """
+
+    def write():
+        try:
+            stdin.write(data)
+            stdin.close()
+        except OSError:
+            # the command exits without reading all the input; its exit
+            # status tells why
+            pass
+
+    thread = threading.Thread(target=write, daemon=True)
+    thread.start()
+    return thread
+
+
+# print the size and the first 8 bytes in hex of each file read from stdin
+_file_header_script = r"""while IFS= read -r f; do [ ! -f "$f" ] || printf '%s %s\n' "$(stat -L -c %s -- "$f")" "$(head -c 8 -- "$f" | od -An -tx1 | tr -d ' \n')"; done"""
+
+
 class SSHSession:
+    # the size of each read or write in the parallel transfer
+    transfer_block_size = 1 << 20
+    # the number of the blocks requested at once by a channel when downloading
+    transfer_window = 16
+
     def __init__(
         self,
         hostname,
@@ -46,6 +120,15 @@ class SSHSession:
         look_for_keys=True,
         execute_command=None,
         proxy_command=None,
+        parallel_channels=1,
+        parallel_chunk_size=16,
+        tar_stream=False,
+        incremental_upload=False,
+        file_store=False,
+        compress_codec=None,
+        compress_level=None,
+        compress_threads=1,
+        skip_compressed=True,
     ):
         self.hostname = hostname
         self.username = username
@@ -60,7 +143,19 @@ class SSHSession:
         self.look_for_keys = look_for_keys
         self.execute_command = execute_command
         self.proxy_command = proxy_command
+        self.parallel_channels = parallel_channels
+        self.parallel_chunk_size = parallel_chunk_size
+        self.tar_stream = tar_stream
+        self.incremental_upload = incremental_upload
+        self.file_store = file_store
+        self.compress_codec = compress_codec
+        self.compress_level = compress_level
+        self.compress_threads = compress_threads
+        self.skip_compressed = skip_compressed
         self._keyboard_interactive_auth = False
+        # jobs may be submitted from multiple threads
+        self._reconnect_lock = threading.Lock()
+        self._channels_lock = threading.Lock()
         self._setup_ssh()
 
     # @classmethod
@@ -88,16 +183,19 @@ class SSHSession:
     #         time.sleep(sleep_time)
 
     def ensure_alive(self, max_check=10, sleep_time=10):
-        count = 1
-        while not self._check_alive():
-            if count == max_check:
-                raise RuntimeError(
-                    f"cannot connect ssh after {max_check} failures at interval {sleep_time} s"
+        with self._reconnect_lock:
+            count = 1
+            while not self._check_alive():
+                if count == max_check:
+                    raise RuntimeError(
+                        f"cannot connect ssh after {max_check} failures at interval {sleep_time} s"
+                    )
+                dlog.info(
+                    "connection check failed, try to reconnect to " + self.hostname
                 )
-            dlog.info("connection check failed, try to reconnect to " + self.hostname)
-            self._setup_ssh()
-            count += 1
-            time.sleep(sleep_time)
+                self._setup_ssh()
+                count += 1
+                time.sleep(sleep_time)
 
     def _check_alive(self):
         if self.ssh is None:
@@ -243,6 +341,7 @@ class SSHSession:
         self.ssh._transport = ts
         # reset sftp
         self._sftp = None
+        self._sftp_channels = []
         if self.execute_command is not None:
             self.exec_command(self.execute_command)
 
@@ -343,6 +442,44 @@ class SSHSession:
         doc_look_for_keys = "Whether to search for discoverable private key files in ~/.ssh when key_filename is not provided."
         doc_execute_command = "Optional command executed immediately after the SSH connection is established."
         doc_proxy_command = "Optional SSH ProxyCommand used to reach the target through an intermediate host or tunnel."
+        doc_parallel_channels = (
+            "The number of concurrent SFTP channels used to transfer an archive. "
+            "A large archive is split into chunks, which are transferred in parallel "
+            "and verified by sha256 after being reassembled. This improves the "
+            "throughput over links with a high latency. It has no effect when rsync is used."
+        )
+        doc_tar_stream = (
+            "Whether to pipe the tar archive through the SSH channel into `tar x` on the other side, "
+            "instead of writing a temporary archive, transferring it and extracting it. "
+            "Compression, transfer and extraction then overlap, and no temporary archive is created. "
+            "rsync and parallel_channels are not used in this mode."
+        )
+        doc_incremental_upload = (
+            "Whether to upload only the new or changed files. The size, mtime and sha256 of the uploaded "
+            "files are recorded in a manifest in the remote directory of the submission and in an index "
+            "under the remote root, and the sha256 of the local files are cached by their sizes and mtimes. "
+            "Files unchanged on the remote are skipped, and files uploaded by earlier submissions are "
+            "copied on the remote and verified by sha256 instead of being transferred."
+        )
+        doc_file_store = (
+            "Whether to keep the uploaded forward files in a content-addressed store under the remote root, "
+            "keyed by sha256. Files already in the store are hardlinked (or symlinked across filesystems) "
+            "into the remote directory of a submission instead of being transferred. The stored files are "
+            "read-only copies of the uploaded files, so tasks should not modify the linked forward files in place. "
+            "Unreferenced files are removed by `dpdisp gc`."
+        )
+        doc_compress_codec = (
+            "The compression codec of the transferred archives: none, gzip, zstd or lz4. "
+            "If not set, gzip is used if tar_compress is True, otherwise none. "
+            "zstd and lz4 require the command-line programs on both ends, which are checked on the remote. "
+            "gzip uses tar -z on the remote, or pigz with multiple threads if it is found."
+        )
+        doc_compress_level = "The compression level of the codec. Default is 6 for gzip, 3 for zstd and 1 for lz4."
+        doc_compress_threads = (
+            "The number of the compression threads, used by zstd and gzip (pigz)."
+        )
+        doc_skip_compressed = "Whether to skip the compression if most of the transferred data (by size) are already compressed, detected by the magic numbers of the files. Only used if compress_codec is set."
+        doc_parallel_chunk_size = "The minimum size in MiB of each chunk transferred by a channel. Smaller archives are transferred by one channel."
         ssh_remote_profile_args = [
             Argument("hostname", str, optional=False, doc=doc_hostname),
             Argument("username", str, optional=False, doc=doc_username),
@@ -398,6 +535,69 @@ class SSHSession:
                 default=None,
                 doc=doc_proxy_command,
             ),
+            Argument(
+                "parallel_channels",
+                int,
+                optional=True,
+                default=1,
+                doc=doc_parallel_channels,
+            ),
+            Argument(
+                "parallel_chunk_size",
+                int,
+                optional=True,
+                default=16,
+                doc=doc_parallel_chunk_size,
+            ),
+            Argument(
+                "tar_stream",
+                bool,
+                optional=True,
+                default=False,
+                doc=doc_tar_stream,
+            ),
+            Argument(
+                "incremental_upload",
+                bool,
+                optional=True,
+                default=False,
+                doc=doc_incremental_upload,
+            ),
+            Argument(
+                "file_store",
+                bool,
+                optional=True,
+                default=False,
+                doc=doc_file_store,
+            ),
+            Argument(
+                "compress_codec",
+                [str, type(None)],
+                optional=True,
+                default=None,
+                doc=doc_compress_codec,
+            ),
+            Argument(
+                "compress_level",
+                [int, type(None)],
+                optional=True,
+                default=None,
+                doc=doc_compress_level,
+            ),
+            Argument(
+                "compress_threads",
+                int,
+                optional=True,
+                default=1,
+                doc=doc_compress_threads,
+            ),
+            Argument(
+                "skip_compressed",
+                bool,
+                optional=True,
+                default=True,
+                doc=doc_skip_compressed,
+            ),
         ]
         ssh_remote_profile_format = Argument(
             "ssh_session", dict, ssh_remote_profile_args
@@ -420,7 +620,7 @@ class SSHSession:
                 timeout=self.timeout,
                 proxy_command=proxy_cmd_rsync,
             )
-        return self.sftp.put(from_f, to_f)
+        return self.parallel_put(from_f, to_f)
 
     def get(self, from_f, to_f):
         if self.rsync_available:
@@ -438,7 +638,118 @@ class SSHSession:
                 timeout=self.timeout,
                 proxy_command=proxy_cmd_rsync,
             )
-        return self.sftp.get(from_f, to_f)
+        return self.parallel_get(from_f, to_f)
+
+    def _get_sftp_channels(self, n: int) -> list:
+        """Get `n` SFTP channels, which are opened on the transport once and reused."""
+        sftp = self.sftp
+        with self._channels_lock:
+            assert self.ssh is not None
+            while len(self._sftp_channels) < n - 1:
+                self._sftp_channels.append(self.ssh.open_sftp())
+            return [sftp] + self._sftp_channels[: n - 1]
+
+    def _transfer_ranges(self, transfer_range, ranges: List[Tuple[int, int]]) -> None:
+        """Transfer the ranges of a file, each by a channel in a thread."""
+        channels = self._get_sftp_channels(len(ranges))
+        if len(ranges) == 1:
+            transfer_range(channels[0], *ranges[0])
+            return
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [
+                executor.submit(transfer_range, sftp, offset, length)
+                for sftp, (offset, length) in zip(channels, ranges)
+            ]
+            for future in futures:
+                # raise the exception in the threads
+                future.result()
+
+    def _check_sha256(self, local_f: str, remote_f: str) -> None:
+        """Check that the reassembled file is the same on both sides."""
+        _, stdout, _ = self.exec_command(f"sha256sum {shlex.quote(remote_f)}")
+        if stdout.channel.recv_exit_status() != 0:
+            dlog.warning("sha256sum is not available on the remote; skip the check")
+            return
+        remote_sha256 = stdout.read().decode("utf-8").split()[0]
+        if remote_sha256 != get_sha256(local_f):
+            raise RetrySignal(f"sha256 of {local_f} and {remote_f} mismatch")
+
+    @retry(sleep=1)
+    def parallel_put(self, from_f, to_f):
+        """Upload a file by `parallel_channels` SFTP channels.
+
+        Parameters
+        ----------
+        from_f : str
+            the local file
+        to_f : str
+            the remote file
+        """
+        size = os.path.getsize(from_f)
+        ranges = split_ranges(
+            size, self.parallel_channels, self.parallel_chunk_size * 1024**2
+        )
+        if len(ranges) == 1:
+            self.sftp.put(from_f, to_f)
+            return
+        block_size = self.transfer_block_size
+
+        def put_range(sftp, offset, length):
+            with open(from_f, "rb") as lf, sftp.open(to_f, "r+") as rf:
+                lf.seek(offset)
+                rf.seek(offset)
+                # do not wait for the server to acknowledge each write
+                rf.set_pipelined(True)
+                while length > 0:
+                    data = lf.read(min(block_size, length))
+                    if not data:
+                        raise RuntimeError(f"{from_f} is truncated while uploading")
+                    rf.write(data)
+                    length -= len(data)
+
+        with self.sftp.open(to_f, "w") as rf:
+            rf.truncate(size)
+        self._transfer_ranges(put_range, ranges)
+        self._check_sha256(from_f, to_f)
+
+    @retry(sleep=1)
+    def parallel_get(self, from_f, to_f):
+        """Download a file by `parallel_channels` SFTP channels.
+
+        Parameters
+        ----------
+        from_f : str
+            the remote file
+        to_f : str
+            the local file
+        """
+        size = self.sftp.stat(from_f).st_size
+        assert size is not None
+        ranges = split_ranges(
+            size, self.parallel_channels, self.parallel_chunk_size * 1024**2
+        )
+        if len(ranges) == 1:
+            self.sftp.get(from_f, to_f)
+            return
+        block_size = self.transfer_block_size
+        window = self.transfer_window
+
+        def get_range(sftp, offset, length):
+            blocks = [
+                (start, min(block_size, offset + length - start))
+                for start in range(offset, offset + length, block_size)
+            ]
+            with sftp.open(from_f, "r") as rf, open(to_f, "r+b") as lf:
+                lf.seek(offset)
+                # readv pipelines the requests; limit the blocks in flight
+                for ii in range(0, len(blocks), window):
+                    for data in rf.readv(blocks[ii : ii + window]):
+                        lf.write(data)
+
+        with open(to_f, "wb") as lf:
+            lf.truncate(size)
+        self._transfer_ranges(get_range, ranges)
+        self._check_sha256(to_f, from_f)
 
     @property
     @lru_cache(maxsize=None)
@@ -458,6 +769,13 @@ class SSHSession:
 
 
 class SSHContext(BaseContext):
+    # the manifest of the uploaded files, see `incremental_upload`
+    manifest_file_name = ".dpdispatcher_manifest.json"
+    # the content-addressed store of the uploaded files, see `file_store`
+    store_dir_name = ".dpdispatcher_store"
+    # skip the compression if the ratio of the compressed data exceeds it
+    skip_compression_ratio = 0.9
+
     def __init__(
         self,
         local_root,
@@ -659,9 +977,12 @@ class SSHContext(BaseContext):
         # convert to relative path to local_root
         directory_list = [os.path.relpath(jj, self.local_root) for jj in directory_list]
 
+        manifest = None
+        if self.ssh_session.incremental_upload or self.ssh_session.file_store:
+            file_list, manifest = self._filter_unchanged_files(file_list)
         # check if the same file exists on the remote file
         # only check sha256 when the job is recovered
-        if recover:
+        elif recover:
             # generate local sha256 file
             sha256_list = []
             for jj in file_list:
@@ -697,6 +1018,304 @@ class SSHContext(BaseContext):
             directories=directory_list,
             tar_compress=self.remote_profile.get("tar_compress", None),
         )
+        if manifest is not None:
+            self._write_manifest(manifest)
+
+    def _read_remote_json(self, fname) -> dict:
+        try:
+            return json.loads(self.read_file(fname))
+        except (OSError, ValueError):
+            return {}
+
+    @property
+    def _index_file(self) -> str:
+        """The index of the files uploaded by all submissions: sha256 to remote path."""
+        return pathlib.PurePath(
+            os.path.join(self.temp_remote_root, self.manifest_file_name)
+        ).as_posix()
+
+    def _remote_exec_stdin(self, cmd: str, input_str: str, cwd=None) -> str:
+        """Run the command in `cwd` (default: the remote root) with the input, and get the output.
+
+        Raises
+        ------
+        RuntimeError
+            when the return code is not zero
+        """
+        if cwd is None:
+            cwd = self.remote_root
+        assert cwd is not None
+        stdin, stdout, stderr = self.ssh_session.exec_command(
+            f"cd {shlex.quote(cwd)} && {cmd}"
+        )
+        feeder = feed_stdin(stdin, input_str.encode("utf-8"))
+        output = stdout.read().decode("utf-8")
+        feeder.join()
+        exit_status = stdout.channel.recv_exit_status()
+        if exit_status != 0:
+            raise RuntimeError(
+                f"Get error code {exit_status} in calling {cmd} in {cwd} . message: {stderr.read().decode('utf-8')}"
+            )
+        return output
+
+    def _stat_remote_files(self, files: List[str]) -> Dict[str, Tuple[int, int]]:
+        """Get the sizes and mtimes of the remote files; missing files are omitted."""
+        if not files:
+            return {}
+        # stat fails on the missing files, which are skipped first
+        output = self._remote_exec_stdin(
+            'xargs -d \'\\n\' -r sh -c \'for f; do [ ! -e "$f" ] || printf "%s\\n" "$f"; done\' sh'
+            " | xargs -d '\\n' -r stat -c '%s %Y %n' --",
+            "".join(f"{ff}\n" for ff in files),
+        )
+        stats = {}
+        for line in output.splitlines():
+            size, mtime, name = line.split(" ", 2)
+            stats[name] = (int(size), int(mtime))
+        return stats
+
+    def _copy_remote_files(self, copies: Dict[str, Tuple[str, str]]) -> Set[str]:
+        """Copy the files on the remote and verify them by sha256.
+
+        Parameters
+        ----------
+        copies : dict[str, tuple[str, str]]
+            the source path and the sha256 of each destination file
+
+        Returns
+        -------
+        set[str]
+            the destination files copied successfully
+        """
+        if not copies:
+            return set()
+        lines = []
+        for dst, (src, sha256) in copies.items():
+            lines.append(
+                f"mkdir -p -- {shlex.quote(posixpath.dirname(dst) or '.')}"
+                f" && cp -p -- {shlex.quote(src)} {shlex.quote(dst)} 2>/dev/null"
+                f" && echo {shlex.quote(f'{sha256}  {dst}')}"
+            )
+        # the files failing to copy or verify are uploaded instead
+        script = "{\n" + "\n".join(lines) + "\n} | sha256sum -c 2>/dev/null || :\n"
+        output = self._remote_exec_stdin("sh -s", script)
+        return {
+            line[: -len(": OK")]
+            for line in output.splitlines()
+            if line.endswith(": OK")
+        }
+
+    @property
+    def _store_dir(self) -> str:
+        """The content-addressed store of the uploaded files, see `file_store`."""
+        return pathlib.PurePath(
+            os.path.join(self.temp_remote_root, self.store_dir_name)
+        ).as_posix()
+
+    def _store_path(self, sha256: str) -> str:
+        return f"{self._store_dir}/{sha256[:2]}/{sha256}"
+
+    def _link_stored_files(self, files: Dict[str, str]) -> Set[str]:
+        """Link the files in the store into the remote directory.
+
+        Parameters
+        ----------
+        files : dict[str, str]
+            the sha256 of each file relative to the remote directory
+
+        Returns
+        -------
+        set[str]
+            the files found in the store and linked
+        """
+        if not files:
+            return set()
+        lines = []
+        for dst, sha256 in files.items():
+            src = shlex.quote(self._store_path(sha256))
+            dst = shlex.quote(dst)
+            # the symlink dangles if the entry is removed meanwhile, so it is
+            # checked and removed, and then the file is uploaded normally;
+            # touch marks the entry as recently used
+            lines.append(
+                f"[ -f {src} ]"
+                f" && mkdir -p -- $(dirname -- {dst}) && rm -f -- {dst}"
+                f" && {{ ln -- {src} {dst} 2>/dev/null"
+                f" || {{ ln -s -- {src} {dst} && [ -f {dst} ]; }}"
+                f" || {{ rm -f -- {dst}; false; }}; }}"
+                f" && touch -c -- {src} && printf '%s\\n' {dst}"
+            )
+        # the files not linked are uploaded instead
+        output = self._remote_exec_stdin("sh -s", "\n".join(lines) + "\n:\n")
+        return set(output.splitlines())
+
+    def _store_files(self, files: Dict[str, str]) -> None:
+        """Add the uploaded files to the store if missing.
+
+        Parameters
+        ----------
+        files : dict[str, str]
+            the sha256 of each file relative to the remote directory
+        """
+        if not files:
+            return
+        lines = []
+        for src, sha256 in files.items():
+            dst = self._store_path(sha256)
+            tmp = shlex.quote(f"{dst}.{uuid.uuid4().hex}")
+            src = shlex.quote(src)
+            dst = shlex.quote(dst)
+            # the stored files are shared by the submissions, so they are
+            # read-only copies; the uploaded files are left writable. The
+            # mtime of an entry is the time of its last use, see gc_file_store,
+            # so the mtime of the uploaded file is not preserved
+            lines.append(
+                f"if [ -f {dst} ]; then touch -c -- {dst};"
+                f" else mkdir -p -- $(dirname -- {dst})"
+                f" && cp -- {src} {tmp} && chmod a-w -- {tmp} && mv -f -- {tmp} {dst}; fi"
+                " || exit 1"
+            )
+        self._remote_exec_stdin("sh -s", "\n".join(lines) + "\n")
+
+    def gc_file_store(self, max_age: float = 7 * 86400, max_size=None):
+        """Remove the unreferenced files in the store.
+
+        A stored file is referenced while it is hardlinked into the remote
+        directory of a submission, i.e. its link count is larger than 1.
+        Symlinks can not be counted, so a file is removed only if it has not
+        been used for `max_age` seconds.
+
+        Parameters
+        ----------
+        max_age : float, default=7 days
+            the seconds since the last use of the unreferenced files to remove
+        max_size : int, optional
+            the maximum total size of the unreferenced files in bytes. The least
+            recently used ones are removed until the size is not exceeded, even
+            if they are younger than `max_age`, which may break the symlinks.
+
+        Returns
+        -------
+        int
+            the number of the removed files
+        int
+            the total size of the removed files in bytes
+        """
+        self.ssh_session.ensure_alive()
+        _, stdout, _ = self.ssh_session.exec_command(
+            f"date +%s && find {shlex.quote(self._store_dir)} -type f -printf '%T@ %s %n %p\\n' 2>/dev/null"
+        )
+        lines = stdout.read().decode("utf-8").splitlines()
+        stdout.channel.recv_exit_status()
+        now = float(lines[0])
+        unreferenced = []
+        for line in lines[1:]:
+            mtime, size, nlink, path = line.split(" ", 3)
+            if int(nlink) == 1:
+                unreferenced.append((float(mtime), int(size), path))
+        unreferenced.sort()
+        total_size = sum(size for _, size, _ in unreferenced)
+        removed = []
+        removed_size = 0
+        for mtime, size, path in unreferenced:
+            if now - mtime > max_age or (
+                max_size is not None and total_size > max_size
+            ):
+                removed.append(path)
+                removed_size += size
+                total_size -= size
+        if removed:
+            self._remote_exec_stdin(
+                "xargs -d '\\n' -r rm -f --",
+                "".join(f"{path}\n" for path in removed),
+                cwd=self.temp_remote_root,
+            )
+        dlog.info(
+            f"removed {len(removed)} files ({removed_size} bytes) from the file store"
+        )
+        return len(removed), removed_size
+
+    def _filter_unchanged_files(self, file_list):
+        """Get the files to upload, skipping the files already on the remote.
+
+        Parameters
+        ----------
+        file_list : list[str]
+            the absolute local paths of the files
+
+        Returns
+        -------
+        list[str]
+            the files to upload, relative to the local root
+        dict[str, str]
+            the sha256 of all the files, to be recorded after the upload
+        """
+        hash_cache = FileHashCache()
+        local_hashes = {
+            pathlib.PurePath(os.path.relpath(ff, self.local_root)).as_posix(): (
+                hash_cache.get_sha256(ff)
+            )
+            for ff in file_list
+        }
+        hash_cache.save()
+        # the files uploaded before and not modified by the tasks
+        manifest = self._read_remote_json(self.manifest_file_name)
+        candidates = [
+            ff
+            for ff, sha256 in local_hashes.items()
+            if manifest.get(ff, {}).get("sha256") == sha256
+        ]
+        stats = self._stat_remote_files(candidates)
+        unchanged = {
+            ff
+            for ff in candidates
+            if stats.get(ff) == (manifest[ff]["size"], manifest[ff]["mtime"])
+        }
+        # the files uploaded by other submissions
+        if self.ssh_session.file_store:
+            reused = self._link_stored_files(
+                {
+                    ff: sha256
+                    for ff, sha256 in local_hashes.items()
+                    if ff not in unchanged
+                }
+            )
+        else:
+            index = self._read_remote_json(self._index_file)
+            copies = {
+                ff: (index[sha256], sha256)
+                for ff, sha256 in local_hashes.items()
+                if ff not in unchanged and sha256 in index
+            }
+            reused = self._copy_remote_files(copies)
+        dlog.info(
+            f"{len(unchanged)} files are unchanged and {len(reused)} files are reused on the remote"
+        )
+        return [
+            ff for ff in local_hashes if ff not in unchanged and ff not in reused
+        ], local_hashes
+
+    def _write_manifest(self, local_hashes: Dict[str, str]) -> None:
+        """Record the uploaded files in the manifest and the index."""
+        assert self.remote_root is not None
+        stats = self._stat_remote_files(list(local_hashes))
+        manifest = {
+            ff: {"size": stats[ff][0], "mtime": stats[ff][1], "sha256": sha256}
+            for ff, sha256 in local_hashes.items()
+            if ff in stats
+        }
+        self.write_file(self.manifest_file_name, json.dumps(manifest))
+        if self.ssh_session.file_store:
+            self._store_files({ff: entry["sha256"] for ff, entry in manifest.items()})
+            return
+        # other submissions may update the index at the same time; losing
+        # some entries only causes more transfers
+        index = self._read_remote_json(self._index_file)
+        for ff, entry in manifest.items():
+            index[entry["sha256"]] = pathlib.PurePath(
+                os.path.join(self.remote_root, ff)
+            ).as_posix()
+        self.write_file(self._index_file, json.dumps(index))
 
     def list_remote_dir(self, sftp, remote_dir, ref_remote_root, result_list):
         for entry in sftp.listdir_attr(remote_dir):
@@ -830,6 +1449,46 @@ class SSHContext(BaseContext):
             ret = fp.read().decode("utf-8")
         return ret
 
+    def write_file_stream(self, fname, chunks):
+        assert self.remote_root is not None
+        self.ssh_session.ensure_alive()
+        fname = pathlib.PurePath(os.path.join(self.remote_root, fname)).as_posix()
+        # the same as write_file: write a temporary file first
+        temp_fname = fname + "_tmp"
+        try:
+            with self.sftp.open(temp_fname, "w") as fp:
+                # do not wait for the server to acknowledge each write
+                fp.set_pipelined(True)
+                for chunk in chunks:
+                    fp.write(chunk)
+            self.block_checkcall(f"mv {shlex.quote(temp_fname)} {shlex.quote(fname)}")
+        except OSError as e:
+            dlog.exception(f"Error writing to file {fname}")
+            raise e
+
+    def read_file_stream(self, fname, chunk_size=1 << 20):
+        assert self.remote_root is not None
+        self.ssh_session.ensure_alive()
+        # a multi-byte character may be split between the chunks
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        with self.sftp.open(
+            pathlib.PurePath(os.path.join(self.remote_root, fname)).as_posix(),
+            "r",
+        ) as fp:
+            fp.prefetch()
+            for chunk in iter(lambda: fp.read(chunk_size), b""):
+                yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+    def append_file(self, fname, write_str):
+        assert self.remote_root is not None
+        self.ssh_session.ensure_alive()
+        with self.sftp.open(
+            pathlib.PurePath(os.path.join(self.remote_root, fname)).as_posix(),
+            "a",
+        ) as fp:
+            fp.write(write_str)
+
     def check_file_exists(self, fname):
         assert self.remote_root is not None
         self.ssh_session.ensure_alive()
@@ -842,6 +1501,25 @@ class SSHContext(BaseContext):
             ret = False
         return ret
 
+    def list_finished_tags(self, max_depth=None):
+        assert self.remote_root is not None
+        cmd = f"cd {shlex.quote(self.remote_root)} && find . "
+        if max_depth is not None:
+            cmd += f"-maxdepth {max_depth} "
+        cmd += "-type f -name '*_tag_finished'"
+        ret, stdin, stdout, stderr = self.block_call(cmd)
+        if ret != 0:
+            dlog.debug(
+                f"failed to list finish tags: {stderr.read().decode('utf-8')}; "
+                "fall back to checking the tags one by one"
+            )
+            return None
+        return {
+            pathlib.PurePath(line).as_posix()
+            for line in stdout.read().decode("utf-8").splitlines()
+            if line.strip()
+        }
+
     def call(self, cmd):
         stdin, stdout, stderr = self.ssh_session.exec_command(cmd)
         # stdin, stdout, stderr = self.ssh.exec_command('echo $$; exec ' + cmd)
@@ -897,39 +1575,29 @@ class SSHContext(BaseContext):
             recursively
         tar_compress : bool, default: True
             If tar_compress is True, compress the archive using gzip
-            It it is False, then it is uncompressed
+            It it is False, then it is uncompressed. `compress_codec` in
+            the remote profile takes precedence over it.
         """
         assert self.remote_root is not None
-        of_suffix = ".tgz"
-        if not tar_compress:
-            of_suffix = ".tar"
-
-        of = self.submission.submission_hash + of_suffix
+        if self.ssh_session.tar_stream:
+            self._put_files_stream(
+                files,
+                dereference=dereference,
+                directories=directories,
+                tar_compress=tar_compress,
+            )
+            return
+        codec = self._get_codec(
+            tar_compress, lambda: self._local_compressed_ratio(files)
+        )
+        of = self.submission.submission_hash + codec.suffix
         # local tar
         if os.path.isfile(os.path.join(self.local_root, of)):
             os.remove(os.path.join(self.local_root, of))
-        with (
-            tarfile.open(
-                os.path.join(self.local_root, of),
-                mode="w:gz",
-                dereference=dereference,
-                compresslevel=6,
+        with open(os.path.join(self.local_root, of), "wb") as f:
+            self._write_tar(
+                f, codec, files, directories=directories, dereference=dereference
             )
-            if tar_compress
-            else tarfile.open(
-                os.path.join(self.local_root, of),
-                mode="w",
-                dereference=dereference,
-            )
-        ) as tar:
-            # avoid compressing duplicated files or directories
-            for ii in set(files):
-                ii_full = os.path.join(self.local_root, ii)
-                tar.add(ii_full, arcname=ii)
-            if directories is not None:
-                for ii in set(directories):
-                    ii_full = os.path.join(self.local_root, ii)
-                    tar.add(ii_full, arcname=ii, recursive=False)
         self.ssh_session.ensure_alive()
         try:
             self.sftp.mkdir(self.remote_root)
@@ -945,7 +1613,9 @@ class SSHContext(BaseContext):
                 f"from {from_f} to {self.ssh_session.username} @ {self.ssh_session.hostname} : {to_f} Error!"
             )
         # remote extract
-        self.block_checkcall(f"tar xf {of}")
+        self.block_checkcall(
+            f"tar {codec.get_tar_option(extract=True)} -xf {shlex.quote(of)}"
+        )
         # clean up
         os.remove(from_f)
         self.sftp.remove(to_f)
@@ -954,16 +1624,15 @@ class SSHContext(BaseContext):
         assert self.remote_root is not None
         # avoid compressing duplicated files
         files = list(set(files))
+        if self.ssh_session.tar_stream:
+            self._get_files_stream(files, tar_compress=tar_compress)
+            return
 
-        of_suffix = ".tar.gz"
-        tarfile_mode = "r:gz"
-        tar_command = "czfh"
-        if not tar_compress:
-            of_suffix = ".tar"
-            tarfile_mode = "r"
-            tar_command = "cfh"
-
-        of = self.submission.submission_hash + of_suffix
+        codec = self._get_codec(
+            tar_compress, lambda: self._remote_compressed_ratio(files)
+        )
+        tar_command = f"-c -h {codec.get_tar_option()} -f"
+        of = self.submission.submission_hash + codec.suffix
         # remote tar
         # If the number of files are large, we may get "Argument list too long" error.
         # Thus, "-T" accepts a file containing the list of files
@@ -998,12 +1667,196 @@ class SSHContext(BaseContext):
             os.remove(to_f)
         self.ssh_session.get(from_f, to_f)
         # extract
-        with tarfile.open(to_f, mode=tarfile_mode) as tar:
-            tar.extractall(path=self.local_root)
+        with open(to_f, "rb") as f, codec.open_reader(f) as fileobj:
+            with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+                tar.extractall(path=self.local_root)
         # cleanup
         os.remove(to_f)
         self.sftp.remove(from_f)
 
+    def _get_codec(self, tar_compress, compressed_ratio) -> Codec:
+        """Get the codec of the archives.
+
+        Parameters
+        ----------
+        tar_compress : bool
+            whether to use gzip if `compress_codec` is not set
+        compressed_ratio : Callable[[], float]
+            get the ratio of the compressed data in the files by size
+
+        Returns
+        -------
+        Codec
+            the codec
+        """
+        session = self.ssh_session
+        name = session.compress_codec
+        # the files are sampled only if a codec is set, which costs a round
+        # trip for the remote files; the default keeps the old behavior
+        if name is None:
+            name = "gzip" if tar_compress else "none"
+        elif (
+            name != "none"
+            and session.skip_compressed
+            and compressed_ratio() >= self.skip_compression_ratio
+        ):
+            dlog.info("the files are already compressed; skip the compression")
+            name = "none"
+        codec = Codec.get_codec(
+            name, level=session.compress_level, threads=session.compress_threads
+        )
+        program = codec.remote_program
+        if program is not None and not self._remote_has_program(program):
+            if name == "gzip":
+                dlog.info(f"{program} is not found on the remote; use tar -z instead")
+                return Codec.get_codec("gzip")
+            raise RuntimeError(
+                f"{program} is not found on the remote, which is required by the {name} codec"
+            )
+        return codec
+
+    def _remote_has_program(self, program: str) -> bool:
+        """Check whether the program is on the remote; the result is cached."""
+        remote_programs = vars(self).setdefault("_remote_programs", {})
+        if program not in remote_programs:
+            ret, _, _, _ = self.block_call(f"command -v {shlex.quote(program)}")
+            remote_programs[program] = ret == 0
+        return remote_programs[program]
+
+    def _local_compressed_ratio(self, files) -> float:
+        """Get the ratio of the compressed local files by size."""
+        total_size = 0
+        compressed_size = 0
+        for ii in set(files):
+            path = os.path.join(self.local_root, ii)
+            if not os.path.isfile(path):
+                continue
+            size = os.path.getsize(path)
+            with open(path, "rb") as f:
+                header = f.read(8)
+            total_size += size
+            if is_compressed(header):
+                compressed_size += size
+        return compressed_size / total_size if total_size else 0.0
+
+    def _remote_compressed_ratio(self, files, n_samples=100) -> float:
+        """Get the ratio of the compressed remote files by size.
+
+        At most `n_samples` files evenly spaced in the sorted file list are
+        sampled, so that the sample spreads over the directories.
+        """
+        files = sorted(set(files))
+        samples = files[:: max(1, math.ceil(len(files) / n_samples))]
+        output = self._remote_exec_stdin(
+            _file_header_script, "".join(f"{ff}\n" for ff in samples)
+        )
+        total_size = 0
+        compressed_size = 0
+        for line in output.splitlines():
+            size, _, header = line.partition(" ")
+            total_size += int(size)
+            if is_compressed(bytes.fromhex(header)):
+                compressed_size += int(size)
+        return compressed_size / total_size if total_size else 0.0
+
+    def _write_tar(self, fileobj, codec, files, directories=None, dereference=True):
+        """Write the files into a tar stream compressed by the codec."""
+        with codec.open_writer(fileobj) as f:
+            with tarfile.open(fileobj=f, mode="w|", dereference=dereference) as tar:
+                # avoid compressing duplicated files or directories
+                for ii in set(files):
+                    ii_full = os.path.join(self.local_root, ii)
+                    tar.add(ii_full, arcname=ii)
+                if directories is not None:
+                    for ii in set(directories):
+                        ii_full = os.path.join(self.local_root, ii)
+                        tar.add(ii_full, arcname=ii, recursive=False)
+
+    def _put_files_stream(
+        self,
+        files,
+        dereference=True,
+        directories=None,
+        tar_compress=True,
+    ):
+        """Upload files to server by piping a tar stream into `tar x` on the server.
+
+        The parameters are the same as `_put_files`.
+        """
+        assert self.remote_root is not None
+        self.ssh_session.ensure_alive()
+        try:
+            self.sftp.mkdir(self.remote_root)
+        except OSError:
+            pass
+        codec = self._get_codec(
+            tar_compress, lambda: self._local_compressed_ratio(files)
+        )
+        stdin, stdout, stderr = self.ssh_session.exec_command(
+            f"cd {shlex.quote(self.remote_root)} && tar {codec.get_tar_option(extract=True)} -xf -"
+        )
+        write_error = None
+        try:
+            try:
+                self._write_tar(
+                    stdin,
+                    codec,
+                    files,
+                    directories=directories,
+                    dereference=dereference,
+                )
+            finally:
+                # send EOF to the remote tar
+                stdin.close()
+        except OSError as e:
+            # the channel is closed if the remote tar exits early; its exit
+            # status and stderr tell why
+            write_error = e
+        exit_status = stdout.channel.recv_exit_status()
+        if exit_status != 0:
+            raise RuntimeError(
+                f"extracting the uploaded files fails\nerror message:{stderr.read().decode('utf-8')}\nreturn code {exit_status}\n"
+            ) from write_error
+        if write_error is not None:
+            raise write_error
+
+    def _get_files_stream(self, files, tar_compress=True):
+        """Download files from server by reading the tar stream of `tar c` on the server.
+
+        The parameters are the same as `_get_files`.
+        """
+        assert self.remote_root is not None
+        self.ssh_session.ensure_alive()
+        codec = self._get_codec(
+            tar_compress, lambda: self._remote_compressed_ratio(files)
+        )
+        # the file list is read from stdin to avoid "Argument list too long"
+        stdin, stdout, stderr = self.ssh_session.exec_command(
+            f"cd {shlex.quote(self.remote_root)} && tar -c -h {codec.get_tar_option()} -f - -T -"
+        )
+        feeder = feed_stdin(stdin, ("\n".join(files) + "\n").encode("utf-8"))
+        tar_error = None
+        try:
+            with codec.open_reader(stdout) as fileobj:
+                with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+                    tar.extractall(path=self.local_root)
+        except (tarfile.TarError, RuntimeError) as e:
+            # the stream may be broken because the remote tar fails
+            tar_error = e
+        feeder.join()
+        exit_status = stdout.channel.recv_exit_status()
+        if exit_status == 0 and tar_error is not None:
+            raise tar_error
+        if exit_status != 0:
+            err_str = stderr.read().decode("utf-8")
+            if "No such file or directory" in err_str:
+                raise FileNotFoundError(
+                    "Backward files do not exist in the remote directory."
+                )
+            raise RuntimeError(
+                f"archiving the downloaded files fails\nerror message:{err_str}\nreturn code {exit_status}\n"
+            )
+
     @classmethod
     def machine_subfields(cls) -> List[Argument]:
         """Generate the machine subfields.
@@ -2,6 +2,7 @@
 import argparse
 from typing import List, Optional
 
+from dpdispatcher.entrypoints.gc import gc
 from dpdispatcher.entrypoints.gui import start_dpgui
 from dpdispatcher.entrypoints.run import run
 from dpdispatcher.entrypoints.submission import handle_submission
@@ -127,6 +128,30 @@ def main_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="Allow loading external JSON/YAML snippets through `$ref`. Disabled by default for security.",
     )
+    ##########################################
+    # gc
+    parser_gc = subparsers.add_parser(
+        "gc",
+        help="Remove the unreferenced files in the file store of a machine.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser_gc.add_argument(
+        "filename",
+        type=str,
+        help="JSON file containing the machine configuration, with `file_store` enabled in `remote_profile`.",
+    )
+    parser_gc.add_argument(
+        "--max-age",
+        type=float,
+        default=7,
+        help="Remove the unreferenced files not used for these days.",
+    )
+    parser_gc.add_argument(
+        "--max-size",
+        type=int,
+        default=None,
+        help="The maximum total size in MiB of the unreferenced files to keep. The least recently used ones are removed first.",
+    )
     return parser
 
 
@@ -172,6 +197,8 @@ def main():
             exit_on_submit=args.exit_on_submit,
             allow_ref=args.allow_ref,
         )
+    elif args.command == "gc":
+        gc(filename=args.filename, max_age=args.max_age, max_size=args.max_size)
     elif args.command is None:
         pass
     else:
@@ -0,0 +1,42 @@
+"""Remove the unreferenced files in the file store of a machine."""
+
+import json
+from typing import Optional
+
+from dpdispatcher.contexts.ssh_context import SSHContext
+from dpdispatcher.machine import Machine
+
+
+def gc(
+    *,
+    filename: str,
+    max_age: float = 7,
+    max_size: Optional[int] = None,
+):
+    """Remove the unreferenced files in the file store of a machine.
+
+    Parameters
+    ----------
+    filename : str
+        JSON file containing the machine configuration.
+    max_age : float, default=7
+        Remove the unreferenced files not used for these days.
+    max_size : int, optional
+        The maximum total size in MiB of the unreferenced files to keep.
+
+    Raises
+    ------
+    ValueError
+        The machine does not use SSHContext with `file_store`.
+    """
+    with open(filename, encoding="utf-8") as f:
+        machine_dict = json.load(f)
+    machine = Machine.load_from_dict(machine_dict)
+    context = machine.context
+    if not isinstance(context, SSHContext) or not context.ssh_session.file_store:
+        raise ValueError("The machine does not use SSHContext with file_store.")
+    context.gc_file_store(
+        max_age=max_age * 86400,
+        max_size=max_size * 1024**2 if max_size is not None else None,
+    )
+    context.close()
@@ -1,14 +1,18 @@
 import json
 import pathlib
 import shlex
+import threading
+import uuid
 from abc import ABCMeta, abstractmethod
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import yaml
 from dargs import Argument, Variant
 
 from dpdispatcher.base_context import BaseContext
 from dpdispatcher.dlog import dlog
+from dpdispatcher.utils.job_status import JobStatus
+from dpdispatcher.utils.poller import status_poller
 
 script_template = """\
 {script_header}
@@ -40,6 +44,136 @@ if [ ! -f {task_tag_finished} ] ;then
 fi &
 """
 
+script_steal_start_template = """
+cd $REMOTE_ROOT
+DPDISPATCHER_JOB_HASH={job_hash}
+DPDISPATCHER_TASK_CLAIMS=$REMOTE_ROOT/{task_claims_dir}
+source $REMOTE_ROOT/{task_queue_file}
+test $? -ne 0 && exit 1
+mkdir -p $DPDISPATCHER_TASK_CLAIMS
+test $? -ne 0 && exit 1
+for claim in $DPDISPATCHER_TASK_CLAIMS/*; do
+  # the claims of the previous run of this job are stale
+  if grep -qsx {job_hash} $claim/owner; then rm -rf $claim; fi
+done
+# the heartbeat tells the other jobs that the claims of this job are alive
+touch $REMOTE_ROOT/{job_alive}
+( while kill -0 $$ 2>/dev/null; do sleep {heartbeat_interval}; touch $REMOTE_ROOT/{job_alive}; done ) >/dev/null 2>&1 &
+disown $!
+DPDISPATCHER_TASK_IN_PARA=0
+DPDISPATCHER_GPU_IN_USE=0
+dpdispatcher_launch() {{
+  # run the command in the background, with para_deg commands in parallel
+  ( {command_env}"$@" ) &
+{wait_part}}}
+dpdispatcher_run_task() {{
+  # $1: the job owning the task; $2: the task hash; $3: the task work path; $4: the error log
+  cd "$REMOTE_ROOT/$3" || exit 1
+  if dpdispatcher_task_$2; then
+    touch $2_task_tag_finished
+  else
+    if [ "$1" = "$DPDISPATCHER_JOB_HASH" ]; then
+      echo 1 > $REMOTE_ROOT/{flag_if_job_task_fail}
+      tail -v -c 1000 "$REMOTE_ROOT/$3/$4" > $REMOTE_ROOT/{last_err_file}
+    fi
+    # release the task, so that its own job does not wait for it forever
+    rm -rf $DPDISPATCHER_TASK_CLAIMS/$2
+  fi
+}}
+dpdispatcher_try_run_task() {{
+  # run the task if it is unfinished and claimed; only steal from the started jobs
+  if [ "$1" != "$DPDISPATCHER_JOB_HASH" ] && [ ! -f $REMOTE_ROOT/$1_job_started ]; then return 1; fi
+  [ -f "$REMOTE_ROOT/$3/$2_task_tag_finished" ] && return 1
+  mkdir $DPDISPATCHER_TASK_CLAIMS/$2 2>/dev/null || return 1
+  echo $DPDISPATCHER_JOB_HASH > $DPDISPATCHER_TASK_CLAIMS/$2/owner
+  dpdispatcher_launch dpdispatcher_run_task "$@"
+}}
+dpdispatcher_claim_expired() {{
+  # a claim expires once the heartbeat of the job holding it stops
+  local owner
+  owner=$(cat $DPDISPATCHER_TASK_CLAIMS/$1/owner 2>/dev/null)
+  if [ -n "$owner" ]; then
+    [ -n "$(find $REMOTE_ROOT/${{owner}}_job_alive -mmin +{claim_timeout} 2>/dev/null)" ]
+  else
+    [ -n "$(find $DPDISPATCHER_TASK_CLAIMS/$1 -maxdepth 0 -mmin +{claim_timeout} 2>/dev/null)" ]
+  fi
+}}
+dpdispatcher_wait_task() {{
+  # wait for the own task run by another job; run it again if released or expired
+  while [ ! -f "$REMOTE_ROOT/$3/$2_task_tag_finished" ]; do
+    if [ "$(cat $REMOTE_ROOT/{flag_if_job_task_fail})" != 0 ]; then return 1; fi
+    dpdispatcher_try_run_task "$@" && return 0
+    # the task run by this job is waited at the end of the script
+    grep -qsx $DPDISPATCHER_JOB_HASH $DPDISPATCHER_TASK_CLAIMS/$2/owner && return 0
+    if dpdispatcher_claim_expired $2; then
+      rm -rf $DPDISPATCHER_TASK_CLAIMS/$2
+    else
+      sleep 10
+    fi
+  done
+}}
+touch $REMOTE_ROOT/{job_started}
+"""
+
+# runs the tasks in groups of para_deg, see Machine.gen_script_wait
+script_steal_wait_template = """  DPDISPATCHER_TASK_IN_PARA=$((DPDISPATCHER_TASK_IN_PARA + 1))
+  if [ $DPDISPATCHER_TASK_IN_PARA -ge {para_deg} ]; then
+    DPDISPATCHER_TASK_IN_PARA=0
+{wait}  fi
+"""
+
+script_steal_gpu_wait_template = """    DPDISPATCHER_GPU_IN_USE=$((DPDISPATCHER_GPU_IN_USE + 1))
+    if [ $((DPDISPATCHER_GPU_IN_USE % {gpu_per_node})) -eq 0 ]; then wait; fi
+"""
+
+script_task_queue_task_template = """
+dpdispatcher_task_{task_hash}() {{
+  ( {command} ) {log_err_part}
+}}
+"""
+
+script_task_times_template = """dpdispatcher_start=$(date +%s)
+{command}
+dpdispatcher_ret=$?
+echo "{task_hash} $dpdispatcher_start $(date +%s) $dpdispatcher_ret" >> $REMOTE_ROOT/{task_times_file}
+exit $dpdispatcher_ret"""
+
+script_slot_wait_template = """while [ "$(jobs -pr | wc -l)" -ge {para_deg} ]; do wait -n; done
+"""
+
+script_gpu_pool_template = """
+DPDISPATCHER_GPU_SLOTS=$REMOTE_ROOT/{gpu_slots_dir}
+rm -rf $DPDISPATCHER_GPU_SLOTS && mkdir -p $DPDISPATCHER_GPU_SLOTS
+dpdispatcher_acquire_gpus() {{
+  # claim a slot on each of $1 GPUs; a slot is free if the task owning it has exited
+  local slot gpu owner gpus claims
+  while true; do
+    if mkdir $DPDISPATCHER_GPU_SLOTS/lock 2>/dev/null; then
+      gpus=() claims=()
+      for ((slot = 0; slot < {para_deg}; slot++)); do
+        for ((gpu = 0; gpu < {gpu_per_node} && ${{#gpus[@]}} < $1; gpu++)); do
+          [[ " ${{gpus[*]}} " == *" $gpu "* ]] && continue
+          owner=$(cat $DPDISPATCHER_GPU_SLOTS/$gpu.$slot 2>/dev/null)
+          if [ -z "$owner" ] || ! kill -0 $owner 2>/dev/null; then
+            gpus+=($gpu) claims+=($gpu.$slot)
+          fi
+        done
+      done
+      if [ ${{#gpus[@]}} -ge $1 ]; then
+        for slot in ${{claims[@]}}; do echo $BASHPID > $DPDISPATCHER_GPU_SLOTS/$slot; done
+        rmdir $DPDISPATCHER_GPU_SLOTS/lock
+        export CUDA_VISIBLE_DEVICES=$(IFS=,; echo "${{gpus[*]}}")
+        return 0
+      fi
+      rmdir $DPDISPATCHER_GPU_SLOTS/lock
+      sleep 1
+    else
+      sleep 0.1
+    fi
+  done
+}}
+"""
+
 script_end_template = """
 cd $REMOTE_ROOT
 test $? -ne 0 && exit 1
@@ -52,6 +186,38 @@ if test $FLAG_IF_JOB_TASK_FAIL -eq 0; then touch {job_tag_finished}; else exit 1
 """
 
 
+class ScriptState:
+    """The state of generating the commands of the tasks in a job script.
+
+    The counters were kept by the resources, which are now shared by the jobs.
+
+    Attributes
+    ----------
+    gpu_in_use : int
+        the number of the GPUs that have been assigned to the tasks
+    task_in_para : int
+        the number of the tasks running in parallel since the last wait
+    """
+
+    __slots__ = ("gpu_in_use", "task_in_para")
+
+    def __init__(self) -> None:
+        self.gpu_in_use = 0
+        self.task_in_para = 0
+
+
+# the state of generating the script of a job in this thread, used by the
+# machines that do not pass a ScriptState; it is reset by Machine.gen_script
+_thread_script_state = threading.local()
+
+
+def _get_thread_script_state() -> ScriptState:
+    state = getattr(_thread_script_state, "state", None)
+    if state is None:
+        state = _thread_script_state.state = ScriptState()
+    return state
+
+
 class Machine(metaclass=ABCMeta):
     """A machine is used to handle the connection with remote machines.
 
@@ -66,6 +232,13 @@ class Machine(metaclass=ABCMeta):
     # alias: for subclasses_dict key
     # notes: this attribute can be inherited
     alias: Tuple[str, ...] = tuple()
+    # the maximum number of job ids passed to one status query command
+    max_query_job_ids = 1000
+    # the files of task stealing in the remote root, see gen_script_command_stealing
+    task_queue_file = "dpdispatcher_task_queue.sh"
+    task_claims_dir = "dpdispatcher_task_claims"
+    # minutes after the last heartbeat of a job, when its task claims expire
+    claim_timeout = 5
 
     def __new__(cls, *args, **kwargs):
         if cls is Machine:
@@ -201,6 +374,83 @@ class Machine(metaclass=ABCMeta):
             "abstract method check_status should be implemented by derived class"
         )
 
+    def query_job_states(self, job_ids: List[str]) -> Optional[Dict[str, JobStatus]]:
+        """Query the scheduler states of many jobs with as few commands as possible.
+
+        Machines that are able to query the whole queue (or a list of job ids)
+        in a single command should override this method. The returned
+        `JobStatus.finished` only means that the scheduler considers the job as
+        ended; the finish tag is checked afterwards by :meth:`check_status_batch`.
+        Job ids missing in the returned dict are also regarded as ended.
+
+        Parameters
+        ----------
+        job_ids : list[str]
+            the job ids to query
+
+        Returns
+        -------
+        dict[str, JobStatus] or None
+            the scheduler states of the jobs, or None if batch query is not
+            supported by this machine
+        """
+        return None
+
+    def check_status_batch(self, jobs) -> List[JobStatus]:
+        """Check the status of multiple jobs.
+
+        The scheduler is queried once through :meth:`query_job_states`, and
+        the result is shared with the other submissions registered to
+        `status_poller`. If the machine does not support batch query,
+        :meth:`check_status` is called for each job.
+
+        Parameters
+        ----------
+        jobs : list[Job]
+            the jobs to check
+
+        Returns
+        -------
+        list[JobStatus]
+            the status of each job, in the same order as `jobs`
+        """
+        job_ids = [str(job.job_id) for job in jobs if job.job_id != ""]
+        if not job_ids:
+            return [JobStatus.unsubmitted for job in jobs]
+        # the job states may be shared with other submissions in this process
+        scheduler_states = status_poller.query_job_states(self, job_ids)
+        if scheduler_states is None:
+            return [self.check_status(job) for job in jobs]
+        job_states = []
+        for job in jobs:
+            if job.job_id == "":
+                job_state = JobStatus.unsubmitted
+            else:
+                job_state = scheduler_states.get(str(job.job_id), JobStatus.finished)
+                if job_state == JobStatus.finished:
+                    job_state = self.check_ended_job(job)
+            job_states.append(job_state)
+        return job_states
+
+    def check_ended_job(self, job) -> JobStatus:
+        """Check whether a job that has ended in the scheduler finished successfully.
+
+        Parameters
+        ----------
+        job : Job
+            the job that is no longer running
+
+        Returns
+        -------
+        JobStatus
+            finished if the finish tag of the job exists, otherwise terminated
+        """
+        if self.check_finish_tag(job):
+            dlog.info(f"job: {job.job_hash} {job.job_id} finished")
+            return JobStatus.finished
+        else:
+            return JobStatus.terminated
+
     def default_resources(self, res):
         raise NotImplementedError(
             "abstract method default_resources should be implemented by derived class"
@@ -223,10 +473,94 @@ class Machine(metaclass=ABCMeta):
             "abstract method do_submit should be implemented by derived class"
         )
 
+    def gen_script_submit_command(self, job) -> Optional[str]:
+        """Generate the shell command that submits the job script in the remote root.
+
+        The command should print the job id only. It is used by
+        :meth:`do_submit_bulk` to submit many jobs in one remote call.
+
+        Parameters
+        ----------
+        job : Job
+            the job to submit
+
+        Returns
+        -------
+        str or None
+            the command, or None if bulk submission is not supported by this machine
+        """
+        return None
+
+    def do_submit_bulk(self, jobs) -> Dict[str, str]:
+        """Submit multiple jobs in one remote call.
+
+        The scripts of all the jobs are written by one bundle script, which
+        then submits the jobs one by one with :meth:`gen_script_submit_command`
+        and prints their job ids. The submissions are paced by
+        `resources.strategy['submit_rate_limit']` and `resources.wait_time`.
+        The jobs failing to be submitted are not included in the result.
+
+        Parameters
+        ----------
+        jobs : list[Job]
+            the jobs to submit
+
+        Returns
+        -------
+        dict[str, str]
+            the job ids of the submitted jobs, keyed by the job hash
+        """
+        submit_commands = [self.gen_script_submit_command(job) for job in jobs]
+        if not jobs or None in submit_commands:
+            return {}
+        delimiter = f"DPDISPATCHER_EOF_{uuid.uuid4().hex}"
+        bundle_lines = ["set -o pipefail"]
+        for job, submit_command in zip(jobs, submit_commands):
+            for file_name, file_content in (
+                (job.script_file_name, self.gen_script(job)),
+                (f"{job.script_file_name}.run", self.gen_script_command(job)),
+            ):
+                if not file_content.endswith("\n"):
+                    file_content += "\n"
+                bundle_lines.append(f"cat > {shlex.quote(file_name)} <<'{delimiter}'")
+                bundle_lines.append(file_content + delimiter)
+            job_id_name = job.job_hash + "_job_id"
+            bundle_lines.append(
+                f'if job_id=$({submit_command}) && test -n "$job_id"; then\n'
+                f'  echo "$job_id" > {shlex.quote(job_id_name)}\n'
+                f'  echo "{job.job_hash} $job_id"\n'
+                "fi"
+            )
+            submit_rate_limit = job.resources.strategy.get("submit_rate_limit")
+            sleep_time = max(
+                job.resources.wait_time,
+                1.0 / submit_rate_limit if submit_rate_limit else 0,
+            )
+            if sleep_time != 0:
+                bundle_lines.append(f"sleep {sleep_time}")
+        bundle_file_name = f"dpdispatcher_bulk_submit_{uuid.uuid4().hex}.sh"
+        self.context.write_file(bundle_file_name, "\n".join(bundle_lines) + "\n")
+        command = (
+            f"bash {bundle_file_name}; ret=$?; rm -f {bundle_file_name}; exit $ret"
+        )
+        ret, stdin, stdout, stderr = self.context.block_call(command)
+        if ret != 0:
+            dlog.warning(
+                f"bulk submission fails with return code {ret}; "
+                f"error message: {stderr.read().decode('utf-8')}"
+            )
+        job_ids = {}
+        for line in stdout.read().decode("utf-8").splitlines():
+            if len(line.split()) == 2:
+                job_hash, job_id = line.split()
+                job_ids[job_hash] = job_id
+        return job_ids
+
     def gen_script_run_command(self, job):
         return f"source $REMOTE_ROOT/{job.script_file_name}.run"
 
     def gen_script(self, job):
+        _thread_script_state.state = ScriptState()
         script_header = self.gen_script_header(job)
         script_custom_flags = self.gen_script_custom_flags_lines(job)
         script_env = self.gen_script_env(job)
@@ -319,15 +653,53 @@ class Machine(metaclass=ABCMeta):
             export_envs_part=export_envs_part,
             prepend_script_part=prepend_script_part,
         )
+        if self.if_gpu_slot_pool(job.resources):
+            script_env += script_gpu_pool_template.format(
+                gpu_slots_dir=job.job_hash + "_gpu_slots",
+                para_deg=job.resources.para_deg,
+                gpu_per_node=job.resources.gpu_per_node,
+            )
         return script_env
 
+    def gen_task_command(self, job, task) -> str:
+        """Generate the command of a task in the job script.
+
+        With `resources.strategy['record_history']`, the start time, the end
+        time and the exit status of the task are appended to the task times
+        file of the job, see `Job.get_task_times`.
+
+        Parameters
+        ----------
+        job : Job
+            the job running the task
+        task : Task
+            the task
+
+        Returns
+        -------
+        str
+            the command, which runs in a subshell
+        """
+        if not job.resources.strategy.get("record_history", False):
+            return task.command
+        return script_task_times_template.format(
+            command=task.command,
+            task_hash=task.task_hash,
+            task_times_file=job.job_hash + "_task_times",
+        )
+
     def gen_script_command(self, job):
+        if job.resources.strategy.get("task_stealing", False):
+            return self.gen_script_command_stealing(job)
         script_command = ""
         resources = job.resources
+        state = ScriptState()
         # in_para_task_num = 0
         for task in job.job_task_list:
             command_env = ""
-            command_env += self.gen_command_env_cuda_devices(resources=resources)
+            command_env += self.gen_command_env_cuda_devices(
+                resources=resources, state=state
+            )
 
             task_tag_finished = task.task_hash + "_task_tag_finished"
 
@@ -345,7 +717,7 @@ class Machine(metaclass=ABCMeta):
                 task_work_path=shlex.quote(
                     pathlib.PurePath(task.task_work_path).as_posix()
                 ),
-                command=task.command,
+                command=self.gen_task_command(job, task),
                 task_tag_finished=task_tag_finished,
                 log_err_part=log_err_part,
                 err_file=shlex.quote(task.errlog),
@@ -353,9 +725,134 @@ class Machine(metaclass=ABCMeta):
             )
             script_command += single_script_command
 
-            script_command += self.gen_script_wait(resources=resources)
+            script_command += self.gen_script_wait(resources=resources, state=state)
+        return script_command
+
+    def gen_script_command_stealing(self, job):
+        """Generate the commands that pull the tasks from the queue of the submission.
+
+        Used when `resources.strategy['task_stealing']` is true. The tasks
+        of all the jobs are defined once in the task queue file of the remote
+        root, see `gen_task_queue`, and claimed with atomic `mkdir` in the
+        `dpdispatcher_task_claims` directory. The job runs its own tasks
+        first, and then the tasks of the other jobs that have started, from
+        the tail of their task lists. At last, the job waits for its own tasks
+        run by other jobs, and runs those released after a failure or whose
+        claims have expired, i.e. the job holding the claim has not touched
+        its heartbeat file for `claim_timeout` minutes. The job exits once one
+        of its own tasks fails. The task finish tags remain the source of
+        truth of the task states.
+
+        Parameters
+        ----------
+        job : Job
+            the job
+
+        Returns
+        -------
+        str
+            the commands
+        """
+        resources = job.resources
+        if self.if_gpu_slot_pool(resources) or resources.strategy.get(
+            "task_slot_pool", False
+        ):
+            # the slot pool does not depend on the position of the task
+            command_env = self.gen_command_env_cuda_devices(resources, ScriptState())
+            wait_part = "  " + self.gen_script_wait(resources, ScriptState())
+        else:
+            if resources.strategy["if_cuda_multi_devices"] is True:
+                if resources.gpu_per_node == 0:
+                    raise RuntimeError("resources.gpu_per_node can not be 0")
+                command_env = (
+                    "export CUDA_VISIBLE_DEVICES="
+                    f"$((DPDISPATCHER_GPU_IN_USE % {resources.gpu_per_node}));"
+                )
+                wait = script_steal_gpu_wait_template.format(
+                    gpu_per_node=resources.gpu_per_node
+                )
+            else:
+                command_env = ""
+                wait = "    wait\n"
+            wait_part = script_steal_wait_template.format(
+                para_deg=resources.para_deg, wait=wait
+            )
+        script_command = script_steal_start_template.format(
+            job_hash=job.job_hash,
+            task_claims_dir=self.task_claims_dir,
+            task_queue_file=self.task_queue_file,
+            job_alive=job.job_hash + "_job_alive",
+            heartbeat_interval=60,
+            claim_timeout=self.claim_timeout,
+            command_env=command_env,
+            wait_part=wait_part,
+            flag_if_job_task_fail=job.job_hash + "_flag_if_job_task_fail",
+            last_err_file=shlex.quote(job.job_hash + "_last_err_file"),
+            job_started=job.job_hash + "_job_started",
+        )
+        script_command += "".join(
+            f"dpdispatcher_try_run_task {self._gen_task_args(job, task)}\n"
+            for task in job.job_task_list
+        )
+        script_command += "dpdispatcher_steal_tasks\n"
+        script_command += "".join(
+            f"dpdispatcher_wait_task {self._gen_task_args(job, task)}\n"
+            for task in job.job_task_list
+        )
         return script_command
 
+    def gen_task_queue(self, submission) -> str:
+        """Generate the task queue file shared by the jobs stealing tasks.
+
+        The file defines a function running each task, and the function
+        `dpdispatcher_steal_tasks`, which tries the tasks of each job from
+        the tail of its task list. It is written to the remote root once, so
+        that the job scripts only contain their own tasks.
+
+        Parameters
+        ----------
+        submission : Submission
+            the submission
+
+        Returns
+        -------
+        str
+            the content of the task queue file
+        """
+        task_queue = ""
+        steal_tasks = ""
+        for job in submission.belonging_jobs:
+            for task in job.job_task_list:
+                log_err_part = ""
+                if task.outlog is not None:
+                    log_err_part += f"1>>{shlex.quote(task.outlog)} "
+                if task.errlog is not None:
+                    log_err_part += f"2>>{shlex.quote(task.errlog)} "
+                task_queue += script_task_queue_task_template.format(
+                    task_hash=task.task_hash,
+                    # the task times are recorded by the job owning the task
+                    command=self.gen_task_command(job, task),
+                    log_err_part=log_err_part,
+                )
+            for task in reversed(job.job_task_list):
+                steal_tasks += (
+                    f"  dpdispatcher_try_run_task {self._gen_task_args(job, task)}\n"
+                )
+        task_queue += "\ndpdispatcher_steal_tasks() {\n" + steal_tasks + "  :\n}\n"
+        return task_queue
+
+    @staticmethod
+    def _gen_task_args(job, task) -> str:
+        # the arguments of dpdispatcher_run_task
+        return " ".join(
+            (
+                job.job_hash,
+                task.task_hash,
+                shlex.quote(pathlib.PurePath(task.task_work_path).as_posix()),
+                shlex.quote(task.errlog),
+            )
+        )
+
     def gen_script_end(self, job):
         job_tag_finished = job.job_hash + "_job_tag_finished"
         flag_if_job_task_fail = job.job_hash + "_flag_if_job_task_fail"
@@ -370,35 +867,111 @@ class Machine(metaclass=ABCMeta):
         )
         return script_end
 
-    def gen_script_wait(self, resources):
+    def gen_script_wait(self, resources, state=None):
+        """Generate the command to wait for the tasks running in parallel.
+
+        Parameters
+        ----------
+        resources : Resources
+            the resources of the job
+        state : ScriptState, optional
+            the state of generating the commands of the job, which is updated.
+            If not given, the state of the script generated by `gen_script`
+            in this thread is used.
+
+        Returns
+        -------
+        str
+            the command after the command of a task
+        """
         # if not resources.strategy.get('if_cuda_multi_devices', None):
         #     return "wait \n"
+        if state is None:
+            state = _get_thread_script_state()
         para_deg = resources.para_deg
-        resources.task_in_para += 1
+        if resources.strategy.get("task_slot_pool", False):
+            # keep para_deg tasks running: block until any task exits
+            if self.if_gpu_slot_pool(resources):
+                # para_deg tasks per GPU
+                para_deg = max(
+                    para_deg
+                    * resources.gpu_per_node
+                    // resources.strategy.get("gpu_per_task", 1),
+                    1,
+                )
+            return script_slot_wait_template.format(para_deg=para_deg)
+        state.task_in_para += 1
         # task_need_gpus = task.task_need_gpus
-        if resources.task_in_para >= para_deg:
+        if state.task_in_para >= para_deg:
             # pbs_script_command += pbs_script_wait
-            resources.task_in_para = 0
+            state.task_in_para = 0
             if resources.strategy["if_cuda_multi_devices"] is True:
-                resources.gpu_in_use += 1
-                if resources.gpu_in_use % resources.gpu_per_node == 0:
+                state.gpu_in_use += 1
+                if state.gpu_in_use % resources.gpu_per_node == 0:
                     return "wait \n"
                 else:
                     return ""
             return "wait \n"
         return ""
 
-    def gen_command_env_cuda_devices(self, resources):
+    @staticmethod
+    def if_gpu_slot_pool(resources) -> bool:
+        """Whether the GPUs are allocated to the tasks by a slot pool in the script.
+
+        With both `strategy['if_cuda_multi_devices']` and
+        `strategy['task_slot_pool']`, each GPU has `para_deg` slots. Each task
+        claims a free slot on `strategy['gpu_per_task']` GPUs when it starts,
+        and the slots are freed once the task exits.
+
+        Parameters
+        ----------
+        resources : Resources
+            the resources
+
+        Returns
+        -------
+        bool
+            whether the GPU slot pool is used
+        """
+        return bool(
+            resources.strategy.get("if_cuda_multi_devices", False)
+            and resources.strategy.get("task_slot_pool", False)
+        )
+
+    def gen_command_env_cuda_devices(self, resources, state=None):
+        """Generate the command to set the GPUs visible to a task.
+
+        Parameters
+        ----------
+        resources : Resources
+            the resources of the job
+        state : ScriptState, optional
+            the state of generating the commands of the job.
+            If not given, the state of the script generated by `gen_script`
+            in this thread is used.
+
+        Returns
+        -------
+        str
+            the command before the command of a task
+        """
         # task_need_resources = task.task_need_resources
         # task_need_gpus = task_need_resources.get('task_need_gpus', 1)
         command_env = ""
         # gpu_number = resources.gpu_per_node
-        # resources.gpu_in_use = 0
+        # state.gpu_in_use = 0
+        if state is None:
+            state = _get_thread_script_state()
 
         if resources.strategy["if_cuda_multi_devices"] is True:
             if resources.gpu_per_node == 0:
                 raise RuntimeError("resources.gpu_per_node can not be 0")
-            gpu_index = resources.gpu_in_use % resources.gpu_per_node
+            if self.if_gpu_slot_pool(resources):
+                # the free GPUs are claimed when the task starts, see script_gpu_pool_template
+                return "dpdispatcher_acquire_gpus {};".format(
+                    resources.strategy.get("gpu_per_task", 1)
+                )
+            gpu_index = state.gpu_in_use % resources.gpu_per_node
             command_env += f"export CUDA_VISIBLE_DEVICES={gpu_index};"
             # for ii in list_CUDA_VISIBLE_DEVICES:
             #     command_env+="{ii},".format(ii=ii)
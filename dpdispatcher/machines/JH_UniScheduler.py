@@ -126,7 +126,7 @@ class JH_UniScheduler(Machine):
 
     def check_finish_tag(self, job):
         job_tag_finished = job.job_hash + "_job_tag_finished"
-        return self.context.check_file_exists(job_tag_finished)
+        return self.context.check_tag_exists(job_tag_finished)
 
     @classmethod
     def resources_subfields(cls) -> List[Argument]:
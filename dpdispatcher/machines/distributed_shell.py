@@ -214,4 +214,4 @@ class DistributedShell(Machine):
 
     def check_finish_tag(self, job):
         job_tag_finished = job.job_hash + "_job_tag_finished"
-        return self.context.check_file_exists(job_tag_finished)
+        return self.context.check_tag_exists(job_tag_finished)
@@ -1,9 +1,8 @@
 import shlex
-from typing import List
+from typing import Dict, List
 
 from dargs import Argument
 
-from dpdispatcher.dlog import dlog
 from dpdispatcher.machine import Machine
 from dpdispatcher.utils.job_status import JobStatus
 from dpdispatcher.utils.utils import (
@@ -22,6 +21,33 @@ lsf_script_header_template = """\
 {lsf_number_gpu_line}"""
 
 
+def lsf_status_word_to_job_status(status_word: str) -> JobStatus:
+    """Convert the job state of LSF to `JobStatus`.
+
+    `JobStatus.finished` means the job has ended in LSF, and whether it has
+    finished successfully should be checked by the finish tag.
+
+    Parameters
+    ----------
+    status_word : str
+        the job state given by bjobs
+
+    Returns
+    -------
+    JobStatus
+        the job status
+    """
+    # ref: https://www.ibm.com/support/knowledgecenter/en/SSETD4_9.1.2/lsf_command_ref/bjobs.1.html
+    if status_word in ["PEND", "WAIT", "PSUSP"]:
+        return JobStatus.waiting
+    elif status_word in ["RUN", "USUSP"]:
+        return JobStatus.running
+    elif status_word in ["DONE", "EXIT"]:
+        return JobStatus.finished
+    else:
+        return JobStatus.unknown
+
+
 class LSF(Machine):
     """LSF batch."""
 
@@ -101,6 +127,13 @@ class LSF(Machine):
         self.context.write_file(job_id_name, job_id)
         return job_id
 
+    def gen_script_submit_command(self, job):
+        # Job <123> is submitted to queue <normal>.
+        return (
+            f"bsub < {shlex.quote(job.script_file_name)}"
+            " | sed -n 's/^Job <\\([0-9]*\\)>.*/\\1/p'"
+        )
+
     # TODO: derive abstract methods
     def sub_script_cmd(self, res):
         pass
@@ -135,23 +168,52 @@ class LSF(Machine):
             status_line = status_out[1]
             status_word = status_line.split()[2]
 
-        # ref: https://www.ibm.com/support/knowledgecenter/en/SSETD4_9.1.2/lsf_command_ref/bjobs.1.html
-        if status_word in ["PEND", "WAIT", "PSUSP"]:
-            return JobStatus.waiting
-        elif status_word in ["RUN", "USUSP"]:
-            return JobStatus.running
-        elif status_word in ["DONE", "EXIT"]:
-            if self.check_finish_tag(job):
-                dlog.info(f"job: {job.job_hash} {job.job_id} finished")
-                return JobStatus.finished
-            else:
-                return JobStatus.terminated
-        else:
-            return JobStatus.unknown
+        job_status = lsf_status_word_to_job_status(status_word)
+        if job_status == JobStatus.finished:
+            return self.check_ended_job(job)
+        return job_status
+
+    @retry()
+    def query_job_states(self, job_ids: List[str]) -> Dict[str, JobStatus]:
+        """Query the states of many jobs with one bjobs command per chunk.
+
+        Parameters
+        ----------
+        job_ids : list[str]
+            the job ids to query
+
+        Returns
+        -------
+        dict[str, JobStatus]
+            the scheduler states of the jobs
+        """
+        job_states = {}
+        for ii in range(0, len(job_ids), self.max_query_job_ids):
+            chunk = job_ids[ii : ii + self.max_query_job_ids]
+            command = 'bjobs -o "jobid stat" -noheader ' + " ".join(
+                shlex.quote(job_id) for job_id in chunk
+            )
+            ret, stdin, stdout, stderr = self.context.block_call(command)
+            out_str = stdout.read().decode("utf-8")
+            err_str = stderr.read().decode("utf-8")
+            # bjobs returns non-zero if any job is not found
+            if ret != 0 and not all(
+                "is not found" in line for line in err_str.splitlines() if line.strip()
+            ):
+                # just retry when any unknown error raised.
+                raise RetrySignal(
+                    f"Get error code {ret} in checking status with command: {command} . message: {err_str}"
+                )
+            for status_line in out_str.splitlines():
+                if "is not found" in status_line or len(status_line.split()) != 2:
+                    continue
+                job_id, status_word = status_line.split()
+                job_states[job_id] = lsf_status_word_to_job_status(status_word)
+        return job_states
 
     def check_finish_tag(self, job):
         job_tag_finished = job.job_hash + "_job_tag_finished"
-        return self.context.check_file_exists(job_tag_finished)
+        return self.context.check_tag_exists(job_tag_finished)
 
     @classmethod
     def resources_subfields(cls) -> List[Argument]:
@@ -1,5 +1,8 @@
+import json
 import shlex
-from typing import List
+import time
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional
 
 from dargs import Argument
 
@@ -16,9 +19,71 @@ pbs_script_header_template = """
 """
 
 
+def pbs_status_word_to_job_status(status_word: str) -> JobStatus:
+    """Convert the job state of PBS or Torque to `JobStatus`.
+
+    `JobStatus.finished` means the job has ended in the scheduler, and whether
+    it has finished successfully should be checked by the finish tag.
+
+    Parameters
+    ----------
+    status_word : str
+        the job state given by qstat
+
+    Returns
+    -------
+    JobStatus
+        the job status
+    """
+    if status_word in ["Q", "H"]:
+        return JobStatus.waiting
+    elif status_word in ["R"]:
+        return JobStatus.running
+    elif status_word in ["C", "E", "K", "F"]:
+        return JobStatus.finished
+    else:
+        return JobStatus.unknown
+
+
+def match_job_states(
+    job_ids: List[str], scheduler_states: Dict[str, JobStatus]
+) -> Dict[str, JobStatus]:
+    """Match the job ids given by qsub with the job ids listed by qstat.
+
+    qstat may list the job id with the full server name, e.g. `123.server.domain`
+    for `123.server`, so the sequence number is compared when the id is not
+    found.
+
+    Parameters
+    ----------
+    job_ids : list[str]
+        the job ids given by qsub
+    scheduler_states : dict[str, JobStatus]
+        the job states keyed by the job ids listed by qstat
+
+    Returns
+    -------
+    dict[str, JobStatus]
+        the job states keyed by the job ids given by qsub
+    """
+    states_by_number = {
+        listed_id.split(".")[0]: job_state
+        for listed_id, job_state in scheduler_states.items()
+    }
+    job_states = {}
+    for job_id in job_ids:
+        if job_id in scheduler_states:
+            job_states[job_id] = scheduler_states[job_id]
+        elif job_id.split(".")[0] in states_by_number:
+            job_states[job_id] = states_by_number[job_id.split(".")[0]]
+    return job_states
+
+
 class PBS(Machine):
     # def __init__(self, **kwargs):
     #     super().__init__(**kwargs)
+    # whether qstat supports the JSON output used by query_job_states
+    support_json_status = True
 
     def gen_script(self, job):
         pbs_script = super().gen_script(job)
@@ -72,6 +137,9 @@ class PBS(Machine):
         self.context.write_file(job_id_name, job_id)
         return job_id
 
+    def gen_script_submit_command(self, job):
+        return f"qsub {shlex.quote(job.script_file_name)} | awk '{{print $1}}'"
+
     def check_status(self, job):
         job_id = job.job_id
         if job_id == "":
@@ -92,22 +160,67 @@ class PBS(Machine):
         status_line = stdout.read().decode("utf-8").split("\n")[-2]
         status_word = status_line.split()[-2]
         # dlog.info (status_word)
-        if status_word in ["Q", "H"]:
-            return JobStatus.waiting
-        elif status_word in ["R"]:
-            return JobStatus.running
-        elif status_word in ["C", "E", "K", "F"]:
-            if self.check_finish_tag(job):
-                dlog.info(f"job: {job.job_hash} {job.job_id} finished")
-                return JobStatus.finished
-            else:
-                return JobStatus.terminated
-        else:
-            return JobStatus.unknown
+        job_status = pbs_status_word_to_job_status(status_word)
+        if job_status == JobStatus.finished:
+            return self.check_ended_job(job)
+        return job_status
+
+    def query_job_states(self, job_ids: List[str]) -> Optional[Dict[str, JobStatus]]:
+        """Query the states of many jobs with one `qstat -x -f -F json` command per chunk.
+
+        None is returned if the JSON output is not supported by qstat.
+
+        Parameters
+        ----------
+        job_ids : list[str]
+            the job ids to query
+
+        Returns
+        -------
+        dict[str, JobStatus] or None
+            the scheduler states of the jobs
+        """
+        if not self.support_json_status:
+            return None
+        scheduler_states = {}
+        for ii in range(0, len(job_ids), self.max_query_job_ids):
+            chunk = job_ids[ii : ii + self.max_query_job_ids]
+            command = "qstat -x -f -F json " + " ".join(
+                shlex.quote(job_id) for job_id in chunk
+            )
+            ret, stdin, stdout, stderr = self.context.block_call(command)
+            out_str = stdout.read().decode("utf-8")
+            err_str = stderr.read().decode("utf-8")
+            if ret != 0 and not out_str.strip():
+                if all(
+                    "qstat: Unknown Job Id" in line or "Job has finished" in line
+                    for line in err_str.splitlines()
+                    if line.strip()
+                ):
+                    # none of the jobs is known by the server
+                    continue
+                elif "option" not in err_str and "usage" not in err_str.lower():
+                    raise RuntimeError(
+                        f"status command {command} fails to execute. erro info: {err_str} return code {ret}"
+                    )
+            try:
+                status_json = json.loads(out_str)
+            except json.JSONDecodeError:
+                dlog.info(
+                    f"status command {command} does not give JSON output, "
+                    f"query the status of jobs one by one. erro info: {err_str}"
+                )
+                self.support_json_status = False
+                return None
+            for listed_id, job_info in status_json.get("Jobs", {}).items():
+                scheduler_states[listed_id] = pbs_status_word_to_job_status(
+                    job_info.get("job_state", "")
+                )
+        return match_job_states(job_ids, scheduler_states)
 
     def check_finish_tag(self, job):
         job_tag_finished = job.job_hash + "_job_tag_finished"
-        return self.context.check_file_exists(job_tag_finished)
+        return self.context.check_tag_exists(job_tag_finished)
 
     def kill(self, job):
         """Kill the job.
@@ -142,18 +255,47 @@ class Torque(PBS):
         status_line = stdout.read().decode("utf-8").split("\n")[-2]
         status_word = status_line.split()[-2]
         # dlog.info (status_word)
-        if status_word in ["Q", "H"]:
-            return JobStatus.waiting
-        elif status_word in ["R"]:
-            return JobStatus.running
-        elif status_word in ["C", "E", "K", "F"]:
-            if self.check_finish_tag(job):
-                dlog.info(f"job: {job.job_hash} {job.job_id} finished")
-                return JobStatus.finished
-            else:
-                return JobStatus.terminated
-        else:
-            return JobStatus.unknown
+        job_status = pbs_status_word_to_job_status(status_word)
+        if job_status == JobStatus.finished:
+            return self.check_ended_job(job)
+        return job_status
+
+    def query_job_states(self, job_ids: List[str]) -> Dict[str, JobStatus]:
+        """Query the states of many jobs with one `qstat -x` (XML output) command per chunk.
+
+        Parameters
+        ----------
+        job_ids : list[str]
+            the job ids to query
+
+        Returns
+        -------
+        dict[str, JobStatus]
+            the scheduler states of the jobs
+        """
+        scheduler_states = {}
+        for ii in range(0, len(job_ids), self.max_query_job_ids):
+            chunk = job_ids[ii : ii + self.max_query_job_ids]
+            command = "qstat -x " + " ".join(shlex.quote(job_id) for job_id in chunk)
+            ret, stdin, stdout, stderr = self.context.block_call(command)
+            out_str = stdout.read().decode("utf-8")
+            err_str = stderr.read().decode("utf-8")
+            if ret != 0 and not all(
+                "qstat: Unknown Job Id" in line or "Job has finished" in line
+                for line in err_str.splitlines()
+                if line.strip()
+            ):
+                raise RuntimeError(
+                    f"status command {command} fails to execute. erro info: {err_str} return code {ret}"
+                )
+            if not out_str.strip():
+                continue
+            for job_element in ET.fromstring(out_str).iter("Job"):
+                listed_id = job_element.findtext("Job_Id", default="")
+                scheduler_states[listed_id] = pbs_status_word_to_job_status(
+                    job_element.findtext("job_state", default="")
+                )
+        return match_job_states(job_ids, scheduler_states)
 
     def gen_script_header(self, job):
         # ref: https://support.adaptivecomputing.com/wp-content/uploads/2021/02/torque/torque.htm#topics/torque/2-jobs/requestingRes.htm
@@ -239,12 +381,33 @@ class SGE(PBS):
         self.context.write_file(job_id_name, job_id)
         return job_id
 
+    def gen_script_submit_command(self, job):
+        # Your job 123 ("name") has been submitted
+        return f"qsub {shlex.quote(job.script_file_name)} | awk '{{print $3}}'"
+
     def check_status(self, job):
-        ### https://softpanorama.org/HPC/Grid_engine/Queues/queue_states.shtml
         job_id = job.job_id
-        status_line = None
         if job_id == "":
             return JobStatus.unsubmitted
+        job_state = self.query_job_states([job_id]).get(job_id, JobStatus.finished)
+        if job_state == JobStatus.finished:
+            return self.check_ended_job(job)
+        return job_state
+
+    def query_job_states(self, job_ids: List[str]) -> Dict[str, JobStatus]:
+        """Query the states of all the jobs with one `qstat` command.
+
+        Parameters
+        ----------
+        job_ids : list[str]
+            the job ids to query
+
+        Returns
+        -------
+        dict[str, JobStatus]
+            the scheduler states of the jobs
+        """
+        ### https://softpanorama.org/HPC/Grid_engine/Queues/queue_states.shtml
         command = "qstat"
         ret, stdin, stdout, stderr = self.context.block_call(command)
         err_str = stderr.read().decode("utf-8")
@@ -252,40 +415,44 @@ class SGE(PBS):
             raise RuntimeError(
                 f"status command {command} fails to execute. erro info: {err_str} return code {ret}"
             )
-        status_text_list = stdout.read().decode("utf-8").split("\n")
-        for txt in status_text_list:
-            if job_id in txt:
-                status_line = txt
-
-        if status_line is None:
-            count = 0
-            while count <= 6:
-                if self.check_finish_tag(job=job):
-                    return JobStatus.finished
-                dlog.info(
-                    f"not tag_finished detected, execute sync command and wait. count {count}"
-                )
-                self.context.block_call("sync")
-                import time
-
-                time.sleep(10)
-                count += 1
-            return JobStatus.terminated
-        else:
-            status_word = status_line.split()[4]
+        status_words = {}
+        for status_line in stdout.read().decode("utf-8").split("\n"):
+            # skip the header lines
+            if len(status_line.split()) > 4:
+                status_words[status_line.split()[0]] = status_line.split()[4]
+        job_states = {}
+        for job_id in job_ids:
+            if job_id not in status_words:
+                continue
+            status_word = status_words[job_id]
             # dlog.info (status_word)
             if status_word in ["qw", "hqw", "t"]:
-                return JobStatus.waiting
+                job_states[job_id] = JobStatus.waiting
             elif status_word in ["r", "Rr"]:
-                return JobStatus.running
+                job_states[job_id] = JobStatus.running
             elif status_word in ["Eqw", "dr", "dt"]:
-                return JobStatus.terminated
+                job_states[job_id] = JobStatus.terminated
             else:
-                return JobStatus.unknown
+                job_states[job_id] = JobStatus.unknown
+        return job_states
+
+    def check_ended_job(self, job) -> JobStatus:
+        # the finish tag may not be synchronized yet when the job leaves the queue
+        count = 0
+        while count <= 6:
+            if self.check_finish_tag(job=job):
+                return JobStatus.finished
+            dlog.info(
+                f"not tag_finished detected, execute sync command and wait. count {count}"
+            )
+            self.context.block_call("sync")
+            time.sleep(10)
+            count += 1
+        return JobStatus.terminated
 
     def check_finish_tag(self, job):
         job_tag_finished = job.job_hash + "_job_tag_finished"
-        return self.context.check_file_exists(job_tag_finished)
+        return self.context.check_tag_exists(job_tag_finished)
 
     @classmethod
     def resources_subfields(cls) -> List[Argument]:
@@ -80,7 +80,8 @@ class Shell(Machine):
             )
 
         if_job_exists = bool(stdout.read().decode("utf-8").strip())
-        if self.check_finish_tag(job=job):
+        # a living process is regarded as running unless its tag has been listed
+        if self.check_finish_tag(job=job, verify=not if_job_exists):
             dlog.info(f"job: {job.job_hash} {job.job_id} finished")
             return JobStatus.finished
 
@@ -101,10 +102,10 @@ class Shell(Machine):
     #             return True
     #     return False
 
-    def check_finish_tag(self, job):
+    def check_finish_tag(self, job, verify=True):
         job_tag_finished = job.job_hash + "_job_tag_finished"
         # print('job finished: ',job.job_id, job_tag_finished)
-        return self.context.check_file_exists(job_tag_finished)
+        return self.context.check_tag_exists(job_tag_finished, verify=verify)
 
     def kill(self, job):
         """Kill the job.
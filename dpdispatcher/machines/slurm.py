@@ -1,12 +1,13 @@
 import math
 import pathlib
+import re
 import shlex
-from typing import List
+from typing import Dict, List
 
 from dargs import Argument
 
 from dpdispatcher.dlog import dlog
-from dpdispatcher.machine import Machine, script_command_template
+from dpdispatcher.machine import Machine, ScriptState, script_command_template
 from dpdispatcher.utils.job_status import JobStatus
 from dpdispatcher.utils.utils import (
     RetrySignal,
@@ -29,6 +30,102 @@ wait
 {append_script_part}
 """
 
+# short status codes reported by squeue and long state names reported by sacct
+slurm_waiting_status = [
+    "PD",
+    "CF",
+    "S",
+    "PENDING",
+    "CONFIGURING",
+    "SUSPENDED",
+    "REQUEUED",
+    "REQUEUE_FED",
+    "REQUEUE_HOLD",
+    "RESIZING",
+]
+slurm_running_status = ["R", "RUNNING"]
+slurm_completing_status = ["CG", "COMPLETING"]
+slurm_finished_status = [
+    "C",
+    "E",
+    "K",
+    "BF",
+    "CA",
+    "CD",
+    "F",
+    "NF",
+    "PR",
+    "SE",
+    "ST",
+    "TO",
+    "OOM",
+    "BOOT_FAIL",
+    "CANCELLED",
+    "COMPLETED",
+    "DEADLINE",
+    "FAILED",
+    "NODE_FAIL",
+    "OUT_OF_MEMORY",
+    "PREEMPTED",
+    "REVOKED",
+    "SPECIAL_EXIT",
+    "STOPPED",
+    "TIMEOUT",
+]
+
+
+def slurm_status_word_to_job_status(status_word: str) -> JobStatus:
+    """Convert the job state of Slurm to `JobStatus`.
+
+    `JobStatus.finished` means the job has ended in Slurm, and whether it
+    has finished successfully should be checked by the finish tag.
+
+    Parameters
+    ----------
+    status_word : str
+        the short code given by squeue or the state name given by sacct
+
+    Returns
+    -------
+    JobStatus
+        the job status
+    """
+    if status_word in slurm_waiting_status:
+        return JobStatus.waiting
+    elif status_word in slurm_running_status:
+        return JobStatus.running
+    elif status_word in slurm_completing_status:
+        return JobStatus.completing
+    elif status_word in slurm_finished_status:
+        return JobStatus.finished
+    else:
+        return JobStatus.unknown
+
+
+def merge_job_status(status: List[JobStatus]) -> JobStatus:
+    """Merge the status of several Slurm jobs (e.g. elements of a job array) into one.
+
+    Parameters
+    ----------
+    status : list[JobStatus]
+        the status of each Slurm job
+
+    Returns
+    -------
+    JobStatus
+        running if any job is running, otherwise waiting, completing or unknown
+        in order; finished only if all jobs have ended
+    """
+    for job_status in (
+        JobStatus.running,
+        JobStatus.waiting,
+        JobStatus.completing,
+        JobStatus.unknown,
+    ):
+        if job_status in status:
+            return job_status
+    return JobStatus.finished
+
 
 class Slurm(Machine):
     def gen_script(self, job):
@@ -119,6 +216,12 @@ class Slurm(Machine):
         self.context.write_file(job_id_name, job_id)
         return job_id
 
+    def gen_script_submit_command(self, job):
+        # --parsable prints "job_id;cluster_name"
+        return (
+            f"sbatch --parsable {shlex.quote(job.script_file_name)} | cut -d ';' -f 1"
+        )
+
     @retry()
     def check_status(self, job):
         job_id = job.job_id
@@ -155,37 +258,134 @@ class Slurm(Machine):
                 + f"status_line = {status_line}, "
                 + f"parsed status_word = {status_word}"
             )
-        if status_word in ["PD", "CF", "S"]:
-            return JobStatus.waiting
-        elif status_word in ["R"]:
-            return JobStatus.running
-        elif status_word in ["CG"]:
-            return JobStatus.completing
-        elif status_word in [
-            "C",
-            "E",
-            "K",
-            "BF",
-            "CA",
-            "CD",
-            "F",
-            "NF",
-            "PR",
-            "SE",
-            "ST",
-            "TO",
-        ]:
+        job_status = slurm_status_word_to_job_status(status_word)
+        if job_status == JobStatus.finished:
             if self.check_finish_tag(job):
                 dlog.info(f"job: {job.job_hash} {job.job_id} finished")
                 return JobStatus.finished
             else:
                 return JobStatus.terminated
-        else:
-            return JobStatus.unknown
+        return job_status
+
+    @retry()
+    def query_job_states(self, job_ids: List[str]) -> Dict[str, JobStatus]:
+        """Query the states of many jobs with one squeue command per chunk.
+
+        Jobs that have left the queue are looked up in sacct; jobs unknown
+        to both are omitted and regarded as ended.
+
+        Parameters
+        ----------
+        job_ids : list[str]
+            the job ids to query
+
+        Returns
+        -------
+        dict[str, JobStatus]
+            the scheduler states of the jobs
+        """
+        status_words = {}
+        for ii in range(0, len(job_ids), self.max_query_job_ids):
+            chunk = job_ids[ii : ii + self.max_query_job_ids]
+            command = 'squeue -h -o "%.18i %.2t" -j ' + ",".join(chunk)
+            ret, stdin, stdout, stderr = self.context.block_call(command)
+            if ret != 0:
+                err_str = stderr.read().decode("utf-8")
+                if "Invalid job id specified" in err_str:
+                    # none of the jobs is in the queue any more
+                    continue
+                elif (
+                    "Socket timed out on send/recv operation" in err_str
+                    or "Unable to contact slurm controller" in err_str
+                    or "Invalid user for SlurmUser" in err_str
+                ):
+                    # retry 3 times
+                    raise RetrySignal(
+                        f"Get error code {ret} in checking status with command: {command} . message: {err_str}"
+                    )
+                raise RuntimeError(
+                    f"status command {command} fails to execute."
+                    f"\n error message:{err_str}\n return code {ret}\n"
+                )
+            for status_line in stdout.read().decode("utf-8").split("\n"):
+                if not status_line.strip():
+                    continue
+                if not (
+                    len(status_line.split()) == 2 and status_line.split()[-1].isupper()
+                ):
+                    raise RuntimeError(
+                        "Error in getting job status, " + f"status_line = {status_line}"
+                    )
+                slurm_job_id, status_word = status_line.split()
+                status_words.setdefault(self._base_job_id(slurm_job_id), []).append(
+                    status_word
+                )
+        missing_job_ids = [job_id for job_id in job_ids if job_id not in status_words]
+        if missing_job_ids:
+            status_words.update(self._query_job_accounting(missing_job_ids))
+        return {
+            job_id: merge_job_status(
+                [slurm_status_word_to_job_status(ww) for ww in status_words[job_id]]
+            )
+            for job_id in job_ids
+            if job_id in status_words
+        }
+
+    def _query_job_accounting(self, job_ids: List[str]) -> Dict[str, List[str]]:
+        """Look up the states of the jobs that are no longer in the queue by sacct.
+
+        An empty dict is returned if the accounting storage is not available.
+
+        Parameters
+        ----------
+        job_ids : list[str]
+            the job ids to query
+
+        Returns
+        -------
+        dict[str, list[str]]
+            the sacct state names of each job
+        """
+        status_words = {}
+        for ii in range(0, len(job_ids), self.max_query_job_ids):
+            chunk = job_ids[ii : ii + self.max_query_job_ids]
+            command = "sacct -n -X -P -o JobID,State -j " + ",".join(chunk)
+            ret, stdin, stdout, stderr = self.context.block_call(command)
+            if ret != 0:
+                err_str = stderr.read().decode("utf-8")
+                dlog.debug(f"accounting command {command} fails: {err_str}")
+                return {}
+            for status_line in stdout.read().decode("utf-8").split("\n"):
+                if "|" not in status_line:
+                    continue
+                slurm_job_id, state = status_line.split("|")[:2]
+                if not state.strip():
+                    continue
+                # e.g. "CANCELLED by 1000"
+                status_words.setdefault(self._base_job_id(slurm_job_id), []).append(
+                    state.split()[0]
+                )
+        return status_words
+
+    @staticmethod
+    def _base_job_id(slurm_job_id: str) -> str:
+        """Strip the array index or heterogeneous component of a Slurm job id.
+
+        Parameters
+        ----------
+        slurm_job_id : str
+            job id such as `123`, `123_4`, `123_[5-9]` or `123+0`
+
+        Returns
+        -------
+        str
+            the id given by sbatch, e.g. `123`
+        """
+        return re.split(r"[_+.]", slurm_job_id.strip())[0]
 
     def check_finish_tag(self, job):
         job_tag_finished = job.job_hash + "_job_tag_finished"
-        return self.context.check_file_exists(job_tag_finished)
+        return self.context.check_tag_exists(job_tag_finished)
 
     @classmethod
     def resources_subfields(cls) -> List[Argument]:
@@ -244,7 +444,7 @@ class SlurmJobArray(Slurm):
                     pathlib.PurePath(task.task_work_path)
                     / (task.task_hash + "_task_tag_finished")
                 ).as_posix()
-                if not self.context.check_file_exists(task_tag_finished):
+                if not self.context.check_tag_exists(task_tag_finished):
                     job_array.add(ii // slurm_job_size)
             return super().gen_script_header(job) + "\n#SBATCH --array={}".format(
                 ",".join(map(str, job_array))
@@ -255,12 +455,18 @@ class SlurmJobArray(Slurm):
 
     def gen_script_command(self, job):
         resources = job.resources
+        if resources.strategy.get("task_stealing", False):
+            # the array tasks run their own slices of the job
+            raise RuntimeError("task_stealing is not supported by SlurmJobArray")
         slurm_job_size = resources.kwargs.get("slurm_job_size", 1)
         # SLURM_ARRAY_TASK_ID: 0 ~ n_jobs-1
+        state = ScriptState()
         script_command = "case $SLURM_ARRAY_TASK_ID in\n"
         for ii, task in enumerate(job.job_task_list):
             command_env = ""
-            command_env += self.gen_command_env_cuda_devices(resources=resources)
+            command_env += self.gen_command_env_cuda_devices(
+                resources=resources, state=state
+            )
 
             task_tag_finished = task.task_hash + "_task_tag_finished"
 
@@ -278,7 +484,7 @@ class SlurmJobArray(Slurm):
                 task_work_path=shlex.quote(
                     pathlib.PurePath(task.task_work_path).as_posix()
                 ),
-                command=task.command,
+                command=self.gen_task_command(job, task),
                 task_tag_finished=task_tag_finished,
                 log_err_part=log_err_part,
                 err_file=shlex.quote(task.errlog),
@@ -287,7 +493,7 @@ class SlurmJobArray(Slurm):
             if ii % slurm_job_size == 0:
                 script_command += f"{ii // slurm_job_size})\n"
             script_command += single_script_command
-            script_command += self.gen_script_wait(resources=resources)
+            script_command += self.gen_script_wait(resources=resources, state=state)
             script_command += "\n"
             if (
                 ii % slurm_job_size == slurm_job_size - 1
@@ -343,38 +549,11 @@ class SlurmJobArray(Slurm):
                     + f"status_line = {status_line}, "
                     + f"parsed status_word = {status_word}"
                 )
-            if status_word in ["PD", "CF", "S"]:
-                status.append(JobStatus.waiting)
-            elif status_word in ["R"]:
-                status.append(JobStatus.running)
-            elif status_word in ["CG"]:
-                status.append(JobStatus.completing)
-            elif status_word in [
-                "C",
-                "E",
-                "K",
-                "BF",
-                "CA",
-                "CD",
-                "F",
-                "NF",
-                "PR",
-                "SE",
-                "ST",
-                "TO",
-            ]:
-                status.append(JobStatus.finished)
-            else:
-                status.append(JobStatus.unknown)
+            status.append(slurm_status_word_to_job_status(status_word))
         # running if any job is running
-        if JobStatus.running in status:
-            return JobStatus.running
-        elif JobStatus.waiting in status:
-            return JobStatus.waiting
-        elif JobStatus.completing in status:
-            return JobStatus.completing
-        elif JobStatus.unknown in status:
-            return JobStatus.unknown
+        job_status = merge_job_status(status)
+        if job_status != JobStatus.finished:
+            return job_status
         else:
             if self.check_finish_tag(job):
                 dlog.info(f"job: {job.job_hash} {job.job_id} finished")
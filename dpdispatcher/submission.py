@@ -1,23 +1,36 @@
 # %%
 import asyncio
-import copy
 import functools
 import json
 import os
 import pathlib
 import random
+import sys
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import sha1
-from typing import List, Optional
+from typing import Callable, List, Optional, Tuple
 
 import yaml
 from dargs.dargs import Argument, Variant
 
 from dpdispatcher.dlog import dlog
 from dpdispatcher.machine import Machine
+from dpdispatcher.utils.cache import ResultCache
+from dpdispatcher.utils.history import runtime_history
 from dpdispatcher.utils.job_status import JobStatus
+from dpdispatcher.utils.json_stream import (
+    JSONStreamArray,
+    JSONStreamObject,
+    iter_json,
+    join_chunks,
+    load_json_stream,
+)
+from dpdispatcher.utils.pilot import get_pilot
+from dpdispatcher.utils.poller import PollPolicy, status_poller
 from dpdispatcher.utils.record import record
+from dpdispatcher.utils.utils import RateLimiter, intern_list, lpt_partition
 
 # %%
 default_strategy = dict(if_cuda_multi_devices=False, ratio_unfinished=0.0)
@@ -45,6 +58,9 @@ class Submission:
         a list of tasks to be run.
     """
 
+    # the minimum number of the journal records before compaction
+    journal_min_entries = 100
+
     def __init__(
         self,
         work_base,
@@ -72,6 +88,13 @@ class Submission:
         )
 
         self.submission_hash = None
+        # the maximum number of jobs in the queue learned from the rejections of
+        # the scheduler, see handle_unexpected_submission_state
+        self.learned_queue_limit = None
+        # the journal of the job states, see submission_to_json
+        self._journal_seq = 0
+        self._journal_entries = None
+        self._journal_states = {}
         # warning: can not remote .copy() or there will be bugs
         # self.belonging_tasks = task_list
         self.belonging_tasks = task_list.copy()
@@ -85,10 +108,11 @@ class Submission:
     def __eq__(self, other):
         """When check whether the two submission are equal,
         we disregard the runtime infomation(job_state, job_id, fail_count) of the submission.belonging_jobs.
+        The jobs are compared by their cached hashes.
         """
-        return json.dumps(self.serialize(if_static=True)) == json.dumps(
-            other.serialize(if_static=True)
-        )
+        return self._serialize_header() == other._serialize_header() and [
+            job.get_hash() for job in self.belonging_jobs
+        ] == [job.get_hash() for job in other.belonging_jobs]
 
     def __getitem__(self, key):
         return self.serialize()[key]
@@ -109,16 +133,26 @@ class Submission:
         submission : Submission
             the Submission class instance converted from the submission_dict
         """
+        resources = submission_dict["resources"]
+        if not isinstance(resources, Resources):
+            resources = Resources.deserialize(resources_dict=resources)
         submission = cls(
             work_base=submission_dict["work_base"],
-            resources=Resources.deserialize(
-                resources_dict=submission_dict["resources"]
-            ),
+            resources=resources,
             forward_common_files=submission_dict["forward_common_files"],
             backward_common_files=submission_dict["backward_common_files"],
         )
         submission.belonging_jobs = [
-            Job.deserialize(job_dict=job_dict)
+            # the jobs may be deserialized by deserialize_stream
+            job_dict
+            if isinstance(job_dict, Job)
+            else Job.deserialize(
+                job_dict=job_dict,
+                resources=submission.resources
+                if list(job_dict.values())[0]["resources"]
+                == submission_dict["resources"]
+                else None,
+            )
             for job_dict in submission_dict["belonging_jobs"]
         ]
         submission.submission_hash = submission.get_hash()
@@ -129,6 +163,68 @@ class Submission:
             submission.bind_machine(machine)
         return submission
 
+    @classmethod
+    def deserialize_stream(cls, chunks, machine=None):
+        """Load the submission from the chunks of its JSON document.
+
+        Unlike deserialize, the jobs are converted one by one while the
+        document is read, so the dict tree of all the jobs is never held in
+        memory.
+
+        Parameters
+        ----------
+        chunks : Iterable[str]
+            the chunks of the JSON document, e.g. from `context.read_file_stream`
+        machine : Machine
+            Machine class Object to execute the jobs
+
+        Returns
+        -------
+        submission : Submission
+            the Submission class instance
+        """
+        shared = {}
+
+        def load_job(job_dict, submission_dict):
+            if "resources" not in shared:
+                shared["resources"] = Resources.deserialize(
+                    resources_dict=submission_dict["resources"]
+                )
+            return Job.deserialize(
+                job_dict=job_dict,
+                resources=shared["resources"]
+                if list(job_dict.values())[0]["resources"]
+                == submission_dict["resources"]
+                else None,
+            )
+
+        submission_dict = load_json_stream(chunks, {"belonging_jobs": load_job})
+        if "resources" in shared:
+            submission_dict["resources"] = shared["resources"]
+        submission = cls.deserialize(submission_dict=submission_dict, machine=machine)
+        submission._journal_seq = submission_dict.get("journal_seq", 0)
+        return submission
+
+    def serialize_stream(self, if_static=False):
+        """Convert the Submission class instance to an object dumped by `iter_json`,
+        where the jobs are serialized one by one while being dumped.
+
+        Parameters
+        ----------
+        if_static : bool
+            whether dump the job runtime infomation (like job_id, job_state, fail_count) to the dictionary.
+
+        Returns
+        -------
+        JSONStreamObject
+            the same as `serialize` when dumped
+        """
+        submission_dict = JSONStreamObject(self._serialize_header())
+        submission_dict["belonging_jobs"] = JSONStreamArray(
+            job.serialize_stream(if_static=if_static) for job in self.belonging_jobs
+        )
+        return submission_dict
+
     def serialize(self, if_static=False):
         """Convert the Submission class instance to a dictionary.
 
@@ -142,6 +238,14 @@ class Submission:
         submission_dict : dict
             the dictionary converted from the Submission class instance
         """
+        submission_dict = self._serialize_header()
+        submission_dict["belonging_jobs"] = [
+            job.serialize(if_static=if_static) for job in self.belonging_jobs
+        ]
+        return submission_dict
+
+    def _serialize_header(self):
+        """Convert the fields other than the jobs to a dictionary."""
         assert self.resources is not None
         submission_dict = {}
         # if if_none_local_root:
@@ -159,9 +263,6 @@ class Submission:
         submission_dict["resources"] = self.resources.serialize()
         submission_dict["forward_common_files"] = self.forward_common_files
         submission_dict["backward_common_files"] = self.backward_common_files
-        submission_dict["belonging_jobs"] = [
-            job.serialize(if_static=if_static) for job in self.belonging_jobs
-        ]
         return submission_dict
 
     def register_task(self, task):
@@ -179,9 +280,21 @@ class Submission:
         self.belonging_tasks.extend(task_list)
 
     def get_hash(self):
-        return sha1(
-            json.dumps(self.serialize(if_static=True)).encode("utf-8")
-        ).hexdigest()
+        # the same as sha1(json.dumps(self.serialize(if_static=True))),
+        # but the JSON of the jobs is cached by the jobs
+        header_dict = self._serialize_header()
+        header = json.dumps({**header_dict, "belonging_jobs": []})
+        # the resources are usually shared by the jobs
+        resources_json = json.dumps(header_dict["resources"])
+        jobs_str = ", ".join(
+            job.get_static_json(
+                resources_json=resources_json
+                if job.resources is self.resources
+                else None
+            )
+            for job in self.belonging_jobs
+        )
+        return sha1(f"{header[: -len('[]}')]}[{jobs_str}]}}".encode()).hexdigest()
 
     def bind_machine(self, machine):
         """Bind this submission to a machine. update the machine's context remote_root and local_root.
@@ -201,7 +314,15 @@ class Submission:
         return self
 
     def run_submission(
-        self, *, dry_run=False, exit_on_submit=False, clean=True, check_interval=30
+        self,
+        *,
+        dry_run=False,
+        exit_on_submit=False,
+        clean=True,
+        check_interval=30,
+        max_check_interval=None,
+        check_interval_backoff=None,
+        check_interval_jitter=None,
     ):
         """Main method to execute the submission.
         First, check whether old Submission exists on the remote machine, and try to recover from it.
@@ -210,68 +331,185 @@ class Submission:
         Forth, wait until the tasks in the submission finished and download the result file to local directory.
         If dry_run is True, submission will be uploaded but not be executed and exit.
         If exit_on_submit is True, submission will exit.
+        The interval between two checks starts from check_interval, and grows by check_interval_backoff
+        times (up to max_check_interval) while all the jobs are waiting in the queue, see `PollPolicy`.
+        If not given, these options are taken from `resources.strategy`.
+        """
+        return self._run_steps(
+            self._run_submission_steps(
+                dry_run=dry_run,
+                exit_on_submit=exit_on_submit,
+                clean=clean,
+                check_interval=check_interval,
+                max_check_interval=max_check_interval,
+                check_interval_backoff=check_interval_backoff,
+                check_interval_jitter=check_interval_jitter,
+            )
+        )
+
+    def _run_submission_steps(
+        self,
+        *,
+        dry_run,
+        exit_on_submit,
+        clean,
+        check_interval,
+        max_check_interval,
+        check_interval_backoff,
+        check_interval_jitter,
+    ):
+        """Generate the steps of `run_submission`, shared by its async interface.
+
+        See `_run_steps` for the steps yielded.
         """
         assert self.resources is not None
         if not self.belonging_jobs:
-            self.generate_jobs()
-        self.try_recover_from_json()
-        self.update_submission_state()
-        if self.check_all_finished():
-            dlog.info("check_all_finished: True")
-        else:
-            dlog.info("check_all_finished: False")
-            self.upload_jobs()
-            if dry_run is True:
-                dlog.info(f"submission succeeded: {self.submission_hash}")
-                dlog.info(f"at {self.machine.context.remote_root}")
-                return self.serialize()
-            self.handle_unexpected_submission_state()
-            self.submission_to_json()
-            time.sleep(1)
-            self.update_submission_state()
-            self.check_all_finished()
-            self.handle_unexpected_submission_state()
-
-        ratio_unfinished = self.resources.strategy["ratio_unfinished"]
-        while not self.check_all_finished():
-            if exit_on_submit is True:
-                dlog.info(f"submission succeeded: {self.submission_hash}")
-                dlog.info(f"at {self.machine.context.remote_root}")
+            yield self.restore_cached_results
+            if self.check_all_tasks_cached():
                 return self.serialize()
-            if ratio_unfinished > 0.0 and self.check_ratio_unfinished(ratio_unfinished):
-                self.remove_unfinished_tasks()
-                break
+            self.generate_jobs()
+        poll_policy = self.get_poll_policy(
+            check_interval,
+            max_check_interval=max_check_interval,
+            check_interval_backoff=check_interval_backoff,
+            check_interval_jitter=check_interval_jitter,
+        )
+        # share the scheduler queries with other submissions in this process
+        if get_pilot(self.machine, self.resources) is None:
+            status_poller.register(self, check_interval)
+        try:
+            yield self.try_recover_from_json
+            yield self.update_submission_state
+            if self.check_all_finished():
+                dlog.info("check_all_finished: True")
+            else:
+                dlog.info("check_all_finished: False")
+                yield self.upload_jobs
+                if dry_run is True:
+                    dlog.info(f"submission succeeded: {self.submission_hash}")
+                    dlog.info(f"at {self.machine.context.remote_root}")
+                    return self.serialize()
+                yield self.handle_unexpected_submission_state
+                yield self.submission_to_json
+                yield 1
+                yield self.update_submission_state
+                self.check_all_finished()
+                yield self.handle_unexpected_submission_state
+
+            ratio_unfinished = self.resources.strategy["ratio_unfinished"]
+            while not self.check_all_finished():
+                if exit_on_submit is True:
+                    dlog.info(f"submission succeeded: {self.submission_hash}")
+                    dlog.info(f"at {self.machine.context.remote_root}")
+                    return self.serialize()
+                if ratio_unfinished > 0.0 and (
+                    yield functools.partial(
+                        self.check_ratio_unfinished, ratio_unfinished
+                    )
+                ):
+                    yield self.remove_unfinished_tasks
+                    break
+
+                try:
+                    yield poll_policy.next_interval()
+                except (
+                    Exception,
+                    KeyboardInterrupt,
+                    SystemExit,
+                    asyncio.CancelledError,
+                ) as e:
+                    yield self.submission_to_json
+                    record_path = yield functools.partial(record.write, self)
+                    dlog.exception(e)
+                    dlog.info(f"submission exit: {self.submission_hash}")
+                    dlog.info(f"at {self.machine.context.remote_root}")
+                    dlog.info(f"Submission information is saved in {str(record_path)}.")
+                    dlog.debug(self.serialize())
+                    raise e
+                else:
+                    yield self.update_submission_state
+                    poll_policy.update(
+                        [(job.job_hash, job.job_state) for job in self.belonging_jobs]
+                    )
+                    yield self.handle_unexpected_submission_state
+            yield self.handle_unexpected_submission_state
+            yield from self._try_download_result_steps()
+            yield self.store_results_to_cache
+            yield self.submission_to_json
+            if clean:
+                yield self.clean_jobs
+            return self.serialize()
+        finally:
+            status_poller.unregister(self)
+
+    @staticmethod
+    def _run_steps(steps):
+        """Run the steps generated by `_run_submission_steps` or `_try_download_result_steps`.
 
+        Each step is either a blocking callable, whose result is sent back, or
+        the seconds to sleep. The exceptions are thrown back into the steps.
+
+        Parameters
+        ----------
+        steps : Generator
+            the steps
+
+        Returns
+        -------
+        Any
+            the value returned by the steps
+        """
+        result = None
+        error = None
+        while True:
+            try:
+                step = steps.send(result) if error is None else steps.throw(error)
+            except StopIteration as e:
+                return e.value
+            result = None
+            error = None
             try:
-                time.sleep(check_interval)
+                if callable(step):
+                    result = step()
+                else:
+                    time.sleep(step)
             except (Exception, KeyboardInterrupt, SystemExit) as e:
-                self.submission_to_json()
-                record_path = record.write(self)
-                dlog.exception(e)
-                dlog.info(f"submission exit: {self.submission_hash}")
-                dlog.info(f"at {self.machine.context.remote_root}")
-                dlog.info(f"Submission information is saved in {str(record_path)}.")
-                dlog.debug(self.serialize())
-                raise e
-            else:
-                self.update_submission_state()
-                self.handle_unexpected_submission_state()
-            finally:
-                pass
-        self.handle_unexpected_submission_state()
-        self.try_download_result()
-        self.submission_to_json()
-        if clean:
-            self.clean_jobs()
-        return self.serialize()
+                error = e
+
+    async def _async_run_steps(self, steps):
+        """Async interface of `_run_steps`.
+
+        The callables are run in the default executor of the running event
+        loop, and the loop waits with `asyncio.sleep`.
+        """
+        result = None
+        error = None
+        while True:
+            try:
+                step = steps.send(result) if error is None else steps.throw(error)
+            except StopIteration as e:
+                return e.value
+            result = None
+            error = None
+            try:
+                if callable(step):
+                    result = await self._async_call(step)
+                else:
+                    await asyncio.sleep(step)
+            except (Exception, KeyboardInterrupt, asyncio.CancelledError) as e:
+                error = e
 
     def try_download_result(self):
+        self._run_steps(self._try_download_result_steps())
+
+    def _try_download_result_steps(self):
+        """Generate the steps of `try_download_result`, see `_run_steps`."""
         start_time = time.time()
         retry_interval = 60  # retry every 1 minute
         success = False
         while not success:
             try:
-                self.download_jobs()
+                yield self.download_jobs
                 success = True
             except FileNotFoundError as e:
                 # retry will never success if the file is not found
@@ -281,18 +519,80 @@ class Submission:
                 elapsed_time = time.time() - start_time
                 if elapsed_time < 3600:  # in 1 h
                     dlog.info("Retrying in 1 minute...")
-                    time.sleep(retry_interval)
+                    yield retry_interval
                 elif elapsed_time < 86400:  # 1 h ~ 24 h
                     retry_interval = 600  # retry every 10 min
                     dlog.info("Retrying in 10 minutes...")
-                    time.sleep(retry_interval)
+                    yield retry_interval
                 else:  # > 24 h
                     dlog.info("Maximum retries time reached. Exiting.")
                     break
 
-    async def async_run_submission(self, **kwargs):
+    def get_poll_policy(
+        self,
+        check_interval,
+        max_check_interval=None,
+        check_interval_backoff=None,
+        check_interval_jitter=None,
+    ) -> PollPolicy:
+        """Get the policy of the interval between two checks of the job states.
+
+        The options not given are taken from `resources.strategy`.
+
+        Parameters
+        ----------
+        check_interval : float
+            the minimal interval in seconds
+        max_check_interval : float, optional
+            the maximal interval in seconds
+        check_interval_backoff : float, optional
+            the factor to increase the interval while all the jobs are waiting
+        check_interval_jitter : float, optional
+            the relative range of the random jitter
+
+        Returns
+        -------
+        PollPolicy
+            the poll policy
+        """
+        assert self.resources is not None
+        if max_check_interval is None:
+            max_check_interval = self.resources.strategy.get("max_check_interval")
+        if check_interval_backoff is None:
+            check_interval_backoff = self.resources.strategy.get(
+                "check_interval_backoff", 1.0
+            )
+        if check_interval_jitter is None:
+            check_interval_jitter = self.resources.strategy.get(
+                "check_interval_jitter", 0.0
+            )
+        return PollPolicy(
+            check_interval,
+            max_interval=max_check_interval,
+            backoff=check_interval_backoff,
+            jitter=check_interval_jitter,
+        )
+
+    async def async_run_submission(
+        self,
+        *,
+        dry_run=False,
+        exit_on_submit=False,
+        clean=False,
+        check_interval=30,
+        max_check_interval=None,
+        check_interval_backoff=None,
+        check_interval_jitter=None,
+    ):
         """Async interface of run_submission.
 
+        The workflow of `run_submission` is run as a coroutine: it waits
+        with `asyncio.sleep` between two checks, while each of its blocking
+        steps (uploading, checking, submitting and downloading) is still run
+        in the default executor of the event loop. Thus, many submissions
+        can be run concurrently without occupying a thread for each of them
+        while they are waiting.
+
         Examples
         --------
         >>> import asyncio
@@ -318,14 +618,28 @@ class Submission:
 
         May raise Error if pass `clean=True` explicitly when submit to pbs or slurm.
         """
-        kwargs = {**{"clean": False}, **kwargs}
-        if kwargs["clean"]:
+        if clean:
             dlog.warning(
                 "Using async submission with `clean=True`, job may fail in queue system"
             )
-        loop = asyncio.get_event_loop()
-        wrapped_submission = functools.partial(self.run_submission, **kwargs)
-        return await loop.run_in_executor(None, wrapped_submission)
+        return await self._async_run_steps(
+            self._run_submission_steps(
+                dry_run=dry_run,
+                exit_on_submit=exit_on_submit,
+                clean=clean,
+                check_interval=check_interval,
+                max_check_interval=max_check_interval,
+                check_interval_backoff=check_interval_backoff,
+                check_interval_jitter=check_interval_jitter,
+            )
+        )
+
+    async def _async_call(self, func, *args, **kwargs):
+        """Run a blocking method in the default executor of the running event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(func, *args, **kwargs)
+        )
 
     def update_submission_state(self):
         """Check whether all the jobs in the submission.
@@ -334,24 +648,98 @@ class Submission:
         -----
         this method will not handle unexpected (like resubmit terminated) job state in the submission.
         """
-        for job in self.belonging_jobs:
-            if job.job_state == JobStatus.finished:
-                # finished job will be finished for ever, skip
-                continue
-            job.get_job_state()
+        # finished job will be finished for ever, skip
+        jobs = [
+            job for job in self.belonging_jobs if job.job_state != JobStatus.finished
+        ]
+        if not jobs:
+            return
+        assert self.machine is not None
+        # list the finish tags once instead of checking them one by one
+        self.machine.context.refresh_finished_tags()
+        # query the scheduler once for all the jobs instead of once per job
+        pilot = get_pilot(self.machine, self.resources)
+        if pilot is not None:
+            job_states = pilot.check_status_batch(jobs)
+        else:
+            job_states = self.machine.check_status_batch(jobs)
+        ended_jobs = []
+        for job, job_state in zip(jobs, job_states):
+            previous_state = job.job_state
+            job.get_job_state(job_state=job_state)
             dlog.debug(
                 f"update_submission_state: job: {job.job_hash}, {job.job_id}, {job.job_state}"
             )
+            if (
+                job.job_state in (JobStatus.finished, JobStatus.terminated)
+                and job.job_state != previous_state
+            ):
+                ended_jobs.append(job)
+        if ended_jobs and self.resources.strategy.get("record_history", False):
+            runtime_history.record_jobs(
+                ended_jobs,
+                tasks={task.task_hash: task for task in self.belonging_tasks},
+            )
 
     def handle_unexpected_submission_state(self):
         """Handle unexpected job state of the submission.
         If the job state is unsubmitted, submit the job.
         If the job state is terminated (killed unexpectly), resubmit the job.
         If the job state is unknown, raise an error.
+
+        Up to `resources.strategy['submit_concurrency']` jobs are submitted
+        in parallel, and no more than `resources.strategy['submit_rate_limit']`
+        jobs are submitted per second.
+
+        Jobs are only submitted when there are free slots in the queue window,
+        see `get_jobs_in_window`. If the scheduler rejects a job (e.g. the
+        QOS limit of Slurm is reached), the number of jobs in the queue is
+        learned as the limit of the window; the limit is probed upward by one
+        job after each round without rejections.
         """
+        assert self.resources is not None
+        submit_concurrency = self.resources.strategy.get("submit_concurrency", 1)
+        submit_rate_limit = self.resources.strategy.get("submit_rate_limit")
+        rate_limiter = (
+            RateLimiter(submit_rate_limit) if submit_rate_limit is not None else None
+        )
+
+        def handle_job(job):
+            if rate_limiter is not None and job.job_state in (
+                JobStatus.unsubmitted,
+                JobStatus.terminated,
+            ):
+                rate_limiter.acquire()
+            job.handle_unexpected_job_state()
+
+        jobs = self.get_jobs_in_window()
+        pending_jobs = [
+            job
+            for job in jobs
+            if job.job_state in (JobStatus.unsubmitted, JobStatus.terminated)
+        ]
         try:
-            for job in self.belonging_jobs:
-                job.handle_unexpected_job_state()
+            if self.resources.strategy.get("bulk_submit", False) and not (
+                self.resources.strategy.get("pilot")
+            ):
+                # the jobs rejected in bulk are left for the next round, so
+                # that they are not submitted twice in one round
+                bulk_job_hashes = {job.job_hash for job in self.submit_jobs_bulk(jobs)}
+                jobs = [job for job in jobs if job.job_hash not in bulk_job_hashes]
+            if submit_concurrency > 1:
+                with ThreadPoolExecutor(max_workers=submit_concurrency) as executor:
+                    futures = [executor.submit(handle_job, job) for job in jobs]
+                    try:
+                        for future in futures:
+                            future.result()
+                    except Exception:
+                        # do not submit more jobs; wait for jobs being submitted
+                        for future in futures:
+                            future.cancel()
+                        raise
+            else:
+                for job in jobs:
+                    handle_job(job)
         except Exception as e:
             self.submission_to_json()
             record_path = record.write(self)
@@ -363,6 +751,127 @@ class Submission:
                 f"The submission information is saved in {str(record_path)}.\n"
                 f"For furthur actions, run the following command with proper flags: dpdisp submission {self.submission_hash}"
             ) from e
+        self.update_queue_limit(
+            pending_jobs, jobs_held_back=len(jobs) < len(self.belonging_jobs)
+        )
+
+    def get_queue_limit(self) -> Optional[int]:
+        """Get the maximum number of jobs in the queue.
+
+        Returns
+        -------
+        int or None
+            the smaller one of `resources.strategy['max_jobs_in_queue']` and
+            the limit learned from the rejections of the scheduler, or None if
+            there is no limit
+        """
+        assert self.resources is not None
+        limits = [
+            limit
+            for limit in (
+                self.resources.strategy.get("max_jobs_in_queue"),
+                self.learned_queue_limit,
+            )
+            if limit is not None
+        ]
+        return min(limits, default=None)
+
+    def count_jobs_in_queue(self) -> int:
+        """Count the jobs waiting, running or completing in the queue.
+
+        Returns
+        -------
+        int
+            the number of jobs in the queue
+        """
+        return sum(
+            job.job_state
+            in (JobStatus.waiting, JobStatus.running, JobStatus.completing)
+            for job in self.belonging_jobs
+        )
+
+    def get_jobs_in_window(self) -> List["Job"]:
+        """Get the jobs to be handled in the current queue window.
+
+        Unsubmitted and terminated jobs are held back once the number of jobs
+        in the queue reaches the queue limit, see `get_queue_limit`. They will
+        be submitted in the later checks as the jobs in the queue finish.
+
+        Returns
+        -------
+        list[Job]
+            the jobs to be handled
+        """
+        queue_limit = self.get_queue_limit()
+        if queue_limit is None:
+            return list(self.belonging_jobs)
+        slots = max(queue_limit - self.count_jobs_in_queue(), 0)
+        jobs = []
+        for job in self.belonging_jobs:
+            if job.job_state in (JobStatus.unsubmitted, JobStatus.terminated):
+                if slots == 0:
+                    continue
+                slots -= 1
+            jobs.append(job)
+        if len(jobs) < len(self.belonging_jobs):
+            dlog.info(
+                f"{len(self.belonging_jobs) - len(jobs)} jobs are held back as the queue limit {queue_limit} is reached"
+            )
+        return jobs
+
+    def update_queue_limit(self, pending_jobs, jobs_held_back: bool) -> None:
+        """Learn the queue limit from the result of submitting the pending jobs.
+
+        If any pending job remains unsubmitted, it is rejected by the
+        scheduler, and the number of jobs in the queue is taken as the limit.
+        Otherwise, if jobs have been held back by the learned limit, the limit
+        is increased by one to probe whether the scheduler accepts more jobs.
+
+        Parameters
+        ----------
+        pending_jobs : list[Job]
+            the unsubmitted and terminated jobs that were just submitted
+        jobs_held_back : bool
+            whether any job was held back by the queue limit
+        """
+        if any(job.job_state == JobStatus.unsubmitted for job in pending_jobs):
+            self.learned_queue_limit = max(self.count_jobs_in_queue(), 1)
+            dlog.info(
+                f"the scheduler rejected the submission; queue limit is set to {self.learned_queue_limit}"
+            )
+        elif jobs_held_back and self.learned_queue_limit is not None:
+            self.learned_queue_limit += 1
+
+    def submit_jobs_bulk(self, jobs=None):
+        """Submit all the unsubmitted jobs in one remote call, see `Machine.do_submit_bulk`.
+
+        The jobs failing to be submitted (e.g. rejected by the QOS limit of
+        Slurm) remain unsubmitted and should be submitted in the next check.
+
+        Parameters
+        ----------
+        jobs : list[Job], optional
+            the jobs to be considered. Default is all the jobs of the submission.
+
+        Returns
+        -------
+        list[Job]
+            the jobs submitted in bulk, including the failed ones; empty if
+            bulk submission is not used
+        """
+        if jobs is None:
+            jobs = self.belonging_jobs
+        jobs = [job for job in jobs if job.job_state == JobStatus.unsubmitted]
+        if len(jobs) <= 1 or self.machine.gen_script_submit_command(jobs[0]) is None:
+            return []
+        job_ids = self.machine.do_submit_bulk(jobs)
+        for job in jobs:
+            if job.job_hash in job_ids:
+                job.register_job_id(job_ids[job.job_hash])
+                job.job_state = JobStatus.waiting
+                dlog.info(f"job {job.job_hash} was submitted; job_id is {job.job_id}")
+        dlog.info(f"{len(job_ids)} of {len(jobs)} jobs are submitted in bulk")
+        return jobs
 
     def check_ratio_unfinished(self, ratio_unfinished: float) -> bool:
         """Calculate the ratio of unfinished tasks in the submission.
@@ -385,7 +894,8 @@ class Submission:
             # get task state is more accurate
             status_list = []
             for task in self.belonging_tasks:
-                task.get_task_state(self.machine.context)
+                # the tags have just been listed by update_submission_state
+                task.get_task_state(self.machine.context, verify=False)
                 status_list.append(task.task_state)
         finished_num = status_list.count(JobStatus.finished)
         return finished_num / len(self.belonging_tasks) >= (1 - ratio_unfinished)
@@ -395,7 +905,11 @@ class Submission:
         # kill all jobs and mark them as finished
         for job in self.belonging_jobs:
             if job.job_state != JobStatus.finished:
-                self.machine.kill(job)
+                pilot = get_pilot(self.machine, job.resources)
+                if pilot is not None:
+                    pilot.kill(job)
+                else:
+                    self.machine.kill(job)
                 job.job_state = JobStatus.finished
         # remove all unfinished tasks
         finished_tasks = []
@@ -444,12 +958,23 @@ class Submission:
         else:
             return True
 
-    def generate_jobs(self):
+    def generate_jobs(self, cost_func: Optional[Callable[["Task"], float]] = None):
         """After tasks register to the self.belonging_tasks,
         This method generate the jobs and add these jobs to self.belonging_jobs.
+        The tasks already finished (e.g. restored from the result cache) are skipped.
         The jobs are generated by the tasks randomly, and there are self.resources.group_size tasks in a task.
         Why we randomly shuffle the tasks is under the consideration of load balance.
         The random seed is a constant (to be concrete, 42). And this insures that the jobs are equal when we re-run the program.
+
+        If `resources.strategy['group_strategy']` is "lpt", the tasks are
+        instead packed into the same number of jobs with balanced total costs,
+        using the longest-processing-time-first rule, see `lpt_partition`.
+
+        Parameters
+        ----------
+        cost_func : Callable[[Task], float], optional
+            the function to estimate the cost of a task for the "lpt" strategy.
+            Default is `Task.cost`, and 1.0 for tasks without a cost.
         """
         assert self.resources is not None
         if self.belonging_jobs:
@@ -459,26 +984,43 @@ class Submission:
         group_size = self.resources.group_size
         if (group_size < 0) or (not isinstance(group_size, int)):
             raise RuntimeError("group_size must be a positive number")
-        task_num = len(self.belonging_tasks)
+        tasks = [
+            task
+            for task in self.belonging_tasks
+            if task.task_state != JobStatus.finished
+        ]
+        task_num = len(tasks)
         if task_num == 0:
             raise RuntimeError("submission must have at least 1 task")
         if group_size == 0:
             # 0 means infinity
             group_size = task_num
-        random.seed(42)
-        random_task_index = list(range(task_num))
-        random.shuffle(random_task_index)
-        random_task_index_ll = [
-            random_task_index[ii : ii + group_size]
-            for ii in range(0, task_num, group_size)
-        ]
+        group_strategy = self.resources.strategy.get("group_strategy", "random")
+        if group_strategy == "lpt":
+            if cost_func is None:
+                costs = [1.0 if task.cost is None else task.cost for task in tasks]
+            else:
+                costs = [cost_func(task) for task in tasks]
+            random_task_index_ll = lpt_partition(
+                costs, n_bins=-(-task_num // group_size), capacity=group_size
+            )
+        elif group_strategy == "random":
+            random.seed(42)
+            random_task_index = list(range(task_num))
+            random.shuffle(random_task_index)
+            random_task_index_ll = [
+                random_task_index[ii : ii + group_size]
+                for ii in range(0, task_num, group_size)
+            ]
+        else:
+            raise RuntimeError(f"unknown group_strategy {group_strategy}")
 
         for ii in random_task_index_ll:
-            job_task_list = [self.belonging_tasks[jj] for jj in ii]
+            job_task_list = [tasks[jj] for jj in ii]
             job = Job(
                 job_task_list=job_task_list,
                 machine=self.machine,
-                resources=copy.deepcopy(self.resources),
+                resources=self.resources,
             )
             self.belonging_jobs.append(job)
 
@@ -487,8 +1029,81 @@ class Submission:
 
         self.submission_hash = self.get_hash()
 
+    def get_result_cache(self) -> Optional[ResultCache]:
+        """Get the result cache configured by `resources.strategy['result_cache']`.
+
+        Returns
+        -------
+        ResultCache or None
+            the result cache, or None if it is not enabled
+        """
+        assert self.resources is not None
+        config = self.resources.strategy.get("result_cache")
+        if config is None:
+            return None
+        return ResultCache(max_size=config.get("max_size", 10240) * 1024**2)
+
+    def restore_cached_results(self):
+        """Restore the backward files of the tasks found in the result cache,
+        and mark these tasks as finished, so that they are not submitted.
+        """
+        cache = self.get_result_cache()
+        if cache is None:
+            return
+        local_root = self.machine.context.local_root
+        n_cached = 0
+        for task in self.belonging_tasks:
+            task.cache_key = cache.get_key(
+                task, local_root, self.forward_common_files, self.resources
+            )
+            if task.cache_key is not None and cache.restore(
+                task.cache_key, os.path.join(local_root, task.task_work_path)
+            ):
+                task.task_state = JobStatus.finished
+                n_cached += 1
+        dlog.info(
+            f"{n_cached} of {len(self.belonging_tasks)} tasks are restored from the result cache"
+        )
+
+    def check_all_tasks_cached(self) -> bool:
+        """Check whether all the tasks are restored from the result cache.
+
+        Returns
+        -------
+        bool
+            whether all the tasks are finished before generating the jobs
+        """
+        return (
+            self.get_result_cache() is not None
+            and not self.belonging_jobs
+            and all(
+                task.task_state == JobStatus.finished for task in self.belonging_tasks
+            )
+        )
+
+    def store_results_to_cache(self):
+        """Store the backward files of the finished tasks to the result cache."""
+        cache = self.get_result_cache()
+        if cache is None:
+            return
+        local_root = self.machine.context.local_root
+        for job in self.belonging_jobs:
+            for task in job.job_task_list:
+                if task.task_state == JobStatus.finished and task.cache_key is not None:
+                    cache.store(
+                        task.cache_key,
+                        os.path.join(local_root, task.task_work_path),
+                        task.backward_files,
+                    )
+        cache.evict()
+
     def upload_jobs(self):
         self.machine.context.upload(self)
+        if self.resources.strategy.get("task_stealing", False):
+            # the tasks of all the jobs, shared by the job scripts
+            self.machine.context.write_file(
+                self.machine.task_queue_file, self.machine.gen_task_queue(self)
+            )
 
     def download_jobs(self):
         self.machine.context.download(self)
@@ -502,29 +1117,119 @@ class Submission:
         record.remove(self.submission_hash)
 
     def submission_to_json(self):
+        """Save the submission to the remote root.
+
+        The whole submission (the snapshot) is written to `<hash>.json` at the
+        first call. Later, only the changes of the job states (job_id,
+        job_state and fail_count) are appended to `<hash>.journal`, one JSON
+        record per line. Once the journal is as long as the number of the
+        jobs (or `journal_min_entries`), it is compacted into a new snapshot.
+        See `try_recover_from_json` for how the journal is replayed.
+        """
         # self.update_submission_state()
-        write_str = json.dumps(self.serialize(), indent=4, default=str)
+        job_states = {
+            job.job_hash: (job.job_id, job.job_state, job.fail_count)
+            for job in self.belonging_jobs
+        }
+        changed_jobs = [
+            job_hash
+            for job_hash, job_state in job_states.items()
+            if self._journal_states.get(job_hash) != job_state
+        ]
+        if (
+            self._journal_entries is None
+            or job_states.keys() != self._journal_states.keys()
+            or self._journal_entries + len(changed_jobs)
+            > max(len(self.belonging_jobs), self.journal_min_entries)
+        ):
+            self._write_snapshot()
+        elif changed_jobs:
+            records = []
+            for job_hash in changed_jobs:
+                self._journal_seq += 1
+                job_id, job_state, fail_count = job_states[job_hash]
+                records.append(
+                    json.dumps(
+                        {
+                            "seq": self._journal_seq,
+                            "job_hash": job_hash,
+                            "job_id": job_id,
+                            "job_state": job_state,
+                            "fail_count": fail_count,
+                        },
+                        default=str,
+                    )
+                    + "\n"
+                )
+            self.machine.context.append_file(
+                f"{self.submission_hash}.journal", write_str="".join(records)
+            )
+            self._journal_entries += len(records)
+        self._journal_states = job_states
+
+    def _write_snapshot(self):
+        """Write the whole submission to `<hash>.json` and truncate the journal."""
+        submission_dict = self.serialize_stream()
+        # the records in the journal up to this seq are included in the snapshot
+        submission_dict["journal_seq"] = self._journal_seq
         submission_file_name = f"{self.submission_hash}.json"
-        self.machine.context.write_file(submission_file_name, write_str=write_str)
+        self.machine.context.write_file_stream(
+            submission_file_name,
+            join_chunks(iter_json(submission_dict, indent=4, default=str)),
+        )
+        self.machine.context.write_file(f"{self.submission_hash}.journal", write_str="")
+        self._journal_entries = 0
+
+    def _replay_journal(self, jobs, journal_seq):
+        """Apply the records in `<hash>.journal` newer than the snapshot.
+
+        Parameters
+        ----------
+        jobs : list[Job]
+            the jobs loaded from the snapshot `<hash>.json`, which are updated
+        journal_seq : int
+            the seq of the last record included in the snapshot
+        """
+        journal_file_name = f"{self.submission_hash}.journal"
+        if self.machine.context.check_file_exists(journal_file_name):
+            job_dict = {job.job_hash: job for job in jobs}
+            for line in self.machine.context.read_file(journal_file_name).splitlines():
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last record may be partially written
+                    dlog.warning(f"skip the broken record in {journal_file_name}")
+                    continue
+                if entry["seq"] <= journal_seq or entry["job_hash"] not in job_dict:
+                    continue
+                job = job_dict[entry["job_hash"]]
+                job.job_id = entry["job_id"]
+                job.job_state = entry["job_state"]
+                job.fail_count = entry["fail_count"]
+                for task in job.job_task_list:
+                    task.task_state = job.job_state
+                journal_seq = entry["seq"]
+        self._journal_seq = journal_seq
+        # write a new snapshot at the next save
+        self._journal_entries = None
 
     @classmethod
     def submission_from_json(cls, json_file_name="submission.json"):
         with open(json_file_name) as f:
-            submission_dict = json.load(f)
-        submission = cls.deserialize(submission_dict=submission_dict, machine=None)
+            submission = cls.deserialize_stream(
+                iter(lambda: f.read(1 << 20), ""), machine=None
+            )
         return submission
 
     def try_recover_from_json(self):
         submission_file_name = f"{self.submission_hash}.json"
         if_recover = self.machine.context.check_file_exists(submission_file_name)
         submission = None
-        submission_dict = {}
         if if_recover:
-            submission_dict_str = self.machine.context.read_file(
-                fname=submission_file_name
+            submission = Submission.deserialize_stream(
+                self.machine.context.read_file_stream(submission_file_name)
             )
-            submission_dict = json.loads(submission_dict_str)
-            submission = Submission.deserialize(submission_dict=submission_dict)
+            self._replay_journal(submission.belonging_jobs, submission._journal_seq)
             submission.bind_machine(machine=self.machine)
             if self == submission:
                 self.belonging_jobs = submission.belonging_jobs
@@ -562,8 +1267,29 @@ class Task:
         the filename to which command redirect stdout
     errlog : Str
         the filename to which command redirect stderr
+    cost : float, optional
+        the estimated cost (e.g. runtime) of the task, used to group tasks
+        into jobs with `strategy['group_strategy']` "lpt". It is not a part
+        of the task hash.
+
+    Notes
+    -----
+    The equal file lists are shared by the tasks to save memory. Assign a
+    new list instead of modifying `forward_files` or `backward_files` in place.
     """
 
+    # the fields dumped by serialize; the cached hash is reset when they are assigned
+    static_fields = (
+        "command",
+        "task_work_path",
+        "forward_files",
+        "backward_files",
+        "outlog",
+        "errlog",
+    )
+    # a million tasks may be held in memory: no __dict__ for each task
+    __slots__ = (*static_fields, "cost", "cache_key", "task_state", "_hash")
+
     def __init__(
         self,
         command,
@@ -572,6 +1298,7 @@ class Task:
         backward_files=[],
         outlog="log",
         errlog="err",
+        cost=None,
     ):
         self.command = command
         self.task_work_path = task_work_path
@@ -579,10 +1306,12 @@ class Task:
         self.backward_files = backward_files
         self.outlog = outlog
         self.errlog = errlog
+        self.cost = cost
+        # the key in the result cache, see Submission.restore_cached_results
+        self.cache_key = None
 
         # self.task_need_resources = task_need_resources
 
-        self.task_hash = self.get_hash()
         # self.task_need_resources="<to be completed in the future>"
         # self.uuid =
         self.task_state = JobStatus.unsubmitted
@@ -590,14 +1319,49 @@ class Task:
     def __repr__(self):
         return str(self.serialize())
 
+    def __setattr__(self, name, value):
+        if name in self.static_fields:
+            # the same strings and file lists are shared by the tasks;
+            # task_work_path is usually unique, which is not worth interning
+            if name in ("forward_files", "backward_files"):
+                value = intern_list(value)
+            elif name != "task_work_path" and isinstance(value, str):
+                value = sys.intern(value)
+            object.__setattr__(self, "_hash", None)
+        object.__setattr__(self, name, value)
+
     def __eq__(self, other):
-        return json.dumps(self.serialize()) == json.dumps(other.serialize())
+        return self.get_hash() == other.get_hash()
 
     def __getitem__(self, key):
         return self.serialize()[key]
 
+    @property
+    def task_hash(self):
+        return self.get_hash()
+
+    def get_static_json(self):
+        """Get the JSON string of the task.
+
+        Returns
+        -------
+        str
+            the same as `json.dumps(self.serialize())`
+        """
+        return json.dumps(self.serialize())
+
     def get_hash(self):
-        return sha1(json.dumps(self.serialize()).encode("utf-8")).hexdigest()
+        """Get the hash of the task, which is cached until a field in
+        `static_fields` is assigned.
+
+        Returns
+        -------
+        str
+            the hash of the task
+        """
+        if self._hash is None:
+            self._hash = sha1(self.get_static_json().encode("utf-8")).hexdigest()
+        return self._hash
 
     @classmethod
     def load_from_json(cls, json_file: str, allow_ref: bool = False) -> "Task":
@@ -714,6 +1478,12 @@ class Task:
             "downloaded or synchronized back, it typically appears under the same relative task directory on the local side."
         )
 
+        doc_cost = (
+            "Estimated cost (e.g. runtime) of this task, used to balance the jobs when "
+            "resources.strategy.group_strategy is 'lpt'. It is not a part of the task hash. "
+            "Default is 1.0."
+        )
+
         task_args = [
             Argument("command", str, optional=False, doc=doc_command),
             Argument("task_work_path", str, optional=False, doc=doc_task_work_path),
@@ -745,17 +1515,26 @@ class Task:
                 doc=doc_errlog,
                 default="err",
             ),
+            Argument(
+                "cost",
+                [int, float],
+                optional=True,
+                doc=doc_cost,
+            ),
         ]
         task_format = Argument("task", dict, task_args)
         return task_format
 
-    def get_task_state(self, context):
+    def get_task_state(self, context, verify=True):
         """Get the task state by checking the tag file.
 
         Parameters
         ----------
         context : Context
             the context of the task
+        verify : bool, default=True
+            whether to check the tag file itself if it is not in the snapshot
+            of finish tags taken by the context
         """
         if self.task_state in (JobStatus.finished, JobStatus.unsubmitted):
             # finished task should always be finished
@@ -766,7 +1545,7 @@ class Task:
             pathlib.PurePath(self.task_work_path)
             / (self.task_hash + "_task_tag_finished")
         ).as_posix()
-        result = context.check_file_exists(task_tag_finished)
+        result = context.check_tag_exists(task_tag_finished, verify=verify)
         if result:
             self.task_state = JobStatus.finished
 
@@ -784,8 +1563,38 @@ class Job:
         the machine resources. Passed from Submission when it constructs jobs.
     machine : machine
         machine object to execute the job. Passed from Submission when it constructs jobs.
+
+    Notes
+    -----
+    `job_hash` names the remote files of the job, so it is fixed once used,
+    even if the tasks or the resources are changed later. `get_hash` follows
+    the content of the job; it is cached and recomputed only when the hash
+    of a task or the resources have changed.
+
+    The jobs generated by a submission share the resources of the
+    submission. To change the resources of a single job, assign a copy
+    of them to the job.
     """
 
+    __slots__ = (
+        "job_task_list",
+        "resources",
+        "machine",
+        "job_state",
+        "job_id",
+        "fail_count",
+        "job_uuid",
+        "submit_time",
+        "recorded_task_times",
+        "_hash",
+        "_hash_key",
+        "_job_hash",
+        # set by the machines or contexts for some jobs
+        "upload_path",
+        "jgid",
+        "worker_id",
+    )
+
     def __init__(
         self,
         job_task_list,
@@ -801,23 +1610,35 @@ class Job:
         self.job_id = ""
         self.fail_count = 0
         self.job_uuid = uuid.uuid4()
-
-        self.job_hash = self.get_hash()
-        self.script_file_name = self.job_hash + ".sub"
+        # see RuntimeHistory.record_jobs
+        self.submit_time = None
+        self.recorded_task_times = 0
+        self._hash = None
+        self._hash_key = None
+        self._job_hash = None
 
     def __repr__(self):
         return str(self.serialize())
 
+    @property
+    def job_hash(self):
+        """The hash of the job when it is first used, see the notes of the class."""
+        if self._job_hash is None:
+            self._job_hash = self.get_hash()
+        return self._job_hash
+
+    @property
+    def script_file_name(self):
+        return self.job_hash + ".sub"
+
     def __eq__(self, other):
         """When check whether the two jobs are equal,
         we disregard the runtime infomation(job_state, job_id, fail_count) of the jobs.
         """
-        return json.dumps(self.serialize(if_static=True)) == json.dumps(
-            other.serialize(if_static=True)
-        )
+        return self.get_hash() == other.get_hash()
 
     @classmethod
-    def deserialize(cls, job_dict, machine=None):
+    def deserialize(cls, job_dict, machine=None, resources=None):
         """Convert the  job_dict to a Submission class object.
 
         Parameters
@@ -826,6 +1647,9 @@ class Job:
             the dictionary which contains the job information
         machine : Machine
             the machine object to execute the job
+        resources : Resources, optional
+            the resources shared with other jobs, used instead of the
+            resources in job_dict
 
         Returns
         -------
@@ -842,11 +1666,13 @@ class Job:
             Task.deserialize(task_dict)
             for task_dict in job_dict[job_hash]["job_task_list"]
         ]
+        if resources is None:
+            resources = Resources.deserialize(
+                resources_dict=job_dict[job_hash]["resources"]
+            )
         job = Job(
             job_task_list=job_task_list,
-            resources=Resources.deserialize(
-                resources_dict=job_dict[job_hash]["resources"]
-            ),
+            resources=resources,
             machine=machine,
         )
 
@@ -859,18 +1685,29 @@ class Job:
             task.task_state = job.job_state
         return job
 
-    def get_job_state(self):
+    def get_job_state(self, job_state=None):
         """Get the jobs. Usually, this method will query the database of slurm or pbs job scheduler system and get the results.
 
+        Parameters
+        ----------
+        job_state : JobStatus, optional
+            the job state already queried, e.g. by `Machine.check_status_batch`.
+            If not given, the job scheduler will be queried for this job.
+
         Notes
         -----
         this method will not submit or resubmit the jobs if the job is unsubmitted.
         """
-        dlog.debug(
-            f"query database; self.job_hash:{self.job_hash}; self.job_id:{self.job_id}"
-        )
-        assert self.machine is not None
-        job_state = self.machine.check_status(self)
+        if job_state is None:
+            dlog.debug(
+                f"query database; self.job_hash:{self.job_hash}; self.job_id:{self.job_id}"
+            )
+            assert self.machine is not None
+            pilot = get_pilot(self.machine, self.resources)
+            if pilot is not None:
+                job_state = pilot.check_status_batch([self])[0]
+            else:
+                job_state = self.machine.check_status(self)
         self.job_state = job_state
         # update general task_state, which should be faster than checking tags
         for task in self.job_task_list:
@@ -927,8 +1764,71 @@ class Job:
                 time.sleep(self.resources.wait_time)
             # self.get_job_state()
 
+    def get_static_json(self, resources_json=None):
+        """Get the JSON string of the job without the runtime information.
+
+        Parameters
+        ----------
+        resources_json : str, optional
+            the JSON string of the resources, if it is already known
+
+        Returns
+        -------
+        str
+            the same as `json.dumps(self.serialize(if_static=True))`
+        """
+        if resources_json is None:
+            resources_json = json.dumps(self.resources.serialize())
+        tasks_str = ", ".join(task.get_static_json() for task in self.job_task_list)
+        content_str = (
+            f'{{"job_task_list": [{tasks_str}], "resources": {resources_json}}}'
+        )
+        self._hash = sha1(content_str.encode("utf-8")).hexdigest()
+        self._hash_key = self._get_hash_key(resources_json)
+        return f'{{"{self._hash}": {content_str}}}'
+
+    def _get_hash_key(self, resources_json):
+        # the cached hash is valid while the task hashes and the resources are
+        # unchanged; the task hashes are cached by the tasks
+        return resources_json, tuple(task.get_hash() for task in self.job_task_list)
+
     def get_hash(self):
-        return str(list(self.serialize(if_static=True).keys())[0])
+        """Get the hash of the content of the job, which is cached.
+
+        Returns
+        -------
+        str
+            the hash of the job
+        """
+        resources_json = json.dumps(self.resources.serialize())
+        if self._hash_key != self._get_hash_key(resources_json):
+            self.get_static_json(resources_json=resources_json)
+        return self._hash
+
+    def serialize_stream(self, if_static=False):
+        """Convert the Job class instance to an object dumped by `iter_json`,
+        where the tasks are serialized one by one while being dumped.
+
+        Parameters
+        ----------
+        if_static : bool
+            whether dump the job runtime infomation (job_id, job_state, fail_count, job_uuid etc.) to the dictionary.
+
+        Returns
+        -------
+        JSONStreamObject
+            the same as `serialize` when dumped
+        """
+        job_content_dict = JSONStreamObject()
+        job_content_dict["job_task_list"] = JSONStreamArray(
+            task.serialize() for task in self.job_task_list
+        )
+        job_content_dict["resources"] = self.resources.serialize()
+        if not if_static:
+            job_content_dict["job_state"] = self.job_state
+            job_content_dict["job_id"] = self.job_id
+            job_content_dict["fail_count"] = self.fail_count
+        return JSONStreamObject({self.get_hash(): job_content_dict})
 
     def serialize(self, if_static=False):
         """Convert the Task class instance to a dictionary.
@@ -950,7 +1850,7 @@ class Job:
         ]
         job_content_dict["resources"] = self.resources.serialize()
         # job_content_dict['job_work_base'] = self.job_work_base
-        job_hash = sha1(json.dumps(job_content_dict).encode("utf-8")).hexdigest()
+        job_hash = self.get_hash()
         if not if_static:
             job_content_dict["job_state"] = self.job_state
             job_content_dict["job_id"] = self.job_id
@@ -960,10 +1860,15 @@ class Job:
 
     def register_job_id(self, job_id):
         self.job_id = job_id
+        self.submit_time = time.time() if job_id else None
 
     def submit_job(self):
         assert self.machine is not None
-        job_id = self.machine.do_submit(self)
+        pilot = get_pilot(self.machine, self.resources)
+        if pilot is not None:
+            job_id = pilot.submit(self)
+        else:
+            job_id = self.machine.do_submit(self)
         self.register_job_id(job_id)
         if job_id:
             self.job_state = JobStatus.waiting
@@ -971,12 +1876,45 @@ class Job:
             self.job_state = JobStatus.unsubmitted
 
     def job_to_json(self):
-        write_str = json.dumps(self.serialize(), indent=2, default=str)
         assert self.machine is not None
-        self.machine.context.write_file(
-            self.job_hash + "_job.json", write_str=write_str
+        self.machine.context.write_file_stream(
+            self.job_hash + "_job.json",
+            join_chunks(iter_json(self.serialize_stream(), indent=2, default=str)),
         )
 
+    def get_task_times(self) -> List[Tuple[str, float, float, int]]:
+        """Get the times of the tasks run by the job and not yet recorded.
+
+        The times are written by the job script if
+        `resources.strategy['record_history']` is set, see
+        `Machine.gen_task_command`. The lines returned are skipped next time.
+
+        Returns
+        -------
+        list[tuple[str, float, float, int]]
+            the task hash, the start time, the end time and the exit status
+            of each task, by the clock of the remote machine
+        """
+        assert self.machine is not None
+        task_times_file = self.job_hash + "_task_times"
+        try:
+            if not self.machine.context.check_file_exists(task_times_file):
+                return []
+            lines = self.machine.context.read_file(task_times_file).splitlines()
+        except (OSError, RuntimeError) as e:
+            dlog.warning(f"failed to read the task times of job {self.job_hash}: {e}")
+            return []
+        task_times = []
+        for line in lines[self.recorded_task_times :]:
+            fields = line.split()
+            if len(fields) == 4:
+                task_hash, start, end, exit_status = fields
+                task_times.append(
+                    (task_hash, float(start), float(end), int(exit_status))
+                )
+        self.recorded_task_times = len(lines)
+        return task_times
+
     def get_last_error_message(self) -> Optional[str]:
         """Get last error message when the job is terminated."""
         assert self.machine is not None
@@ -1016,6 +1954,34 @@ class Resources:
         customized_script_header_template_file : str
             The customized template file to generate job submitting script header,
             which overrides the default file.
+        max_check_interval : float
+            The maximal interval in second between two checks of the job states.
+        check_interval_backoff : float
+            The factor to increase the check interval while all the jobs are waiting.
+        check_interval_jitter : float
+            The relative range of the random jitter applied to the check interval.
+        submit_concurrency : int
+            The maximum number of jobs submitted in parallel.
+        submit_rate_limit : float
+            The maximum number of jobs submitted per second.
+        bulk_submit : bool
+            Whether to submit all the unsubmitted jobs in one remote call.
+        max_jobs_in_queue : int
+            The maximum number of jobs waiting or running in the queue.
+        group_strategy : str
+            How to group tasks into jobs: "random" or "lpt".
+        record_history : bool
+            Whether to record the runtime of tasks in the local history database.
+        task_slot_pool : bool
+            Whether to start a new task as soon as any of the `para_deg` running tasks exits.
+        gpu_per_task : int
+            The number of GPUs used by each task with the GPU slot pool.
+        task_stealing : bool
+            Whether the jobs pull unfinished tasks of the submission from a shared queue.
+        pilot : dict
+            Run the jobs in long-lived pilot jobs, with keys `idle_timeout` and `workers`.
+        result_cache : dict
+            Skip the tasks whose results are in the local result cache, with key `max_size`.
     para_deg : int
         Decide how many tasks will be run in parallel.
         Usually run with `strategy['if_cuda_multi_devices']`
@@ -1068,11 +2034,8 @@ class Resources:
 
         self.kwargs = kwargs.get("kwargs", kwargs)
 
-        self.gpu_in_use = 0
-        self.task_in_para = 0
-        # self. = 0
-        # if self.gpu_per_node > 1:
-        # self.in_para_task_num = 0
+        # the counters used in the script generation are kept by
+        # ScriptState, so that the resources can be shared by the jobs
 
         for kk, value in default_strategy.items():
             self.strategy.setdefault(kk, value)
@@ -1087,6 +2050,20 @@ class Resources:
                 )
         if self.strategy["ratio_unfinished"] >= 1.0:
             raise RuntimeError("ratio_unfinished must be smaller than 1.0")
+        if self.strategy.get("submit_concurrency", 1) < 1:
+            raise RuntimeError("submit_concurrency must be no smaller than 1")
+        if self.strategy.get("max_jobs_in_queue", 1) < 1:
+            raise RuntimeError("max_jobs_in_queue must be no smaller than 1")
+        if self.strategy.get("group_strategy", "random") not in ("random", "lpt"):
+            raise RuntimeError("group_strategy must be 'random' or 'lpt'")
+        if self.strategy.get("gpu_per_task", 1) < 1:
+            raise RuntimeError("gpu_per_task must be no smaller than 1")
+        if (
+            self.strategy.get("if_cuda_multi_devices", False)
+            and self.strategy.get("task_slot_pool", False)
+            and self.strategy.get("gpu_per_task", 1) > self.gpu_per_node
+        ):
+            raise RuntimeError("gpu_per_task must be no larger than gpu_per_node")
 
     def __eq__(self, other):
         return json.dumps(self.serialize()) == json.dumps(other.serialize())
@@ -1225,6 +2202,83 @@ class Resources:
             "strict default that requires every task to finish."
         )
         doc_customized_script_header_template_file = "Custom template file for the scheduler-header portion of generated submission scripts. Overrides the default template."
+        doc_max_check_interval = (
+            "Maximum interval in seconds between two checks of the job states when the check interval "
+            "backs off. Default is 10 times of the check_interval of run_submission."
+        )
+        doc_check_interval_backoff = (
+            "Factor by which the check interval grows after each check in which all the jobs are still "
+            "waiting in the queue. The interval is reset once any job is running or changes its state. "
+            "Default is 1.0, i.e. a fixed interval."
+        )
+        doc_submit_concurrency = (
+            "Maximum number of jobs submitted (or resubmitted) in parallel. Default is 1, i.e. jobs are "
+            "submitted one by one."
+        )
+        doc_submit_rate_limit = "Maximum number of jobs submitted (or resubmitted) per second. Default is no limit."
+        doc_bulk_submit = (
+            "Write the scripts of all the unsubmitted jobs and submit them with one remote call, instead of "
+            "several calls per job. Supported by Slurm, PBS, Torque, SGE and LSF; jobs failing in the bulk "
+            "submission are submitted again in the next check. submit_rate_limit also paces the bulk "
+            "submission. Default is False."
+        )
+        doc_max_jobs_in_queue = (
+            "Maximum number of jobs of the submission waiting or running in the queue. The other jobs are "
+            "submitted as the jobs in the queue finish. If the scheduler rejects a job (e.g. the QOS limit "
+            "of Slurm is reached), the limit is also learned from the number of jobs in the queue. Default "
+            "is no limit."
+        )
+        doc_group_strategy = (
+            "How tasks are grouped into jobs. 'random' shuffles the tasks with a fixed seed; 'lpt' packs the "
+            "tasks into the same number of jobs with balanced total costs (task.cost, longest-processing-time-first). "
+            "Both are deterministic. Default is 'random'."
+        )
+        doc_record_history = (
+            "Record the wall time, queue wait and exit status of the tasks in ~/.dpdispatcher/history.sqlite3, "
+            "which can be used to estimate the cost of future tasks, see "
+            "dpdispatcher.utils.history.RuntimeHistory. Default is False."
+        )
+        doc_task_slot_pool = (
+            "Keep para_deg tasks running in a job: a new task is started as soon as any running task exits "
+            "(using `wait -n`, which requires bash 4.3 or later), instead of waiting for every para_deg "
+            "tasks to finish before the next group starts. With if_cuda_multi_devices, each GPU runs para_deg "
+            "tasks, and a task claims any free GPU when it starts instead of a fixed one. Default is False."
+        )
+        doc_task_stealing = (
+            "Let the jobs of a submission share their tasks: after running its own tasks, a job pulls the "
+            "unfinished tasks of the other running jobs, claimed by atomic mkdir on the remote filesystem, "
+            "and then waits for its own tasks run by others. The tasks are defined once in a task queue file "
+            "under the remote root. A failed task is released and fails its own job; the claims of a job "
+            "expire 5 minutes after its heartbeat stops, e.g. when it is killed. The task finish tags remain "
+            "the source of truth. "
+            "Requires a filesystem shared by all the jobs; not supported by Slurm job arrays. Default is False."
+        )
+        doc_pilot = (
+            "Run the jobs in long-lived pilot jobs instead of submitting each job to the scheduler. The "
+            "pilot jobs are submitted once with these resources, and pull the jobs of this and later "
+            "submissions with the same allocation (in the same process) from a queue directory under the "
+            "remote root. Expired pilot jobs are resubmitted, and the jobs running in them are resubmitted "
+            "as terminated jobs."
+        )
+        doc_pilot_idle_timeout = (
+            "Seconds that a pilot job waits for new jobs before it exits."
+        )
+        doc_pilot_workers = "Number of pilot jobs kept in the queue."
+        doc_result_cache = (
+            "Cache the backward files of finished tasks in ~/.dpdispatcher/cache, keyed by the command, the "
+            "sha256 of the forward files and forward common files, and the resources affecting the results "
+            "(nodes, CPUs, GPUs, modules, envs and scripts). A task found in the cache is marked finished "
+            "and its backward files are restored locally without being submitted."
+        )
+        doc_result_cache_max_size = "Maximum size of the result cache in MiB; the least recently used results are evicted."
+        doc_gpu_per_task = (
+            "Number of GPUs used by each task, set in CUDA_VISIBLE_DEVICES. Only used when both "
+            "if_cuda_multi_devices and task_slot_pool are true. Default is 1."
+        )
+        doc_check_interval_jitter = (
+            "Relative range of the random jitter applied to each check interval, e.g. 0.1 for +/-10%, so "
+            "that many dispatchers do not poll the scheduler at the same time. Default is 0.0."
+        )
 
         strategy_args = [
             Argument(
@@ -1247,6 +2301,115 @@ class Resources:
                 optional=True,
                 doc=doc_customized_script_header_template_file,
             ),
+            Argument(
+                "max_check_interval",
+                [int, float],
+                optional=True,
+                doc=doc_max_check_interval,
+            ),
+            Argument(
+                "check_interval_backoff",
+                [int, float],
+                optional=True,
+                doc=doc_check_interval_backoff,
+            ),
+            Argument(
+                "check_interval_jitter",
+                [int, float],
+                optional=True,
+                doc=doc_check_interval_jitter,
+            ),
+            Argument(
+                "submit_concurrency",
+                int,
+                optional=True,
+                doc=doc_submit_concurrency,
+            ),
+            Argument(
+                "submit_rate_limit",
+                [int, float],
+                optional=True,
+                doc=doc_submit_rate_limit,
+            ),
+            Argument(
+                "bulk_submit",
+                bool,
+                optional=True,
+                doc=doc_bulk_submit,
+            ),
+            Argument(
+                "max_jobs_in_queue",
+                int,
+                optional=True,
+                doc=doc_max_jobs_in_queue,
+            ),
+            Argument(
+                "group_strategy",
+                str,
+                optional=True,
+                doc=doc_group_strategy,
+            ),
+            Argument(
+                "record_history",
+                bool,
+                optional=True,
+                doc=doc_record_history,
+            ),
+            Argument(
+                "task_slot_pool",
+                bool,
+                optional=True,
+                doc=doc_task_slot_pool,
+            ),
+            Argument(
+                "gpu_per_task",
+                int,
+                optional=True,
+                doc=doc_gpu_per_task,
+            ),
+            Argument(
+                "task_stealing",
+                bool,
+                optional=True,
+                doc=doc_task_stealing,
+            ),
+            Argument(
+                "pilot",
+                dict,
+                [
+                    Argument(
+                        "idle_timeout",
+                        int,
+                        optional=True,
+                        default=600,
+                        doc=doc_pilot_idle_timeout,
+                    ),
+                    Argument(
+                        "workers",
+                        int,
+                        optional=True,
+                        default=1,
+                        doc=doc_pilot_workers,
+                    ),
+                ],
+                optional=True,
+                doc=doc_pilot,
+            ),
+            Argument(
+                "result_cache",
+                dict,
+                [
+                    Argument(
+                        "max_size",
+                        int,
+                        optional=True,
+                        default=10240,
+                        doc=doc_result_cache_max_size,
+                    ),
+                ],
+                optional=True,
+                doc=doc_result_cache,
+            ),
         ]
         doc_strategy = "Strategy options that affect how DPDispatcher generates and evaluates submission scripts."
         strategy_format = Argument(
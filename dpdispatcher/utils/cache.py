@@ -0,0 +1,287 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from dpdispatcher.dlog import dlog
+from dpdispatcher.utils.utils import get_sha256
+
+
+class ResultCache:
+    """Cache the results of tasks by the content of their inputs.
+
+    The key of a task is the hash of its command, the sha256 of its forward
+    files and the forward common files, and the resource fields that may
+    affect the results. An entry stores the backward files of the task.
+    The least recently used entries are evicted once the total size of the
+    cache exceeds `max_size`.
+
+    Parameters
+    ----------
+    root : str or Path, optional
+        the directory of the cache. Default is `~/.dpdispatcher/cache`.
+    max_size : int, default=10 GiB
+        the maximum total size of the cache in bytes
+    """
+
+    def __init__(
+        self,
+        root: Optional[Union[str, Path]] = None,
+        max_size: int = 10 * 1024**3,
+    ) -> None:
+        if root is None:
+            root = Path.home() / ".dpdispatcher" / "cache"
+        self.root = Path(root)
+        self.max_size = max_size
+
+    @staticmethod
+    def _hash_files(base_dir: str, patterns: List[str]) -> Optional[List]:
+        """Hash the files matching the patterns; None if any pattern matches nothing."""
+        hashes = []
+        for pattern in patterns:
+            paths = sorted(glob.glob(os.path.join(base_dir, pattern)))
+            if not paths:
+                return None
+            for path in paths:
+                if os.path.isdir(path):
+                    for dirpath, dirnames, filenames in os.walk(path):
+                        dirnames.sort()
+                        for filename in sorted(filenames):
+                            file_path = os.path.join(dirpath, filename)
+                            hashes.append(
+                                [
+                                    os.path.relpath(file_path, base_dir),
+                                    get_sha256(file_path),
+                                ]
+                            )
+                else:
+                    hashes.append([os.path.relpath(path, base_dir), get_sha256(path)])
+        return hashes
+
+    def get_key(
+        self, task, local_root: str, forward_common_files: List[str], resources
+    ) -> Optional[str]:
+        """Get the key of a task.
+
+        Parameters
+        ----------
+        task : Task
+            the task
+        local_root : str
+            the local directory containing the task directories
+        forward_common_files : list[str]
+            the forward common files of the submission
+        resources : Resources
+            the resources
+
+        Returns
+        -------
+        str or None
+            the key, or None if any forward file is missing
+        """
+        forward_files = self._hash_files(
+            os.path.join(local_root, task.task_work_path), task.forward_files
+        )
+        common_files = self._hash_files(local_root, forward_common_files)
+        if forward_files is None or common_files is None:
+            return None
+        content = {
+            "command": task.command,
+            "forward_files": forward_files,
+            "forward_common_files": common_files,
+            "backward_files": task.backward_files,
+            "resources": {
+                "number_node": resources.number_node,
+                "cpu_per_node": resources.cpu_per_node,
+                "gpu_per_node": resources.gpu_per_node,
+                "module_purge": resources.module_purge,
+                "module_unload_list": resources.module_unload_list,
+                "module_list": resources.module_list,
+                "source_list": resources.source_list,
+                "envs": resources.envs,
+                "prepend_script": resources.prepend_script,
+                "append_script": resources.append_script,
+            },
+        }
+        return hashlib.sha256(
+            json.dumps(content, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.root / "entries" / key
+
+    def restore(self, key: str, task_dir: str) -> bool:
+        """Restore the backward files of a cached task.
+
+        Parameters
+        ----------
+        key : str
+            the key of the task
+        task_dir : str
+            the local directory of the task
+
+        Returns
+        -------
+        bool
+            whether the task is found in the cache
+        """
+        entry_dir = self._entry_dir(key)
+        meta_file = entry_dir / "meta.json"
+        if not meta_file.is_file():
+            return False
+        files_dir = entry_dir / "files"
+        for path in files_dir.iterdir():
+            dest = os.path.join(task_dir, path.name)
+            if path.is_dir():
+                shutil.copytree(path, dest, dirs_exist_ok=True)
+            else:
+                shutil.copy2(path, dest)
+        # mark the entry as recently used
+        os.utime(meta_file)
+        return True
+
+    def store(self, key: str, task_dir: str, backward_files: List[str]) -> None:
+        """Store the backward files of a finished task.
+
+        Parameters
+        ----------
+        key : str
+            the key of the task
+        task_dir : str
+            the local directory of the task
+        backward_files : list[str]
+            the backward files of the task, which may contain glob patterns
+
+        Notes
+        -----
+        The cache is not evicted here; call `evict` after storing a batch.
+        """
+        entry_dir = self._entry_dir(key)
+        if entry_dir.is_dir():
+            os.utime(entry_dir / "meta.json")
+            return
+        tmp_dir = self.root / "tmp" / uuid.uuid4().hex
+        files_dir = tmp_dir / "files"
+        files_dir.mkdir(parents=True)
+        size = 0
+        try:
+            for pattern in backward_files:
+                for path in glob.glob(os.path.join(task_dir, pattern)):
+                    dest = files_dir / os.path.relpath(path, task_dir)
+                    dest.parent.mkdir(parents=True, exist_ok=True)
+                    if os.path.isdir(path):
+                        shutil.copytree(path, dest, dirs_exist_ok=True)
+                    else:
+                        shutil.copy2(path, dest)
+            for dirpath, _, filenames in os.walk(files_dir):
+                size += sum(
+                    os.path.getsize(os.path.join(dirpath, filename))
+                    for filename in filenames
+                )
+            (tmp_dir / "meta.json").write_text(json.dumps({"size": size}))
+            entry_dir.parent.mkdir(parents=True, exist_ok=True)
+            # rename is atomic; another process may have stored the same task
+            os.rename(tmp_dir, entry_dir)
+        except OSError as e:
+            dlog.warning(f"failed to store the task result to the cache: {e}")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the size limit is met."""
+        entries_dir = self.root / "entries"
+        if not entries_dir.is_dir():
+            return
+        entries = []
+        total_size = 0
+        for entry_dir in entries_dir.iterdir():
+            meta_file = entry_dir / "meta.json"
+            try:
+                size = json.loads(meta_file.read_text())["size"]
+                last_used = meta_file.stat().st_mtime
+            except (OSError, ValueError, KeyError):
+                continue
+            entries.append((last_used, size, entry_dir))
+            total_size += size
+        for _, size, entry_dir in sorted(entries, key=lambda entry: entry[0]):
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
+
+
+class FileHashCache:
+    """Cache the sha256 of local files by their paths, sizes and mtimes.
+
+    A file is hashed again only when its size or mtime changes, so that
+    unchanged large files (e.g. models) are not hashed for every upload.
+
+    Parameters
+    ----------
+    path : str or Path, optional
+        the file of the cache. Default is `~/.dpdispatcher/file_hashes.json`.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None) -> None:
+        if path is None:
+            path = Path.home() / ".dpdispatcher" / "file_hashes.json"
+        self.path = Path(path)
+        try:
+            self.entries: Dict[str, dict] = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.entries = {}
+        self._changed = False
+
+    def get_sha256(self, filename: str) -> str:
+        """Get the sha256 of a file, which is hashed only if it has changed.
+
+        Parameters
+        ----------
+        filename : str
+            the file
+
+        Returns
+        -------
+        str
+            the sha256
+        """
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        entry = self.entries.get(filename)
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime"] == stat.st_mtime_ns
+        ):
+            return entry["sha256"]
+        sha256 = get_sha256(filename)
+        self.entries[filename] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "sha256": sha256,
+        }
+        self._changed = True
+        return sha256
+
+    def save(self) -> None:
+        """Save the cache, dropping the entries of removed files."""
+        if not self._changed:
+            return
+        self.entries = {
+            filename: entry
+            for filename, entry in self.entries.items()
+            if os.path.exists(filename)
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex}")
+            tmp_path.write_text(json.dumps(self.entries))
+            # another process may save the cache at the same time
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            dlog.warning(f"failed to save the file hash cache: {e}")
+        self._changed = False
@@ -0,0 +1,322 @@
+"""Compression codecs of the tar archives transferred by SSHContext.
+
+A codec compresses the archive locally and provides the option of `tar` on
+the remote, so that both ends use the same format. zstd and lz4 are run by
+their command-line programs, which should be installed on both ends; gzip
+falls back to the standard library locally, and to `tar -z` on the remote.
+"""
+
+import contextlib
+import gzip
+import shlex
+import shutil
+import subprocess
+import threading
+from typing import BinaryIO, Dict, Iterator, List, Optional, Type
+
+# the magic numbers of the common compressed formats
+compressed_magic_numbers = (
+    b"\x1f\x8b",  # gzip
+    b"BZh",  # bzip2
+    b"\xfd7zXZ\x00",  # xz
+    b"\x28\xb5\x2f\xfd",  # zstd
+    b"\x04\x22\x4d\x18",  # lz4
+    b"PK\x03\x04",  # zip, npz
+    b"7z\xbc\xaf\x27\x1c",  # 7z
+    b"\x89PNG",  # png
+    b"\xff\xd8\xff",  # jpeg
+)
+
+
+def is_compressed(header: bytes) -> bool:
+    """Check whether a file is compressed by its first bytes.
+
+    Parameters
+    ----------
+    header : bytes
+        the first 8 bytes of the file
+
+    Returns
+    -------
+    bool
+        whether the file is compressed
+    """
+    return header.startswith(compressed_magic_numbers)
+
+
+class Codec:
+    """The compression codec of the tar archives.
+
+    Parameters
+    ----------
+    level : int, optional
+        the compression level. Default is `default_level` of the codec.
+    threads : int, default=1
+        the number of the compression threads, if supported by the codec
+    """
+
+    subclasses_dict: Dict[str, Type["Codec"]] = {}
+    name: str
+    # the suffix of the archive
+    suffix: str
+    default_level: Optional[int] = None
+    # the command-line program of the codec
+    program: Optional[str] = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        Codec.subclasses_dict[cls.name] = cls
+
+    def __init__(self, level: Optional[int] = None, threads: int = 1) -> None:
+        self.level = self.default_level if level is None else level
+        self.threads = threads
+
+    @classmethod
+    def get_codec(
+        cls, name: str, level: Optional[int] = None, threads: int = 1
+    ) -> "Codec":
+        """Get the codec by its name.
+
+        Parameters
+        ----------
+        name : str
+            the name of the codec, e.g. none, gzip, zstd and lz4
+        level : int, optional
+            the compression level
+        threads : int, default=1
+            the number of the compression threads
+
+        Returns
+        -------
+        Codec
+            the codec
+        """
+        try:
+            codec_class = cls.subclasses_dict[name]
+        except KeyError as e:
+            raise RuntimeError(
+                f"unknown compression codec {name}; supported codecs: {', '.join(cls.subclasses_dict)}"
+            ) from e
+        return codec_class(level=level, threads=threads)
+
+    def get_command(self) -> List[str]:
+        """Get the command to compress stdin to stdout; `-d` is appended to decompress."""
+        raise NotImplementedError("abstract method")
+
+    @property
+    def remote_program(self) -> Optional[str]:
+        """The program required on the remote by `get_tar_option`, if any."""
+        return self.program
+
+    def get_tar_option(self, extract: bool = False) -> str:
+        """Get the option of `tar` to use the codec on the remote.
+
+        Parameters
+        ----------
+        extract : bool, default=False
+            whether to extract the archive
+
+        Returns
+        -------
+        str
+            the option
+        """
+        # bsdtar reads -I as -T, and does not append -d to the program when
+        # extracting, unlike GNU tar, which accepts a duplicated -d
+        command = self.get_command() + (["-d"] if extract else [])
+        return f"--use-compress-program={shlex.quote(_join_command(command))}"
+
+    def _check_program(self) -> None:
+        assert self.program is not None
+        if shutil.which(self.program) is None:
+            raise RuntimeError(
+                f"{self.program} is not found, which is required by the {self.name} codec"
+            )
+
+    @contextlib.contextmanager
+    def open_writer(self, fileobj: BinaryIO) -> Iterator[BinaryIO]:
+        """Open a file, where the data written are compressed into `fileobj`.
+
+        Parameters
+        ----------
+        fileobj : BinaryIO
+            the file of the compressed data
+
+        Yields
+        ------
+        BinaryIO
+            the file to write the uncompressed data
+        """
+        self._check_program()
+        with _pipe(self.get_command(), fileobj, write=True) as f:
+            yield f
+
+    @contextlib.contextmanager
+    def open_reader(self, fileobj: BinaryIO) -> Iterator[BinaryIO]:
+        """Open a file, where the data read are decompressed from `fileobj`.
+
+        Parameters
+        ----------
+        fileobj : BinaryIO
+            the file of the compressed data
+
+        Yields
+        ------
+        BinaryIO
+            the file to read the uncompressed data
+        """
+        self._check_program()
+        with _pipe(self.get_command() + ["-d"], fileobj, write=False) as f:
+            yield f
+
+
+class NoneCodec(Codec):
+    """Do not compress the archives."""
+
+    name = "none"
+    suffix = ".tar"
+
+    @property
+    def remote_program(self) -> Optional[str]:
+        return None
+
+    def get_tar_option(self, extract: bool = False) -> str:
+        return ""
+
+    @contextlib.contextmanager
+    def open_writer(self, fileobj: BinaryIO) -> Iterator[BinaryIO]:
+        yield fileobj
+
+    @contextlib.contextmanager
+    def open_reader(self, fileobj: BinaryIO) -> Iterator[BinaryIO]:
+        yield fileobj
+
+
+class GzipCodec(Codec):
+    """Compress the archives by gzip, or pigz with multiple threads."""
+
+    name = "gzip"
+    suffix = ".tgz"
+    default_level = 6
+
+    @property
+    def program(self) -> str:
+        return "pigz" if self.threads > 1 else "gzip"
+
+    @property
+    def remote_program(self) -> Optional[str]:
+        if self.threads == 1 and self.level == self.default_level:
+            return None
+        return self.program
+
+    def get_tar_option(self, extract: bool = False) -> str:
+        if self.remote_program is None:
+            # tar -z is supported everywhere
+            return "-z"
+        return super().get_tar_option(extract=extract)
+
+    def get_command(self) -> List[str]:
+        if self.threads > 1:
+            return ["pigz", "-c", "-p", str(self.threads), f"-{self.level}"]
+        return ["gzip", "-c", f"-{self.level}"]
+
+    @contextlib.contextmanager
+    def open_writer(self, fileobj: BinaryIO) -> Iterator[BinaryIO]:
+        if self.threads > 1 and shutil.which("pigz") is not None:
+            with super().open_writer(fileobj) as f:
+                yield f
+            return
+        with gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=self.level) as f:
+            yield f
+
+    @contextlib.contextmanager
+    def open_reader(self, fileobj: BinaryIO) -> Iterator[BinaryIO]:
+        # decompression by gzip can not use multiple threads
+        with gzip.GzipFile(fileobj=fileobj, mode="rb") as f:
+            yield f
+
+
+class ZstdCodec(Codec):
+    """Compress the archives by zstd."""
+
+    name = "zstd"
+    suffix = ".tar.zst"
+    default_level = 3
+    program = "zstd"
+
+    def get_command(self) -> List[str]:
+        return ["zstd", "-c", "-q", f"-{self.level}", f"-T{self.threads}"]
+
+
+class Lz4Codec(Codec):
+    """Compress the archives by lz4, which does not support multiple threads."""
+
+    name = "lz4"
+    suffix = ".tar.lz4"
+    default_level = 1
+    program = "lz4"
+
+    def get_command(self) -> List[str]:
+        return ["lz4", "-c", "-q", f"-{self.level}"]
+
+
+def _join_command(command: List[str]) -> str:
+    return " ".join(shlex.quote(arg) for arg in command)
+
+
+@contextlib.contextmanager
+def _pipe(command: List[str], fileobj: BinaryIO, write: bool) -> Iterator[BinaryIO]:
+    """Run the command with `fileobj` as its stdout (write) or stdin (read).
+
+    `fileobj` may not have a file descriptor (e.g. an SSH channel), so it
+    is copied from or to the pipe in a thread.
+    """
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    assert proc.stdin is not None and proc.stdout is not None
+    errors = []
+
+    def copy(src, dst, close=None):
+        try:
+            shutil.copyfileobj(src, dst)
+        except Exception as e:
+            errors.append(e)
+            # the process would block on the pipe no longer read or written,
+            # and so would the caller
+            proc.kill()
+        finally:
+            if close is not None:
+                close.close()
+
+    if write:
+        thread = threading.Thread(target=copy, args=(proc.stdout, fileobj))
+    else:
+        thread = threading.Thread(
+            target=copy, args=(fileobj, proc.stdin), kwargs={"close": proc.stdin}
+        )
+    thread.start()
+    try:
+        try:
+            yield proc.stdin if write else proc.stdout
+        finally:
+            if write:
+                proc.stdin.close()
+            else:
+                # the reader may stop before the end; drain the output so that
+                # the feeding thread is not blocked
+                while proc.stdout.read(1 << 16):
+                    pass
+    except OSError:
+        # the pipe is broken once the process is killed by the failed copy,
+        # whose error is raised instead
+        if not errors:
+            raise
+    finally:
+        thread.join()
+        proc.stdout.close()
+        ret = proc.wait()
+    if errors:
+        raise errors[0]
+    if ret != 0:
+        raise RuntimeError(
+            f"command {_join_command(command)} fails with return code {ret}"
+        )
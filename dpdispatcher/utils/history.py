@@ -0,0 +1,277 @@
+import json
+import sqlite3
+import statistics
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+from dpdispatcher.dlog import dlog
+
+
+class RuntimeHistory:
+    """Store the runtime history of tasks in a local SQLite database.
+
+    Each record contains the wall time, the queue wait and the exit status
+    of a task, keyed by the normalized command of the task and the signature
+    of the machine and resources it ran with. The records are used to
+    estimate the cost of future tasks, e.g. for `Task.cost`.
+
+    Parameters
+    ----------
+    path : str or Path, optional
+        the path of the database. Default is `~/.dpdispatcher/history.sqlite3`.
+    window : int, default=20
+        the number of the latest records used in the estimation
+    """
+
+    def __init__(
+        self, path: Optional[Union[str, Path]] = None, window: int = 20
+    ) -> None:
+        if path is None:
+            path = Path.home() / ".dpdispatcher" / "history.sqlite3"
+        self.path = Path(path)
+        self.window = window
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        if not self._initialized:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS task_runtime ("
+                    "command TEXT NOT NULL, signature TEXT NOT NULL, "
+                    "wall_time REAL NOT NULL, queue_wait REAL, "
+                    "exit_status INTEGER NOT NULL, timestamp REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS task_runtime_key "
+                    "ON task_runtime (command, signature, timestamp)"
+                )
+            self._initialized = True
+        return conn
+
+    @staticmethod
+    def normalize_command(command: str) -> str:
+        """Normalize the command of a task, so that the whitespaces do not matter.
+
+        Parameters
+        ----------
+        command : str
+            the command
+
+        Returns
+        -------
+        str
+            the normalized command
+        """
+        return " ".join(command.split())
+
+    @staticmethod
+    def get_signature(machine, resources) -> str:
+        """Get the signature of the machine and the resources a task runs with.
+
+        Parameters
+        ----------
+        machine : Machine
+            the machine
+        resources : Resources
+            the resources
+
+        Returns
+        -------
+        str
+            the signature
+        """
+        return json.dumps(
+            {
+                "batch_type": machine.__class__.__name__,
+                "number_node": resources.number_node,
+                "cpu_per_node": resources.cpu_per_node,
+                "gpu_per_node": resources.gpu_per_node,
+                "queue_name": resources.queue_name,
+                "custom_flags": resources.custom_flags,
+                "para_deg": resources.para_deg,
+            },
+            sort_keys=True,
+        )
+
+    def add(
+        self,
+        command: str,
+        signature: str,
+        wall_time: float,
+        queue_wait: Optional[float] = None,
+        exit_status: int = 0,
+    ) -> None:
+        """Add a record.
+
+        Parameters
+        ----------
+        command : str
+            the command of the task
+        signature : str
+            the signature of the machine and resources, see `get_signature`
+        wall_time : float
+            the wall time of the task in seconds
+        queue_wait : float, optional
+            the time in seconds that the task waited in the queue
+        exit_status : int, default=0
+            0 if the task succeeded, otherwise non-zero
+        """
+        self.add_many([(command, signature, wall_time, queue_wait, exit_status)])
+
+    def add_many(
+        self, records: Iterable[Tuple[str, str, float, Optional[float], int]]
+    ) -> None:
+        """Add the records in one transaction.
+
+        Parameters
+        ----------
+        records : Iterable[tuple[str, str, float, float or None, int]]
+            the command, the signature, the wall time, the queue wait and the
+            exit status of each record, see `add`
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT INTO task_runtime VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        self.normalize_command(command),
+                        signature,
+                        wall_time,
+                        queue_wait,
+                        exit_status,
+                        now,
+                    )
+                    for command, signature, wall_time, queue_wait, exit_status in records
+                ),
+            )
+
+    def record_jobs(self, jobs, tasks: Optional[Dict[str, Any]] = None) -> None:
+        """Record the tasks run by the finished or terminated jobs.
+
+        The start time, the end time and the exit status of each task are
+        written by the job script, see `Job.get_task_times`. The queue wait is
+        the time from the submission of the job to the start of its first
+        task, which assumes that the clocks of the local and remote machines
+        are in sync.
+
+        Parameters
+        ----------
+        jobs : list[Job]
+            the jobs
+        tasks : dict[str, Task], optional
+            the tasks keyed by their hashes, including the tasks that the jobs
+            may steal from other jobs. Default is the tasks of the jobs.
+        """
+        if tasks is None:
+            tasks = {task.task_hash: task for job in jobs for task in job.job_task_list}
+        records = []
+        for job in jobs:
+            task_times = job.get_task_times()
+            if not task_times:
+                continue
+            signature = self.get_signature(job.machine, job.resources)
+            queue_wait = None
+            if job.submit_time is not None:
+                queue_wait = max(
+                    min(start for _, start, _, _ in task_times) - job.submit_time, 0.0
+                )
+            for task_hash, start, end, exit_status in task_times:
+                task = tasks.get(task_hash)
+                if task is not None:
+                    records.append(
+                        (task.command, signature, end - start, queue_wait, exit_status)
+                    )
+        if not records:
+            return
+        try:
+            self.add_many(records)
+        except sqlite3.Error as e:
+            # never fail a submission because of the history
+            dlog.warning(f"failed to record the runtime history: {e}")
+
+    def _query(self, column: str, command: str, signature: str) -> Optional[float]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT {column} FROM task_runtime "
+                "WHERE command = ? AND signature = ? AND exit_status = 0 "
+                f"AND {column} IS NOT NULL "
+                "ORDER BY timestamp DESC LIMIT ?",
+                (self.normalize_command(command), signature, self.window),
+            ).fetchall()
+        if not rows:
+            return None
+        return statistics.median(row[0] for row in rows)
+
+    def estimate_cost(
+        self, task, machine, resources, default: Optional[float] = None
+    ) -> Optional[float]:
+        """Estimate the wall time of a task from the history.
+
+        Parameters
+        ----------
+        task : Task
+            the task
+        machine : Machine
+            the machine that the task will run on
+        resources : Resources
+            the resources that the task will run with
+        default : float, optional
+            the value returned if there is no record
+
+        Returns
+        -------
+        float or None
+            the median wall time in seconds of the latest successful records
+
+        Examples
+        --------
+        The estimation can be used to group tasks; note that the jobs (and the
+        submission hash) then change as the history grows::
+
+            submission.generate_jobs(
+                cost_func=lambda task: runtime_history.estimate_cost(
+                    task, machine, resources, default=1.0
+                )
+            )
+        """
+        cost = self._query(
+            "wall_time", task.command, self.get_signature(machine, resources)
+        )
+        return default if cost is None else cost
+
+    def estimate_queue_wait(
+        self, task, machine, resources, default: Optional[float] = None
+    ) -> Optional[float]:
+        """Estimate the time that a task will wait in the queue from the history.
+
+        Parameters
+        ----------
+        task : Task
+            the task
+        machine : Machine
+            the machine that the task will run on
+        resources : Resources
+            the resources that the task will run with
+        default : float, optional
+            the value returned if there is no record
+
+        Returns
+        -------
+        float or None
+            the median queue wait in seconds of the latest successful records
+        """
+        queue_wait = self._query(
+            "queue_wait", task.command, self.get_signature(machine, resources)
+        )
+        return default if queue_wait is None else queue_wait
+
+
+# the history object can be globally used
+runtime_history = RuntimeHistory()
+__all__ = ["runtime_history", "RuntimeHistory"]
@@ -0,0 +1,240 @@
+"""Write and read large JSON documents piece by piece.
+
+The submission state contains all the jobs and tasks. Instead of building
+the whole dict tree and one giant string, the state is dumped job by job
+with :func:`iter_json`, and loaded with :func:`load_json_stream`, which
+converts the items of the job array one at a time.
+"""
+
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+
+class JSONStreamObject(dict):
+    """A JSON object whose values may be :class:`JSONStreamArray`.
+
+    Plain dicts and lists are dumped at once by :func:`json.dumps`; only
+    the containers marked by this class are dumped piece by piece.
+    """
+
+
+class JSONStreamArray:
+    """A JSON array whose items are produced lazily when dumped.
+
+    Parameters
+    ----------
+    items : Iterable
+        the items, which are iterated only once
+    """
+
+    def __init__(self, items: Iterable) -> None:
+        self.items = items
+
+
+def iter_json(
+    obj: Any,
+    indent: Optional[int] = None,
+    default: Optional[Callable[[Any], Any]] = None,
+    _level: int = 0,
+) -> Iterator[str]:
+    """Dump the object to JSON piece by piece.
+
+    The joined pieces are the same as `json.dumps(obj, indent=indent, default=default)`
+    if the stream containers are replaced by dicts and lists.
+
+    Parameters
+    ----------
+    obj : Any
+        the object, which may contain :class:`JSONStreamObject` and
+        :class:`JSONStreamArray`
+    indent : int, optional
+        the indent, the same as `json.dumps`
+    default : Callable, optional
+        the function for the objects that can not be serialized, the same as `json.dumps`
+
+    Yields
+    ------
+    str
+        the pieces of the JSON document
+    """
+    if isinstance(obj, JSONStreamObject):
+        pairs = ((json.dumps(key) + ": ", value) for key, value in obj.items())
+        begin, end = "{", "}"
+    elif isinstance(obj, JSONStreamArray):
+        pairs = (("", value) for value in obj.items)
+        begin, end = "[", "]"
+    else:
+        dumped = json.dumps(obj, indent=indent, default=default)
+        if indent is not None and _level:
+            dumped = dumped.replace("\n", "\n" + " " * (indent * _level))
+        yield dumped
+        return
+    if indent is None:
+        item_separator = ", "
+        newline = inner_newline = ""
+    else:
+        item_separator = ","
+        newline = "\n" + " " * (indent * _level)
+        inner_newline = "\n" + " " * (indent * (_level + 1))
+    empty = True
+    for prefix, value in pairs:
+        yield (begin if empty else item_separator) + inner_newline + prefix
+        empty = False
+        yield from iter_json(value, indent=indent, default=default, _level=_level + 1)
+    yield begin + end if empty else newline + end
+
+
+def join_chunks(pieces: Iterable[str], chunk_size: int = 1 << 20) -> Iterator[str]:
+    """Join the small pieces into chunks of about `chunk_size` characters.
+
+    Parameters
+    ----------
+    pieces : Iterable[str]
+        the pieces, e.g. from :func:`iter_json`
+    chunk_size : int, default=1 MiB
+        the minimum size of each chunk except the last one
+
+    Yields
+    ------
+    str
+        the chunks
+    """
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+class _StreamDecoder:
+    """Decode the JSON values from the chunks of a document."""
+
+    _whitespace = " \t\n\r"
+    # the characters that continue a number
+    _number_chars = ".eE+-0123456789"
+
+    def __init__(self, chunks: Iterable[str]) -> None:
+        self.chunks = iter(chunks)
+        self.buffer = ""
+        self.pos = 0
+        self.exhausted = False
+        self.decoder = json.JSONDecoder()
+
+    def _read(self, size: int) -> bool:
+        """Read at least `size` more characters; False if nothing can be read."""
+        # drop the decoded part
+        self.buffer = self.buffer[self.pos :]
+        self.pos = 0
+        read = []
+        n_read = 0
+        while n_read < size and not self.exhausted:
+            try:
+                chunk = next(self.chunks)
+            except StopIteration:
+                self.exhausted = True
+                break
+            read.append(chunk)
+            n_read += len(chunk)
+        self.buffer += "".join(read)
+        return n_read > 0
+
+    def peek(self) -> str:
+        """Skip the whitespaces and get the next character, or "" at the end."""
+        while True:
+            while (
+                self.pos < len(self.buffer)
+                and self.buffer[self.pos] in self._whitespace
+            ):
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._read(1):
+                return self.buffer[self.pos : self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        """Consume the next character, which must be one of `chars`."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(
+                f"Expecting one of {chars!r}", self.buffer, self.pos
+            )
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        """Decode the next value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number may continue in the next chunk, e.g. "1." + "5"
+                if self.exhausted or (
+                    end < len(self.buffer)
+                    and not (
+                        isinstance(value, (int, float))
+                        and self.buffer[end] in self._number_chars
+                    )
+                ):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            # double the buffer, so that a large value is decoded a few times
+            self._read(max(len(self.buffer) - self.pos, 1 << 16))
+
+
+def load_json_stream(
+    chunks: Iterable[str],
+    item_hooks: Optional[Dict[str, Callable[[Any, dict], Any]]] = None,
+) -> dict:
+    """Load a JSON object from the chunks of the document.
+
+    The items of the top-level arrays named in `item_hooks` are decoded one
+    at a time and converted by the hooks, so that only the converted items
+    are kept in memory.
+
+    Parameters
+    ----------
+    chunks : Iterable[str]
+        the chunks of the JSON document
+    item_hooks : dict[str, Callable], optional
+        the hook for each key, called with the item and the object loaded
+        so far (the keys before this key)
+
+    Returns
+    -------
+    dict
+        the object, where the arrays of `item_hooks` are lists of the converted items
+    """
+    if item_hooks is None:
+        item_hooks = {}
+    decoder = _StreamDecoder(chunks)
+    obj = {}
+    decoder.expect("{")
+    if decoder.peek() == "}":
+        decoder.pos += 1
+        return obj
+    while True:
+        key = decoder.value()
+        decoder.expect(":")
+        hook = item_hooks.get(key)
+        if hook is None:
+            obj[key] = decoder.value()
+        else:
+            items = []
+            decoder.expect("[")
+            if decoder.peek() == "]":
+                decoder.pos += 1
+            else:
+                while True:
+                    items.append(hook(decoder.value(), obj))
+                    if decoder.expect(",]") == "]":
+                        break
+            obj[key] = items
+        if decoder.expect(",}") == "}":
+            return obj
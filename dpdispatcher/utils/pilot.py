@@ -0,0 +1,393 @@
+import copy
+import json
+import shlex
+import threading
+import uuid
+from hashlib import sha1
+from typing import Dict, List, Optional, Tuple
+
+from dpdispatcher.dlog import dlog
+from dpdispatcher.utils.job_status import JobStatus
+from dpdispatcher.utils.poller import StatusPoller
+
+pilot_worker_template = """\
+#!/bin/bash
+# usage: worker.sh WORKER_ID IDLE_TIMEOUT
+WORKER_ID=$1
+IDLE_TIMEOUT=$2
+cd "$(dirname "$0")" || exit 1
+idle=0
+while true; do
+  claimed=""
+  for f in queue/*; do
+    [ -f "$f" ] || continue
+    name=$(basename "$f")
+    # rename is atomic: only one worker claims the job
+    if mv "$f" "running/$name.$WORKER_ID" 2>/dev/null; then
+      claimed=$name
+      break
+    fi
+  done
+  if [ -z "$claimed" ]; then
+    if [ $idle -ge $IDLE_TIMEOUT ]; then
+      break
+    fi
+    sleep {poll_interval}
+    idle=$((idle + {poll_interval}))
+    continue
+  fi
+  idle=0
+  bash "running/$claimed.$WORKER_ID" > "logs/$claimed.log" 2>&1
+  touch "done/$claimed.$?"
+  rm -f "running/$claimed.$WORKER_ID"
+done
+"""
+
+
+class Pilot:
+    """Run jobs in long-lived pilot jobs instead of submitting them to the scheduler.
+
+    The pilot jobs are submitted by the machine like other jobs. Each of them
+    runs a worker, which pulls the scripts of the jobs from a queue directory
+    on the remote filesystem, and exits after `idle_timeout` seconds without
+    any job. The jobs of later submissions with the same resources are run
+    by the same pilot jobs, without new scheduler submissions.
+
+    The queue directory `dpdispatcher_pilot/<signature>` contains:
+
+    - `queue/<job_hash>`: the command to run a job;
+    - `running/<job_hash>.<worker_id>`: the job being run by a worker;
+    - `done/<job_hash>.<exit_code>`: the job that has exited;
+    - `logs/<job_hash>.log`: the output of the job.
+
+    The scripts of the pilot jobs are also in the queue directory, as the
+    remote root of a submission may be cleaned while the pilot jobs wait.
+
+    Parameters
+    ----------
+    machine : Machine
+        the machine to submit the pilot jobs
+    resources : Resources
+        the resources of the pilot jobs
+    idle_timeout : int, default=600
+        the seconds that a worker waits for new jobs before it exits
+    workers : int, default=1
+        the number of the pilot jobs
+    """
+
+    poll_interval = 2
+
+    def __init__(
+        self, machine, resources, idle_timeout: int = 600, workers: int = 1
+    ) -> None:
+        self.machine = machine
+        self.idle_timeout = idle_timeout
+        self.workers = workers
+        self.pilot_dir = self.get_pilot_dir(machine, resources)
+        # the resources of the pilot jobs: one worker per job
+        self.resources = copy.deepcopy(resources)
+        self.resources.para_deg = 1
+        self.resources.strategy = {
+            "if_cuda_multi_devices": False,
+            "ratio_unfinished": 0.0,
+            **{
+                key: value
+                for key, value in resources.strategy.items()
+                if key == "customized_script_header_template_file"
+            },
+        }
+        self.pilot_jobs = []
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_signature(machine, resources) -> str:
+        """Get the signature of the allocation requested by the resources.
+
+        Parameters
+        ----------
+        machine : Machine
+            the machine
+        resources : Resources
+            the resources
+
+        Returns
+        -------
+        str
+            the signature
+        """
+        return sha1(
+            json.dumps(
+                {
+                    "batch_type": machine.__class__.__name__,
+                    "number_node": resources.number_node,
+                    "cpu_per_node": resources.cpu_per_node,
+                    "gpu_per_node": resources.gpu_per_node,
+                    "queue_name": resources.queue_name,
+                    "custom_flags": resources.custom_flags,
+                    "kwargs": resources.kwargs,
+                    "customized_script_header_template_file": resources.strategy.get(
+                        "customized_script_header_template_file"
+                    ),
+                },
+                sort_keys=True,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    @classmethod
+    def get_pilot_dir(cls, machine, resources) -> str:
+        """Get the queue directory of the pilot jobs on the remote filesystem.
+
+        Parameters
+        ----------
+        machine : Machine
+            the machine
+        resources : Resources
+            the resources
+
+        Returns
+        -------
+        str
+            the absolute path of the queue directory
+        """
+        context = machine.context
+        root = getattr(context, "temp_remote_root", None) or context.remote_root
+        return f"{root}/dpdispatcher_pilot/{cls.get_signature(machine, resources)}"
+
+    def _block_checkcall(self, cmd: str) -> str:
+        ret, stdin, stdout, stderr = self.machine.context.block_call(cmd)
+        if ret != 0:
+            err_str = stderr.read().decode("utf-8")
+            raise RuntimeError(
+                f"command {cmd} fails to execute\nerror message:{err_str}\nreturn code {ret}\n"
+            )
+        return stdout.read().decode("utf-8")
+
+    def _init_pilot_dir(self) -> None:
+        if self._initialized:
+            return
+        pilot_dir = shlex.quote(self.pilot_dir)
+        eof = f"DPDISPATCHER_EOF_{uuid.uuid4().hex}"
+        self._block_checkcall(
+            f"mkdir -p {pilot_dir}/queue {pilot_dir}/running {pilot_dir}/done {pilot_dir}/logs"
+            f" && cat > {pilot_dir}/worker.sh <<'{eof}'\n"
+            + pilot_worker_template.format(poll_interval=self.poll_interval)
+            + f"{eof}\n"
+        )
+        self._initialized = True
+
+    def get_pilot_machine(self):
+        """Get the machine of the pilot jobs, whose remote root is the queue directory.
+
+        Returns
+        -------
+        Machine
+            a copy of the machine with a copy of its context
+        """
+        context = copy.copy(self.machine.context)
+        context.remote_root = self.pilot_dir
+        machine = copy.copy(self.machine)
+        machine.context = context
+        return machine
+
+    def submit_pilot_job(self):
+        """Submit a pilot job to the scheduler.
+
+        Returns
+        -------
+        Job
+            the pilot job
+        """
+        # avoid circular import
+        from dpdispatcher.submission import Job, Task
+
+        self._init_pilot_dir()
+        worker_id = uuid.uuid4().hex
+        task = Task(
+            command=f"bash {shlex.quote(self.pilot_dir)}/worker.sh {worker_id} {self.idle_timeout}",
+            task_work_path="./",
+        )
+        pilot_job = Job(
+            job_task_list=[task],
+            resources=self.resources,
+            machine=self.get_pilot_machine(),
+        )
+        pilot_job.worker_id = worker_id
+        pilot_job.submit_job()
+        dlog.info(f"pilot job {pilot_job.job_id} was submitted")
+        return pilot_job
+
+    def ensure_pilot_jobs(self) -> List[str]:
+        """Submit the pilot jobs until there are `workers` pilot jobs in the queue.
+
+        The pilot jobs that have exited (e.g. idle timeout or wall time
+        limit) are replaced. The completing pilot jobs are kept, as their
+        workers may still be running jobs.
+
+        Returns
+        -------
+        list[str]
+            the worker ids of the pilot jobs in the queue
+        """
+        with self._lock:
+            pilot_machine = self.get_pilot_machine()
+            for pilot_job in self.pilot_jobs:
+                pilot_job.machine = pilot_machine
+            states = (
+                pilot_machine.check_status_batch(self.pilot_jobs)
+                if self.pilot_jobs
+                else []
+            )
+            self.pilot_jobs = [
+                pilot_job
+                for pilot_job, state in zip(self.pilot_jobs, states)
+                if state in (JobStatus.waiting, JobStatus.running, JobStatus.completing)
+            ]
+            while len(self.pilot_jobs) < self.workers:
+                pilot_job = self.submit_pilot_job()
+                if pilot_job.job_state != JobStatus.waiting:
+                    dlog.warning("failed to submit the pilot job")
+                    break
+                self.pilot_jobs.append(pilot_job)
+            return [pilot_job.worker_id for pilot_job in self.pilot_jobs]
+
+    def submit(self, job) -> str:
+        """Put the job into the queue of the pilot jobs.
+
+        Parameters
+        ----------
+        job : Job
+            the job
+
+        Returns
+        -------
+        str
+            the job id
+        """
+        self._init_pilot_dir()
+        context = self.machine.context
+        context.write_file(
+            fname=job.script_file_name, write_str=self.machine.gen_script(job)
+        )
+        context.write_file(
+            fname=f"{job.script_file_name}.run",
+            write_str=self.machine.gen_script_command(job),
+        )
+        pilot_dir = shlex.quote(self.pilot_dir)
+        job_cmd = (
+            f"cd {shlex.quote(str(context.remote_root))} && bash {job.script_file_name}"
+        )
+        self._block_checkcall(
+            f"cd {pilot_dir} && rm -f done/{job.job_hash}.* running/{job.job_hash}.*"
+            f" && echo {shlex.quote(job_cmd)} > queue/.{job.job_hash}"
+            f" && mv queue/.{job.job_hash} queue/{job.job_hash}"
+        )
+        if not self.pilot_jobs:
+            # the expired pilot jobs are replaced when checking the job states
+            self.ensure_pilot_jobs()
+        return f"pilot:{job.job_hash}"
+
+    def check_status_batch(self, jobs) -> List[JobStatus]:
+        """Check the states of the jobs in the queue of the pilot jobs.
+
+        Parameters
+        ----------
+        jobs : list[Job]
+            the jobs
+
+        Returns
+        -------
+        list[JobStatus]
+            the state of each job
+        """
+        self._init_pilot_dir()
+        output = self._block_checkcall(
+            f"cd {shlex.quote(self.pilot_dir)} && find queue running done -maxdepth 1 -type f -name '[!.]*'"
+        )
+        queued = set()
+        running: Dict[str, str] = {}
+        done: Dict[str, str] = {}
+        for line in output.splitlines():
+            directory, _, name = line.strip().partition("/")
+            if directory == "queue":
+                queued.add(name)
+            elif directory == "running":
+                job_hash, _, worker_id = name.rpartition(".")
+                running[job_hash] = worker_id
+            elif directory == "done":
+                job_hash, _, exit_code = name.rpartition(".")
+                done[job_hash] = exit_code
+        worker_ids = None
+        job_states = []
+        for job in jobs:
+            if job.job_id == "":
+                job_state = JobStatus.unsubmitted
+            elif job.job_hash in done:
+                if done[job.job_hash] == "0" and self.machine.check_finish_tag(job):
+                    job_state = JobStatus.finished
+                else:
+                    job_state = JobStatus.terminated
+            elif job.job_hash in running or job.job_hash in queued:
+                if worker_ids is None:
+                    # resubmit the expired pilot jobs
+                    worker_ids = self.ensure_pilot_jobs()
+                if job.job_hash in queued:
+                    job_state = JobStatus.waiting
+                elif running[job.job_hash] in worker_ids:
+                    job_state = JobStatus.running
+                else:
+                    # the pilot job has expired
+                    job_state = JobStatus.terminated
+            else:
+                job_state = JobStatus.terminated
+            job_states.append(job_state)
+        return job_states
+
+    def kill(self, job) -> None:
+        """Remove the job from the queue; the running job is not killed.
+
+        Parameters
+        ----------
+        job : Job
+            the job
+        """
+        self.machine.context.block_call(
+            f"rm -f {shlex.quote(self.pilot_dir)}/queue/{job.job_hash}"
+        )
+
+
+_pilots: Dict[Tuple[Tuple[str, str, str], str], Pilot] = {}
+_pilots_lock = threading.Lock()
+
+
+def get_pilot(machine, resources) -> Optional[Pilot]:
+    """Get the pilot shared by the submissions with the same machine and resources.
+
+    Parameters
+    ----------
+    machine : Machine
+        the machine
+    resources : Resources
+        the resources, with `strategy['pilot']`
+
+    Returns
+    -------
+    Pilot or None
+        the pilot, or None if the pilot mode is not enabled
+    """
+    pilot_config = resources.strategy.get("pilot")
+    if not pilot_config:
+        return None
+    key = (StatusPoller.get_key(machine), Pilot.get_pilot_dir(machine, resources))
+    with _pilots_lock:
+        if key not in _pilots:
+            _pilots[key] = Pilot(
+                machine,
+                resources,
+                idle_timeout=pilot_config.get("idle_timeout", 600),
+                workers=pilot_config.get("workers", 1),
+            )
+        pilot = _pilots[key]
+        # the machine (and its context) of the latest submission
+        pilot.machine = machine
+        return pilot
@@ -0,0 +1,217 @@
+import getpass
+import random
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from dpdispatcher.dlog import dlog
+from dpdispatcher.utils.job_status import JobStatus
+
+
+class _PollerChannel:
+    """The shared scheduler states of one (machine type, host, user)."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # id of submission -> (submission, check interval)
+        self.submissions = {}
+        self.job_states: Dict[str, JobStatus] = {}
+        self.queried_job_ids = set()
+        self.query_time = None
+
+
+class StatusPoller:
+    """Share the scheduler queries among the submissions running in one process.
+
+    Submissions running against the same scheduler (the same machine type,
+    host and user) are registered to the same channel. When a submission
+    checks its jobs, the job states queried by another submission within
+    the check interval are reused; otherwise the scheduler is queried once
+    for the unfinished jobs of all the registered submissions.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._channels: Dict[Tuple[str, str, str], _PollerChannel] = {}
+
+    @staticmethod
+    def get_key(machine) -> Tuple[str, str, str]:
+        """Get the key of the scheduler that the machine submits jobs to.
+
+        Parameters
+        ----------
+        machine : Machine
+            the machine
+
+        Returns
+        -------
+        tuple[str, str, str]
+            machine type, host and user
+        """
+        remote_profile = getattr(machine.context, "remote_profile", None) or {}
+        host = remote_profile.get("hostname") or socket.gethostname()
+        user = remote_profile.get("username") or getpass.getuser()
+        return (machine.__class__.__name__, host, user)
+
+    def _get_channel(self, machine) -> _PollerChannel:
+        key = self.get_key(machine)
+        with self._lock:
+            if key not in self._channels:
+                self._channels[key] = _PollerChannel()
+            return self._channels[key]
+
+    def register(self, submission, check_interval: float) -> None:
+        """Register a submission, so its jobs are queried together with others.
+
+        Parameters
+        ----------
+        submission : Submission
+            the submission
+        check_interval : float
+            the interval in seconds that the submission checks its jobs
+        """
+        channel = self._get_channel(submission.machine)
+        with channel.lock:
+            channel.submissions[id(submission)] = (submission, check_interval)
+
+    def unregister(self, submission) -> None:
+        """Unregister a submission.
+
+        Parameters
+        ----------
+        submission : Submission
+            the submission
+        """
+        channel = self._get_channel(submission.machine)
+        with channel.lock:
+            channel.submissions.pop(id(submission), None)
+
+    def query_job_states(
+        self, machine, job_ids: List[str]
+    ) -> Optional[Dict[str, JobStatus]]:
+        """Query the scheduler states of the jobs, see `Machine.query_job_states`.
+
+        Parameters
+        ----------
+        machine : Machine
+            the machine used to query the scheduler
+        job_ids : list[str]
+            the job ids to query
+
+        Returns
+        -------
+        dict[str, JobStatus] or None
+            the scheduler states of the jobs, or None if batch query is not
+            supported by the machine
+        """
+        channel = self._get_channel(machine)
+        with channel.lock:
+            max_age = min(
+                (interval for _, interval in channel.submissions.values()), default=0.0
+            )
+            if (
+                channel.query_time is not None
+                and time.monotonic() - channel.query_time < max_age
+                and channel.queried_job_ids.issuperset(job_ids)
+            ):
+                dlog.debug(
+                    f"reuse the job states queried {time.monotonic() - channel.query_time:.1f} s ago"
+                )
+            else:
+                all_job_ids = set(job_ids)
+                for submission, _ in list(channel.submissions.values()):
+                    all_job_ids.update(
+                        str(job.job_id)
+                        for job in list(submission.belonging_jobs)
+                        if job.job_id != "" and job.job_state != JobStatus.finished
+                    )
+                all_job_ids = sorted(all_job_ids)
+                job_states = machine.query_job_states(all_job_ids)
+                if job_states is None:
+                    return None
+                channel.job_states = job_states
+                channel.queried_job_ids = set(all_job_ids)
+                channel.query_time = time.monotonic()
+            return {
+                job_id: channel.job_states[job_id]
+                for job_id in job_ids
+                if job_id in channel.job_states
+            }
+
+
+status_poller = StatusPoller()
+
+
+class PollPolicy:
+    """Adaptive interval between two checks of the job states.
+
+    The interval grows by `backoff` times after each check in which all the
+    unfinished jobs are still waiting in the queue, until `max_interval` is
+    reached. It goes back to `interval` as soon as any job is running or
+    completing, or the state of any job has changed. A random `jitter` is
+    applied to each interval, so that many dispatchers do not poll the
+    scheduler at the same time.
+
+    Parameters
+    ----------
+    interval : float
+        the minimal interval in seconds
+    max_interval : float, optional
+        the maximal interval in seconds. Default is 10 times of `interval`.
+    backoff : float, default=1.0
+        the factor to increase the interval. 1.0 means a fixed interval.
+    jitter : float, default=0.0
+        the relative range of the random jitter, e.g. 0.1 for +/-10%
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        max_interval: Optional[float] = None,
+        backoff: float = 1.0,
+        jitter: float = 0.0,
+    ) -> None:
+        if backoff < 1.0:
+            raise ValueError("backoff of check interval must be no smaller than 1.0")
+        if not 0.0 <= jitter < 1.0:
+            raise ValueError("jitter of check interval must be in [0.0, 1.0)")
+        self.min_interval = interval
+        if max_interval is None:
+            max_interval = 10 * interval
+        self.max_interval = max(interval, max_interval)
+        self.backoff = backoff
+        self.jitter = jitter
+        self.interval = interval
+        self._last_states = None
+
+    def update(self, job_states: List[Tuple[str, JobStatus]]) -> None:
+        """Adjust the interval according to the job states of the latest check.
+
+        Parameters
+        ----------
+        job_states : list[tuple[str, JobStatus]]
+            the job hash and job state of each job
+        """
+        unfinished_states = [
+            job_state for _, job_state in job_states if job_state != JobStatus.finished
+        ]
+        if job_states == self._last_states and all(
+            job_state == JobStatus.waiting for job_state in unfinished_states
+        ):
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        else:
+            self.interval = self.min_interval
+        self._last_states = job_states
+
+    def next_interval(self) -> float:
+        """Get the time to sleep before the next check.
+
+        Returns
+        -------
+        float
+            the interval in seconds
+        """
+        if self.jitter == 0.0:
+            return self.interval
+        return self.interval * random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
@@ -1,7 +1,8 @@
-import json
 from pathlib import Path
 from typing import List
 
+from dpdispatcher.utils.json_stream import iter_json
+
 
 class Record:
     """Record failed or canceled submissions."""
@@ -38,7 +39,9 @@ class Record:
             Path to submission data.
         """
         submission_path = self.record_directory / f"{submission.submission_hash}.json"
-        submission_path.write_text(json.dumps(submission.serialize(), indent=2))
+        with submission_path.open("w") as f:
+            for chunk in iter_json(submission.serialize_stream(), indent=2):
+                f.write(chunk)
         return submission_path
 
     def get_submission(self, hash: str, not_exist_ok: bool = False) -> Path:
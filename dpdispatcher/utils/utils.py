@@ -1,12 +1,17 @@
 import base64
 import hashlib
+import heapq
 import hmac
 import os
 import shlex
 import struct
 import subprocess
+import sys
+import threading
 import time
-from typing import TYPE_CHECKING, Callable, Optional, Type, Union
+import weakref
+from pathlib import PurePath
+from typing import TYPE_CHECKING, Callable, List, Optional, Sequence, Set, Type, Union
 
 from dpdispatcher.dlog import dlog
 
@@ -14,6 +19,73 @@ if TYPE_CHECKING:
     from dpdispatcher import Resources
 
 
+class _InternedList(list):
+    """An immutable list that can be referred weakly by the intern table.
+
+    The list is shared by many tasks, so it raises on in-place modification.
+    `+=` and `*=` return new lists instead, which are interned again when
+    assigned to a task.
+    """
+
+    __slots__ = ("__weakref__",)
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(
+            "the interned list is shared and can not be modified; assign a new list instead"
+        )
+
+    __setitem__ = __delitem__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __iadd__(self, other):
+        return list(self) + list(other)
+
+    def __imul__(self, n):
+        return list(self) * n
+
+    def __reduce__(self):
+        return intern_list, (list(self),)
+
+    def copy(self):
+        return list(self)
+
+
+_interned_lists: "weakref.WeakValueDictionary[tuple, _InternedList]" = (
+    weakref.WeakValueDictionary()
+)
+_interned_lists_lock = threading.Lock()
+
+
+def intern_list(items):
+    """Get the list shared by all the equal lists of strings.
+
+    The strings in the list are interned as well. The shared list raises
+    TypeError if modified in place. The list is released once it is no
+    longer used.
+
+    Parameters
+    ----------
+    items : list[str]
+        the list of strings, e.g. the forward files of a task
+
+    Returns
+    -------
+    list[str]
+        the shared list equal to items; items itself if it is not a list of strings
+    """
+    if isinstance(items, _InternedList):
+        return items
+    if not isinstance(items, list) or not all(isinstance(ii, str) for ii in items):
+        return items
+    key = tuple(items)
+    with _interned_lists_lock:
+        shared = _interned_lists.get(key)
+        if shared is None:
+            shared = _InternedList(sys.intern(ii) for ii in items)
+            _interned_lists[key] = shared
+    return shared
+
+
 def get_sha256(filename):
     """Get sha256 of a file.
 
@@ -154,6 +226,98 @@ def rsync(
         raise RuntimeError(f"Failed to run {cmd_str}: {err}")
 
 
+def find_finished_tags(root: str, max_depth: Optional[int] = None) -> Set[str]:
+    """Find the finish tags of jobs and tasks under a local directory.
+
+    Parameters
+    ----------
+    root : str
+        the directory to search
+    max_depth : int, optional
+        the maximum depth of the tags, where the tags in `root` have the depth 1
+
+    Returns
+    -------
+    set[str]
+        the posix paths of `*_tag_finished` files relative to `root`
+    """
+    tags = set()
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        depth = 0 if rel_dir == "." else len(PurePath(rel_dir).parts)
+        if max_depth is not None and depth + 1 >= max_depth:
+            # do not go deeper
+            dirnames[:] = []
+        for filename in filenames:
+            if filename.endswith("_tag_finished"):
+                tags.add(PurePath(rel_dir, filename).as_posix())
+    return tags
+
+
+def lpt_partition(
+    costs: Sequence[float], n_bins: int, capacity: int
+) -> List[List[int]]:
+    """Partition items into bins with balanced total costs.
+
+    The longest-processing-time-first rule is used: items are sorted by
+    their costs in descending order, and each item is put into the bin with
+    the smallest total cost that has fewer than `capacity` items. Ties are
+    broken by the indexes, so the result is deterministic.
+
+    Parameters
+    ----------
+    costs : sequence of float
+        the cost of each item
+    n_bins : int
+        the number of bins
+    capacity : int
+        the maximum number of items in a bin
+
+    Returns
+    -------
+    list[list[int]]
+        the indexes of the items in each non-empty bin, in the order that
+        they are put into the bin
+    """
+    if n_bins * capacity < len(costs):
+        raise ValueError("the bins can not hold all the items")
+    bins: List[List[int]] = [[] for _ in range(n_bins)]
+    # (total cost, bin index)
+    heap = [(0.0, ii) for ii in range(n_bins)]
+    for index in sorted(range(len(costs)), key=lambda ii: (-costs[ii], ii)):
+        load, bin_index = heapq.heappop(heap)
+        bins[bin_index].append(index)
+        if len(bins[bin_index]) < capacity:
+            heapq.heappush(heap, (load + costs[index], bin_index))
+    return [bb for bb in bins if bb]
+
+
+class RateLimiter:
+    """Limit the rate of an operation shared by multiple threads.
+
+    Parameters
+    ----------
+    rate : float
+        the maximum number of operations per second
+    """
+
+    def __init__(self, rate: float) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def acquire(self) -> None:
+        """Block until the next operation is allowed."""
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
 class RetrySignal(Exception):
     """Exception to give a signal to retry the function."""
 
@@ -1,4 +1,5 @@
 import hashlib
+import io
 import os
 import pathlib
 import sys
@@ -10,7 +11,11 @@ from dpdispatcher.base_context import BaseContext  # noqa: F401
 from dpdispatcher.contexts.hdfs_context import HDFSContext  # noqa: F401
 from dpdispatcher.contexts.lazy_local_context import LazyLocalContext  # noqa: F401
 from dpdispatcher.contexts.local_context import LocalContext  # noqa: F401
-from dpdispatcher.contexts.ssh_context import SSHContext, SSHSession  # noqa: F401
+from dpdispatcher.contexts.ssh_context import (  # noqa: F401
+    SSHContext,
+    SSHSession,
+    split_ranges,
+)
 
 # test backward compatibility with dflow
 from dpdispatcher.dpcloudserver.client import RequestInfoException as _  # noqa: F401
@@ -25,10 +30,21 @@ from dpdispatcher.machines.pbs import PBS  # noqa: F401
 from dpdispatcher.machines.shell import Shell  # noqa: F401
 from dpdispatcher.machines.slurm import Slurm  # noqa: F401
 from dpdispatcher.submission import Job, Resources, Submission, Task  # noqa: F401
+from dpdispatcher.utils.cache import ResultCache  # noqa: F401
+from dpdispatcher.utils.codec import Codec, is_compressed  # noqa: F401
 from dpdispatcher.utils.hdfs_cli import HDFS  # noqa: F401
+from dpdispatcher.utils.history import RuntimeHistory  # noqa: F401
 from dpdispatcher.utils.job_status import JobStatus  # noqa: F401
+from dpdispatcher.utils.json_stream import (  # noqa: F401
+    JSONStreamArray,
+    JSONStreamObject,
+    iter_json,
+    load_json_stream,
+)
+from dpdispatcher.utils.pilot import get_pilot  # noqa: F401
+from dpdispatcher.utils.poller import PollPolicy, StatusPoller  # noqa: F401
 from dpdispatcher.utils.record import record  # noqa: F401
-from dpdispatcher.utils.utils import RetrySignal, retry  # noqa: F401
+from dpdispatcher.utils.utils import RetrySignal, get_sha256, retry  # noqa: F401
 
 
 def setUpModule():
@@ -37,3 +53,18 @@ def setUpModule():
 
 def get_file_md5(file_path):
     return hashlib.md5(pathlib.Path(file_path).read_bytes()).hexdigest()
+
+
+def fake_block_call(outputs, calls):
+    """Get a fake `block_call` of the context, which returns the output of the
+    first command prefix matched, and records the commands in `calls`.
+    """
+
+    def block_call(cmd):
+        calls.append(cmd)
+        for prefix, (ret, stdout, stderr) in outputs.items():
+            if cmd.startswith(prefix):
+                return ret, None, io.BytesIO(stdout), io.BytesIO(stderr)
+        raise AssertionError(f"unexpected command {cmd}")
+
+    return block_call
@@ -0,0 +1,124 @@
+import os
+import stat
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+__package__ = "tests"
+
+from .context import (
+    JobStatus,
+    Machine,
+    Resources,
+    Submission,
+    Task,
+    setUpModule,  # noqa: F401
+)
+
+
+@unittest.skipIf(sys.platform == "win32", "requires bash")
+class TestBulkSubmit(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.bin_dir = os.path.join(self.tmpdir.name, "bin")
+        os.makedirs(self.bin_dir)
+        # fake sbatch that rejects the last job
+        sbatch = os.path.join(self.bin_dir, "sbatch")
+        with open(sbatch, "w") as f:
+            f.write(
+                textwrap.dedent(
+                    """\
+                    #!/bin/bash
+                    echo "$2" >> sbatch_calls
+                    n=$(wc -l < sbatch_calls)
+                    if [ "$n" -ge 3 ]; then
+                        echo "Job violates accounting/QOS policy" >&2
+                        exit 1
+                    fi
+                    echo "$((1000 + n));cluster"
+                    """
+                )
+            )
+        os.chmod(sbatch, os.stat(sbatch).st_mode | stat.S_IEXEC)
+        machine = Machine(
+            batch_type="Slurm",
+            context_type="LazyLocalContext",
+            local_root=self.tmpdir.name,
+        )
+        resources = Resources(
+            number_node=1,
+            cpu_per_node=1,
+            gpu_per_node=0,
+            queue_name="",
+            group_size=1,
+            strategy={"bulk_submit": True},
+        )
+        task_list = [
+            Task(command=f"echo {ii}", task_work_path=f"task{ii}/") for ii in range(3)
+        ]
+        self.submission = Submission(
+            work_base="./",
+            machine=machine,
+            resources=resources,
+            task_list=task_list,
+        )
+        self.submission.generate_jobs()
+        for job in self.submission.belonging_jobs:
+            job.job_state = JobStatus.unsubmitted
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_bulk_submit(self):
+        env_path = self.bin_dir + os.pathsep + os.environ.get("PATH", "")
+        with mock.patch.dict(os.environ, {"PATH": env_path}), mock.patch.object(
+            self.submission.machine, "do_submit", return_value=""
+        ) as patch_do_submit:
+            self.submission.handle_unexpected_submission_state()
+        jobs = self.submission.belonging_jobs
+        self.assertEqual(
+            sorted(job.job_id for job in jobs if job.job_id != ""), ["1001", "1002"]
+        )
+        # the rejected job is left for the next round instead of being
+        # submitted again by do_submit
+        patch_do_submit.assert_not_called()
+        with open(os.path.join(self.tmpdir.name, "sbatch_calls")) as f:
+            self.assertEqual(len(f.read().splitlines()), 3)
+        self.assertEqual(
+            [job.job_state for job in jobs].count(JobStatus.unsubmitted), 1
+        )
+        for job in jobs:
+            self.assertTrue(
+                os.path.isfile(os.path.join(self.tmpdir.name, job.script_file_name))
+            )
+            if job.job_id != "":
+                self.assertEqual(job.job_state, JobStatus.waiting)
+                with open(
+                    os.path.join(self.tmpdir.name, job.job_hash + "_job_id")
+                ) as f:
+                    self.assertEqual(f.read().strip(), job.job_id)
+        with open(os.path.join(self.tmpdir.name, jobs[0].script_file_name)) as f:
+            self.assertEqual(
+                f.read().rstrip("\n"),
+                self.submission.machine.gen_script(jobs[0]).rstrip("\n"),
+            )
+
+    def test_bulk_submit_rate_limit(self):
+        self.submission.resources.strategy["submit_rate_limit"] = 4
+        bundles = []
+        write_file = self.submission.machine.context.write_file
+
+        def record_bundle(fname, write_str):
+            bundles.append(write_str)
+            return write_file(fname, write_str)
+
+        env_path = self.bin_dir + os.pathsep + os.environ.get("PATH", "")
+        with mock.patch.dict(os.environ, {"PATH": env_path}), mock.patch.object(
+            self.submission.machine.context, "write_file", side_effect=record_bundle
+        ):
+            self.submission.submit_jobs_bulk()
+        self.assertEqual(len(bundles), 1)
+        self.assertEqual(bundles[0].count("\nsleep 0.25\n"), 3)
@@ -0,0 +1,136 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+__package__ = "tests"
+
+from .context import (
+    JobStatus,
+    Machine,
+    fake_block_call,
+    setUpModule,  # noqa: F401
+)
+
+
+class TestPBSCheckStatus(unittest.TestCase):
+    def setUp(self):
+        self.jobs = [
+            SimpleNamespace(job_id="11.pbs01", job_hash="hash11"),
+            SimpleNamespace(job_id="12.pbs01", job_hash="hash12"),
+            SimpleNamespace(job_id="13.pbs01", job_hash="hash13"),
+            SimpleNamespace(job_id="14.pbs01", job_hash="hash14"),
+        ]
+        self.finished_tags = {"hash13_job_tag_finished"}
+
+    def check_status_batch(self, batch_type, outputs):
+        machine = Machine(
+            batch_type=batch_type,
+            context_type="LazyLocalContext",
+            local_root="./",
+        )
+        calls = []
+        with mock.patch.object(
+            machine.context,
+            "block_call",
+            side_effect=fake_block_call(outputs, calls),
+        ), mock.patch.object(
+            machine.context,
+            "check_file_exists",
+            side_effect=lambda fname: fname in self.finished_tags,
+        ):
+            return machine.check_status_batch(self.jobs), calls
+
+    def test_pbs_json(self):
+        outputs = {
+            "qstat": (
+                153,
+                b'{"Jobs": {'
+                b'"11.pbs01.cluster": {"job_state": "R"}, '
+                b'"12.pbs01.cluster": {"job_state": "Q"}, '
+                b'"13.pbs01.cluster": {"job_state": "F"}}}',
+                b"qstat: Unknown Job Id 14.pbs01\n",
+            ),
+        }
+        job_states, calls = self.check_status_batch("PBS", outputs)
+        self.assertEqual(
+            job_states,
+            [
+                JobStatus.running,
+                JobStatus.waiting,
+                JobStatus.finished,
+                JobStatus.terminated,
+            ],
+        )
+        self.assertEqual(
+            calls, ["qstat -x -f -F json 11.pbs01 12.pbs01 13.pbs01 14.pbs01"]
+        )
+
+    def test_torque_xml(self):
+        outputs = {
+            "qstat": (
+                0,
+                b"<Data>"
+                b"<Job><Job_Id>11.pbs01</Job_Id><job_state>R</job_state></Job>"
+                b"<Job><Job_Id>12.pbs01</Job_Id><job_state>Q</job_state></Job>"
+                b"<Job><Job_Id>13.pbs01</Job_Id><job_state>C</job_state></Job>"
+                b"<Job><Job_Id>14.pbs01</Job_Id><job_state>C</job_state></Job>"
+                b"</Data>",
+                b"",
+            ),
+        }
+        job_states, calls = self.check_status_batch("Torque", outputs)
+        self.assertEqual(
+            job_states,
+            [
+                JobStatus.running,
+                JobStatus.waiting,
+                JobStatus.finished,
+                JobStatus.terminated,
+            ],
+        )
+        self.assertEqual(len(calls), 1)
+
+    def test_sge(self):
+        self.jobs = self.jobs[:3]
+        for ii, job in enumerate(self.jobs):
+            job.job_id = str(11 + ii)
+        outputs = {
+            "qstat": (
+                0,
+                b"job-ID  prior   name   user  state submit/start at     queue  slots\n"
+                b"--------------------------------------------------------------------\n"
+                b"     11 0.55500 wDPjob test  r     01/01/2024 00:00:00 all.q@n1  4\n"
+                b"     12 0.55500 wDPjob test  qw    01/01/2024 00:00:00           4\n",
+                b"",
+            ),
+        }
+        job_states, calls = self.check_status_batch("SGE", outputs)
+        self.assertEqual(
+            job_states, [JobStatus.running, JobStatus.waiting, JobStatus.finished]
+        )
+        self.assertEqual(calls, ["qstat"])
+
+    def test_lsf(self):
+        for ii, job in enumerate(self.jobs):
+            job.job_id = str(11 + ii)
+        outputs = {
+            "bjobs": (
+                255,
+                b"11 RUN\n12 PEND\n13 DONE\n",
+                b"Job <14> is not found\n",
+            ),
+        }
+        job_states, calls = self.check_status_batch("LSF", outputs)
+        self.assertEqual(
+            job_states,
+            [
+                JobStatus.running,
+                JobStatus.waiting,
+                JobStatus.finished,
+                JobStatus.terminated,
+            ],
+        )
+        self.assertEqual(calls, ['bjobs -o "jobid stat" -noheader 11 12 13 14'])
@@ -1,6 +1,8 @@
+import json
 import os
 import sys
 import unittest
+from hashlib import sha1
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 __package__ = "tests"
@@ -26,6 +28,29 @@ class TestJob(unittest.TestCase):
 
     def test_get_hash(self):
         self.assertEqual(self.job.get_hash(), self.job2.get_hash())
+        job_dict = self.job.serialize(if_static=True)
+        self.assertEqual(self.job.get_static_json(), json.dumps(job_dict))
+        content = job_dict[self.job.job_hash]
+        self.assertEqual(
+            self.job.get_hash(),
+            sha1(json.dumps(content).encode("utf-8")).hexdigest(),
+        )
+        # the hash follows the tasks, but job_hash names the remote files
+        job_hash = self.job.job_hash
+        self.job.job_task_list = self.job.job_task_list[:1]
+        self.assertNotEqual(self.job.get_hash(), self.job2.get_hash())
+        self.assertEqual(self.job.job_hash, job_hash)
+        # a task modified in place
+        self.job2.job_task_list[0].command = "echo changed"
+        self.assertEqual(
+            self.job2.get_hash(),
+            sha1(
+                json.dumps(
+                    self.job2.serialize(if_static=True)[self.job2.get_hash()]
+                ).encode("utf-8")
+            ).hexdigest(),
+        )
+        self.assertNotEqual(self.job2.get_hash(), job_hash)
         # self.assertEqual(self.submission, self.submission2)
 
     def test_serialize_deserialize(self):
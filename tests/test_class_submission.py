@@ -1,13 +1,18 @@
+import asyncio
 import json
 import os
 import sys
+import tempfile
+import threading
 import unittest
+from hashlib import sha1
 from unittest.mock import MagicMock, patch
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 __package__ = "tests"
 from .context import (
     JobStatus,
+    Machine,
     Submission,
     setUpModule,  # noqa: F401
 )
@@ -33,7 +38,22 @@ class TestSubmission(unittest.TestCase):
         )
 
     def test_get_hash(self):
-        pass
+        self.assertEqual(
+            self.submission.get_hash(),
+            sha1(
+                json.dumps(self.submission.serialize(if_static=True)).encode("utf-8")
+            ).hexdigest(),
+        )
+
+    def test_eq(self):
+        submission = Submission.deserialize(
+            submission_dict=self.submission.serialize(), machine=self.submission.machine
+        )
+        self.assertEqual(self.submission, submission)
+        submission.belonging_jobs[0].job_task_list = submission.belonging_jobs[
+            0
+        ].job_task_list[:1]
+        self.assertNotEqual(self.submission, submission)
 
     def test_bind_machine(self):
         self.assertIsNotNone(self.submission.machine.context.submission)
@@ -44,7 +64,68 @@ class TestSubmission(unittest.TestCase):
         pass
 
     def test_handle_unexpected_submission_state(self):
-        pass
+        self.submission.resources.strategy["submit_concurrency"] = 2
+        self.submission.resources.strategy["submit_rate_limit"] = 100
+        job_ids = iter(range(100, 200))
+        for job in self.submission.belonging_jobs:
+            job.job_state = JobStatus.unsubmitted
+        with patch.object(
+            self.submission.machine,
+            "do_submit",
+            side_effect=lambda job: str(next(job_ids)),
+        ) as patch_do_submit:
+            self.submission.handle_unexpected_submission_state()
+        self.assertEqual(
+            patch_do_submit.call_count, len(self.submission.belonging_jobs)
+        )
+        self.assertEqual(
+            len({job.job_id for job in self.submission.belonging_jobs}),
+            len(self.submission.belonging_jobs),
+        )
+        for job in self.submission.belonging_jobs:
+            self.assertEqual(job.job_state, JobStatus.waiting)
+
+    def test_max_jobs_in_queue(self):
+        self.submission.resources.strategy["max_jobs_in_queue"] = 1
+        for job in self.submission.belonging_jobs:
+            job.job_state = JobStatus.unsubmitted
+        with patch.object(
+            self.submission.machine, "do_submit", return_value="100"
+        ) as patch_do_submit:
+            self.submission.handle_unexpected_submission_state()
+        self.assertEqual(patch_do_submit.call_count, 1)
+        self.assertEqual(
+            [job.job_state for job in self.submission.belonging_jobs],
+            [JobStatus.waiting, JobStatus.unsubmitted],
+        )
+
+    def test_learned_queue_limit(self):
+        jobs = self.submission.belonging_jobs
+        for job in jobs:
+            job.job_state = JobStatus.unsubmitted
+
+        def do_submit(job):
+            # the scheduler accepts only one job in the queue
+            if any(job.job_state == JobStatus.waiting for job in jobs):
+                return ""
+            return "100"
+
+        with patch.object(
+            self.submission.machine, "do_submit", side_effect=do_submit
+        ) as patch_do_submit:
+            self.submission.handle_unexpected_submission_state()
+            self.assertEqual(patch_do_submit.call_count, 2)
+            self.assertEqual(self.submission.learned_queue_limit, 1)
+            self.assertEqual(jobs[1].job_state, JobStatus.unsubmitted)
+            # the queue is full; the limit is probed upward
+            self.submission.handle_unexpected_submission_state()
+            self.assertEqual(patch_do_submit.call_count, 2)
+            self.assertEqual(self.submission.learned_queue_limit, 2)
+            # a slot is freed
+            jobs[0].job_state = JobStatus.finished
+            self.submission.handle_unexpected_submission_state()
+            self.assertEqual(patch_do_submit.call_count, 3)
+            self.assertEqual(jobs[1].job_state, JobStatus.waiting)
 
     def test_submit_submission(self):
         pass
@@ -55,8 +136,64 @@ class TestSubmission(unittest.TestCase):
     def test_download_jobs(self):
         pass
 
+    def bind_lazy_local_machine(self, submission, local_root):
+        machine = Machine.load_from_dict(
+            {
+                "batch_type": "PBS",
+                "context_type": "LazyLocalContext",
+                "local_root": local_root,
+            }
+        )
+        submission.bind_machine(machine=machine)
+
+    def read_journal(self, submission=None):
+        if submission is None:
+            submission = self.submission
+        with open(
+            os.path.join(
+                submission.machine.context.remote_root,
+                f"{submission.submission_hash}.journal",
+            )
+        ) as f:
+            return [json.loads(line) for line in f]
+
     def test_submission_to_json(self):
-        pass
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.bind_lazy_local_machine(self.submission, tmpdir)
+            job0, job1 = self.submission.belonging_jobs
+            self.submission.submission_to_json()
+            self.assertEqual(self.read_journal(), [])
+            json_file = os.path.join(
+                self.submission.machine.context.remote_root,
+                f"{self.submission.submission_hash}.json",
+            )
+            snapshot_mtime = os.stat(json_file).st_mtime_ns
+            # only the changed job is appended to the journal
+            job0.register_job_id("100")
+            job0.job_state = JobStatus.waiting
+            self.submission.submission_to_json()
+            self.submission.submission_to_json()
+            self.assertEqual(
+                self.read_journal(),
+                [
+                    {
+                        "seq": 1,
+                        "job_hash": job0.job_hash,
+                        "job_id": "100",
+                        "job_state": JobStatus.waiting,
+                        "fail_count": 0,
+                    }
+                ],
+            )
+            self.assertEqual(os.stat(json_file).st_mtime_ns, snapshot_mtime)
+            # the journal is compacted
+            self.submission.journal_min_entries = 2
+            job0.job_state = JobStatus.running
+            job1.job_state = JobStatus.waiting
+            self.submission.submission_to_json()
+            self.assertEqual(self.read_journal(), [])
+            with open(json_file) as f:
+                self.assertEqual(json.load(f)["journal_seq"], 1)
 
     @patch("dpdispatcher.Submission.submission_to_json")
     @patch("dpdispatcher.Submission.update_submission_state")
@@ -98,7 +235,43 @@ class TestSubmission(unittest.TestCase):
         self.assertTrue(submission_json_dict, self.submission.serialize())
 
     def test_try_recover_from_json(self):
-        pass
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # the submission hash depends on the machine bound previously
+            self.submission = SampleClass.get_sample_submission()
+            self.bind_lazy_local_machine(self.submission, tmpdir)
+            job0, job1 = self.submission.belonging_jobs
+            self.submission.submission_to_json()
+            job0.register_job_id("100")
+            job0.job_state = JobStatus.running
+            job1.fail_count = 1
+            self.submission.submission_to_json()
+            # a partially written record
+            with open(
+                os.path.join(
+                    self.submission.machine.context.remote_root,
+                    f"{self.submission.submission_hash}.journal",
+                ),
+                "a",
+            ) as f:
+                f.write('{"seq": 3, "job_')
+
+            submission = SampleClass.get_sample_submission()
+            self.bind_lazy_local_machine(submission, tmpdir)
+            submission.try_recover_from_json()
+            job_dict = {job.job_hash: job for job in submission.belonging_jobs}
+            self.assertEqual(job_dict[job0.job_hash].job_id, "100")
+            self.assertEqual(job_dict[job0.job_hash].job_state, JobStatus.running)
+            self.assertEqual(job_dict[job1.job_hash].fail_count, 1)
+            # the next save writes a new snapshot from the recovered states
+            submission.submission_to_json()
+            self.assertEqual(self.read_journal(submission), [])
+            with open(
+                os.path.join(
+                    submission.machine.context.remote_root,
+                    f"{submission.submission_hash}.json",
+                )
+            ) as f:
+                self.assertEqual(json.load(f)["journal_seq"], 2)
 
     def test_repr(self):
         submission_repr = repr(self.submission)
@@ -108,3 +281,19 @@ class TestSubmission(unittest.TestCase):
 
     def test_clean(self):
         pass
+
+    def test_run_steps(self):
+        main_thread = threading.get_ident()
+
+        def steps():
+            try:
+                yield 0.01
+                yield lambda: 1 / 0
+            except ZeroDivisionError:
+                # the error handler of the steps also runs its blocking calls
+                # by the driver
+                in_executor = yield lambda: threading.get_ident() != main_thread
+                return in_executor
+
+        self.assertFalse(Submission._run_steps(steps()))
+        self.assertTrue(asyncio.run(self.submission._async_run_steps(steps())))
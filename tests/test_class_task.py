@@ -1,7 +1,9 @@
+import copy
 import json
 import os
 import sys
 import unittest
+from hashlib import sha1
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 __package__ = "tests"
@@ -36,6 +38,33 @@ class TestTask(unittest.TestCase):
         self.assertTrue(task_json_dict, self.task_dict)
         self.assertTrue(task_json_dict, self.task.serialize())
 
+    def test_get_hash(self):
+        task_hash = sha1(json.dumps(self.task.serialize()).encode("utf-8")).hexdigest()
+        self.assertEqual(self.task.get_hash(), task_hash)
+        # the cached hash is reset when a static field is assigned
+        self.task.command = "echo changed"
+        self.assertNotEqual(self.task.get_hash(), task_hash)
+        self.task.cost = 10
+        self.assertEqual(
+            self.task.get_hash(),
+            sha1(json.dumps(self.task.serialize()).encode("utf-8")).hexdigest(),
+        )
+
+    def test_compact(self):
+        # no __dict__ for each task
+        self.assertFalse(hasattr(self.task, "__dict__"))
+        task = Task.deserialize(task_dict=self.task.serialize())
+        # the equal file lists are shared
+        self.assertIs(task.forward_files, self.task.forward_files)
+        self.assertIs(task.backward_files, self.task.backward_files)
+        # and can not be modified in place
+        with self.assertRaises(TypeError):
+            task.forward_files.append("extra")
+        task.forward_files += ["extra"]
+        self.assertEqual(task.forward_files[-1], "extra")
+        self.assertNotIn("extra", self.task.forward_files)
+        self.assertEqual(copy.deepcopy(task).forward_files, task.forward_files)
+
     def test_repr(self):
         task_repr = repr(self.task)
         print("debug:", task_repr, self.task_dict)
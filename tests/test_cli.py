@@ -10,6 +10,7 @@ class TestCLI(unittest.TestCase):
             "gui",
             "run",
             "submit",
+            "gc",
         ):
             output = sp.check_output(["dpdisp", subcommand, "-h"])
             if subcommand in ("run", "submit"):
@@ -0,0 +1,78 @@
+import io
+import os
+import shutil
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+__package__ = "tests"
+from .context import (
+    Codec,
+    is_compressed,
+    setUpModule,  # noqa: F401
+)
+
+
+class TestCodec(unittest.TestCase):
+    def setUp(self):
+        self.data = os.urandom(1 << 16) + b"0" * (1 << 20)
+
+    def test_round_trip(self):
+        for name in Codec.subclasses_dict:
+            for threads in (1, 2):
+                codec = Codec.get_codec(name, threads=threads)
+                if codec.program is not None and shutil.which(codec.program) is None:
+                    continue
+                with self.subTest(codec=name, threads=threads):
+                    compressed = io.BytesIO()
+                    with codec.open_writer(compressed) as f:
+                        f.write(self.data)
+                    if name != "none":
+                        self.assertLess(len(compressed.getvalue()), len(self.data))
+                        self.assertTrue(is_compressed(compressed.getvalue()[:8]))
+                    compressed.seek(0)
+                    with codec.open_reader(compressed) as f:
+                        # stop before the end
+                        self.assertEqual(f.read(100), self.data[:100])
+                    compressed.seek(0)
+                    with codec.open_reader(compressed) as f:
+                        self.assertEqual(f.read(), self.data)
+
+    def test_broken_sink(self):
+        class BrokenSink(io.RawIOBase):
+            def writable(self):
+                return True
+
+            def write(self, b):
+                raise OSError("the sink is broken")
+
+        for name in ("zstd", "lz4"):
+            codec = Codec.get_codec(name)
+            if shutil.which(codec.program) is None:
+                continue
+            with self.subTest(codec=name):
+                # the writer raises the error instead of hanging
+                with self.assertRaisesRegex(OSError, "the sink is broken"):
+                    with codec.open_writer(BrokenSink()) as f:
+                        for _ in range(256):
+                            f.write(os.urandom(1 << 16))
+
+    def test_tar_option(self):
+        self.assertEqual(Codec.get_codec("none").get_tar_option(), "")
+        self.assertEqual(Codec.get_codec("gzip").get_tar_option(extract=True), "-z")
+        self.assertIsNone(Codec.get_codec("gzip").remote_program)
+        self.assertEqual(Codec.get_codec("gzip", threads=2).remote_program, "pigz")
+        codec = Codec.get_codec("zstd", level=5, threads=4)
+        self.assertEqual(codec.remote_program, "zstd")
+        self.assertEqual(
+            codec.get_tar_option(),
+            "--use-compress-program='zstd -c -q -5 -T4'",
+        )
+        self.assertEqual(
+            codec.get_tar_option(extract=True),
+            "--use-compress-program='zstd -c -q -5 -T4 -d'",
+        )
+
+    def test_unknown_codec(self):
+        with self.assertRaises(RuntimeError):
+            Codec.get_codec("unknown")
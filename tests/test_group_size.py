@@ -46,3 +46,45 @@ class TestGroupSize(TestCase):
                 submission = Submission(".", machine, resources, task_list=tasks)
                 submission.generate_jobs()
                 self.assertEqual(len(submission.belonging_jobs), ntasks)
+
+    def test_lpt(self):
+        machine = Machine.load_from_dict(j_machine)
+        j_resources_lpt = dict(j_resources, group_size=4)
+        j_resources_lpt["strategy"] = {"group_strategy": "lpt"}
+        costs = [8, 7, 6, 5, 4, 3, 2, 1]
+        hashes = []
+        for _ in range(2):
+            resources = Resources.load_from_dict(j_resources_lpt)
+            tasks = [
+                Task.load_from_dict(dict(j_task, task_work_path=f"{ii}/", cost=cost))
+                for ii, cost in enumerate(costs)
+            ]
+            submission = Submission(".", machine, resources, task_list=tasks)
+            submission.generate_jobs()
+            self.assertEqual(len(submission.belonging_jobs), 2)
+            for job in submission.belonging_jobs:
+                self.assertEqual(len(job.job_task_list), 4)
+                self.assertEqual(sum(task.cost for task in job.job_task_list), 18)
+            hashes.append(submission.submission_hash)
+        # deterministic
+        self.assertEqual(hashes[0], hashes[1])
+
+    def test_lpt_cost_func(self):
+        machine = Machine.load_from_dict(j_machine)
+        j_resources_lpt = dict(j_resources, group_size=2)
+        j_resources_lpt["strategy"] = {"group_strategy": "lpt"}
+        resources = Resources.load_from_dict(j_resources_lpt)
+        tasks = [
+            Task.load_from_dict(dict(j_task, task_work_path=f"{ii}/"))
+            for ii in range(4)
+        ]
+        submission = Submission(".", machine, resources, task_list=tasks)
+        # costs 0, 1, 2, 3
+        submission.generate_jobs(cost_func=lambda task: int(task.task_work_path[0]))
+        self.assertEqual(
+            [
+                [task.task_work_path for task in job.job_task_list]
+                for job in submission.belonging_jobs
+            ],
+            [["3/", "0/"], ["2/", "1/"]],
+        )
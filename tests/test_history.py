@@ -0,0 +1,163 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+__package__ = "tests"
+
+from .context import (
+    JobStatus,
+    RuntimeHistory,
+    setUpModule,  # noqa: F401
+)
+from .sample_class import SampleClass
+
+
+class TestRuntimeHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.history = RuntimeHistory(
+            os.path.join(self.tmpdir.name, "history.sqlite3"), window=3
+        )
+        self.machine = SampleClass.get_sample_pbs_local_context()
+        self.submission = SampleClass.get_sample_submission()
+        self.submission.bind_machine(machine=self.machine)
+        self.resources = self.submission.resources
+        self.task = self.submission.belonging_tasks[0]
+        self.signature = self.history.get_signature(self.machine, self.resources)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_estimate(self):
+        self.assertIsNone(
+            self.history.estimate_cost(self.task, self.machine, self.resources)
+        )
+        self.assertEqual(
+            self.history.estimate_cost(
+                self.task, self.machine, self.resources, default=1.0
+            ),
+            1.0,
+        )
+        for wall_time in (100.0, 1.0, 2.0, 3.0):
+            self.history.add(self.task.command, self.signature, wall_time, 10.0)
+        # failed tasks are ignored
+        self.history.add(self.task.command, self.signature, 1000.0, exit_status=1)
+        # only the latest 3 records are used
+        self.assertEqual(
+            self.history.estimate_cost(self.task, self.machine, self.resources), 2.0
+        )
+        self.assertEqual(
+            self.history.estimate_queue_wait(self.task, self.machine, self.resources),
+            10.0,
+        )
+
+    def test_normalize_command(self):
+        self.history.add("lmp  -i input.lammps ", self.signature, 5.0)
+        self.task.command = "lmp -i input.lammps"
+        self.assertEqual(
+            self.history.estimate_cost(self.task, self.machine, self.resources), 5.0
+        )
+
+    def test_record_jobs(self):
+        job = self.submission.belonging_jobs[0]
+        task0, task1 = job.job_task_list[:2]
+        task1.command = "lmp -i other.lammps"
+        job.submit_time = 0.0
+        task_times = [
+            (task0.task_hash, 40.0, 100.0, 0),
+            (task1.task_hash, 45.0, 65.0, 0),
+            ("unknown", 45.0, 1000.0, 0),
+        ]
+        with mock.patch.object(type(job), "get_task_times", return_value=task_times):
+            self.history.record_jobs([job])
+        # each task has its own wall time
+        self.assertEqual(
+            self.history.estimate_cost(task0, self.machine, self.resources), 60.0
+        )
+        self.assertEqual(
+            self.history.estimate_cost(task1, self.machine, self.resources), 20.0
+        )
+        # the queue wait lasts until the first task starts
+        self.assertEqual(
+            self.history.estimate_queue_wait(task1, self.machine, self.resources),
+            40.0,
+        )
+        # the failed task is recorded but not used in the estimation
+        with mock.patch.object(
+            type(job), "get_task_times", return_value=[(task0.task_hash, 0.0, 1.0, 1)]
+        ):
+            self.history.record_jobs([job])
+        self.assertEqual(
+            self.history.estimate_cost(task0, self.machine, self.resources), 60.0
+        )
+
+    def test_get_task_times(self):
+        job = self.submission.belonging_jobs[0]
+        lines = ["hash0 1 3 0", "hash1 2 5 1"]
+        context = self.machine.context
+        with mock.patch.object(
+            context, "check_file_exists", return_value=True
+        ), mock.patch.object(
+            context, "read_file", side_effect=lambda fname: "\n".join(lines) + "\n"
+        ):
+            self.assertEqual(
+                job.get_task_times(),
+                [("hash0", 1.0, 3.0, 0), ("hash1", 2.0, 5.0, 1)],
+            )
+            # the lines recorded are skipped
+            lines.append("hash0 6 7 0")
+            self.assertEqual(job.get_task_times(), [("hash0", 6.0, 7.0, 0)])
+
+    @unittest.skipIf(sys.platform == "win32", "requires bash")
+    def test_gen_task_command(self):
+        job = self.submission.belonging_jobs[0]
+        task = job.job_task_list[0]
+        job.resources.strategy["record_history"] = True
+        task_hashes = []
+        with tempfile.TemporaryDirectory() as remote_root:
+            for command, exit_status in (("true", 0), ("false", 1)):
+                task.command = command
+                task_hashes.append(task.task_hash)
+                ret = subprocess.call(
+                    [
+                        "bash",
+                        "-c",
+                        f"( {self.machine.gen_task_command(job, task)} )",
+                    ],
+                    env={**os.environ, "REMOTE_ROOT": remote_root},
+                )
+                self.assertEqual(ret, exit_status)
+            with open(os.path.join(remote_root, job.job_hash + "_task_times")) as f:
+                lines = [line.split() for line in f.read().splitlines()]
+        self.assertEqual([line[0] for line in lines], task_hashes)
+        self.assertEqual([line[3] for line in lines], ["0", "1"])
+        self.assertTrue(all(int(line[1]) <= int(line[2]) for line in lines))
+
+    def test_update_submission_state(self):
+        self.resources.strategy["record_history"] = True
+        jobs = self.submission.belonging_jobs
+        for job in jobs:
+            job.job_state = JobStatus.running
+
+        def check_status_batch(jobs_to_check):
+            return [
+                JobStatus.finished if job is jobs[0] else JobStatus.running
+                for job in jobs_to_check
+            ]
+
+        with mock.patch(
+            "dpdispatcher.submission.runtime_history", self.history
+        ), mock.patch.object(
+            self.history, "record_jobs"
+        ) as patch_record_jobs, mock.patch.object(
+            self.machine, "check_status_batch", side_effect=check_status_batch
+        ), mock.patch.object(self.machine.context, "refresh_finished_tags"):
+            self.submission.update_submission_state()
+            self.submission.update_submission_state()
+        # the jobs are recorded once when they end
+        patch_record_jobs.assert_called_once()
+        self.assertEqual(patch_record_jobs.call_args[0][0], [jobs[0]])
@@ -0,0 +1,106 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+__package__ = "tests"
+from .context import (
+    JSONStreamArray,
+    JSONStreamObject,
+    Submission,
+    iter_json,
+    load_json_stream,
+    setUpModule,  # noqa: F401
+)
+from .sample_class import SampleClass
+
+
+def split_chunks(text, chunk_size):
+    return (text[ii : ii + chunk_size] for ii in range(0, len(text), chunk_size))
+
+
+class TestJSONStream(unittest.TestCase):
+    def setUp(self):
+        self.data = {
+            "a": 1,
+            "b": [{"c": [1, 2.5, "x\n"], "d": {}}, [], None],
+            "e": [],
+            "f": "你好",
+        }
+
+    def test_iter_json(self):
+        obj = JSONStreamObject(self.data)
+        obj["b"] = JSONStreamArray(iter(self.data["b"]))
+        obj["e"] = JSONStreamArray([])
+        obj["g"] = JSONStreamObject(h=JSONStreamArray([JSONStreamObject()]))
+        expected = {**self.data, "g": {"h": [{}]}}
+        for indent in (None, 2, 4):
+            obj["b"] = JSONStreamArray(iter(self.data["b"]))
+            with self.subTest(indent=indent):
+                self.assertEqual(
+                    "".join(iter_json(obj, indent=indent)),
+                    json.dumps(expected, indent=indent),
+                )
+
+    def test_load_json_stream(self):
+        text = json.dumps({**self.data, "n": 12345}, indent=2)
+        for chunk_size in (1, 3, 1 << 20):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(
+                    load_json_stream(split_chunks(text, chunk_size)),
+                    {**self.data, "n": 12345},
+                )
+                obj = load_json_stream(
+                    split_chunks(text, chunk_size),
+                    {"b": lambda item, obj: (item, obj["a"])},
+                )
+                self.assertEqual(obj["b"], [(item, 1) for item in self.data["b"]])
+
+    def test_load_json_stream_split_number(self):
+        # the numbers are split at the chunk boundaries
+        self.assertEqual(
+            load_json_stream(['{"a": 1.', '5, "b": 2}']), {"a": 1.5, "b": 2}
+        )
+        self.assertEqual(
+            load_json_stream(['{"a": [1', "2e", "-", "3, -4.5E+2]}"]),
+            {"a": [12e-3, -450.0]},
+        )
+
+    def test_load_json_stream_broken(self):
+        text = json.dumps(self.data)
+        with self.assertRaises(json.JSONDecodeError):
+            load_json_stream(split_chunks(text[:-10], 4), {"b": lambda item, obj: item})
+
+
+class TestSubmissionStream(unittest.TestCase):
+    def setUp(self):
+        self.submission = SampleClass.get_sample_submission()
+        self.submission.bind_machine(machine=SampleClass.get_sample_pbs_local_context())
+
+    def test_serialize_stream(self):
+        for indent in (2, 4):
+            with self.subTest(indent=indent):
+                self.assertEqual(
+                    "".join(
+                        iter_json(
+                            self.submission.serialize_stream(),
+                            indent=indent,
+                            default=str,
+                        )
+                    ),
+                    json.dumps(self.submission.serialize(), indent=indent, default=str),
+                )
+        job = self.submission.belonging_jobs[0]
+        self.assertEqual(
+            "".join(iter_json(job.serialize_stream(if_static=True))),
+            json.dumps(job.serialize(if_static=True)),
+        )
+
+    def test_deserialize_stream(self):
+        text = json.dumps(self.submission.serialize(), indent=4)
+        submission = Submission.deserialize_stream(split_chunks(text, 7))
+        self.assertEqual(submission.serialize(), self.submission.serialize())
+        # the jobs share the resources of the submission
+        for job in submission.belonging_jobs:
+            self.assertIs(job.resources, submission.resources)
@@ -59,6 +59,29 @@ class TestLazyLocalContext(unittest.TestCase):
         self.assertTrue("ls: cannot access" in err_msg)
         self.assertTrue("No such file or directory\n" in err_msg)
 
+    def test_list_finished_tags(self):
+        root = self.lazy_local_context.remote_root
+        tags = [
+            "job1_job_tag_finished",
+            "bct-1/task1_task_tag_finished",
+            "some_dir/deep/task2_task_tag_finished",
+        ]
+        for tag in tags:
+            os.makedirs(os.path.dirname(os.path.join(root, tag)), exist_ok=True)
+            open(os.path.join(root, tag), "w").close()
+        self.assertEqual(self.lazy_local_context.list_finished_tags(), set(tags))
+        self.assertEqual(
+            self.lazy_local_context.list_finished_tags(max_depth=2), set(tags[:2])
+        )
+
+        self.lazy_local_context.finished_tags = {"job1_job_tag_finished"}
+        self.assertTrue(self.lazy_local_context.check_tag_exists(tags[0]))
+        self.assertFalse(
+            self.lazy_local_context.check_tag_exists(tags[1], verify=False)
+        )
+        # not in the snapshot but exists
+        self.assertTrue(self.lazy_local_context.check_tag_exists(tags[1]))
+
     # def test_block_checkcall(self) :
     #     self.job  = LazyLocalContext('loc', None)
     #     tasks = ['task0', 'task1']
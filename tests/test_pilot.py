@@ -0,0 +1,113 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+__package__ = "tests"
+
+from .context import (
+    JobStatus,
+    Machine,
+    Resources,
+    Submission,
+    Task,
+    get_pilot,
+    setUpModule,  # noqa: F401
+)
+
+
+@unittest.skipIf(sys.platform == "win32", "Shell is not supported on Windows")
+class TestPilot(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.machine = Machine.load_from_dict(
+            {
+                "batch_type": "Shell",
+                "context_type": "LazyLocalContext",
+                "local_root": self.tmpdir.name,
+            }
+        )
+        self.resources = Resources.load_from_dict(
+            {
+                "number_node": 1,
+                "cpu_per_node": 1,
+                "gpu_per_node": 0,
+                "queue_name": "",
+                "group_size": 1,
+                "strategy": {"pilot": {"idle_timeout": 4}},
+            }
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_submission(self, work_base):
+        os.makedirs(os.path.join(self.tmpdir.name, work_base, "task"))
+        task = Task(command="echo $$ > out", task_work_path="task/")
+        return Submission(
+            work_base=work_base,
+            machine=self.machine,
+            resources=self.resources,
+            task_list=[task],
+        )
+
+    def test_run_submissions(self):
+        machine_class = type(self.machine)
+        with mock.patch.object(
+            machine_class,
+            "do_submit",
+            autospec=True,
+            side_effect=machine_class.do_submit,
+        ) as patch_do_submit:
+            for work_base in ("iter0", "iter1"):
+                submission = self.make_submission(work_base)
+                submission.run_submission(check_interval=1)
+                self.assertTrue(
+                    os.path.isfile(
+                        os.path.join(self.tmpdir.name, work_base, "task/out")
+                    )
+                )
+                self.assertTrue(
+                    submission.belonging_jobs[0].job_id.startswith("pilot:")
+                )
+        # only the pilot job is submitted to the scheduler
+        self.assertEqual(patch_do_submit.call_count, 1)
+        pilot = get_pilot(self.machine, self.resources)
+        self.assertEqual(len(pilot.pilot_jobs), 1)
+        pilot_job = pilot.pilot_jobs[0]
+        self.assertEqual(
+            pilot_job.machine.check_status_batch(pilot.pilot_jobs), [JobStatus.running]
+        )
+        # the script of the pilot job outlives the submissions
+        self.assertTrue(
+            os.path.isfile(os.path.join(pilot.pilot_dir, pilot_job.script_file_name))
+        )
+        self.assertFalse(
+            os.path.isfile(
+                os.path.join(self.tmpdir.name, "iter0", pilot_job.script_file_name)
+            )
+        )
+        # the completing pilot job may still run jobs
+        with mock.patch.object(
+            type(pilot_job.machine),
+            "check_status_batch",
+            return_value=[JobStatus.completing],
+        ):
+            self.assertEqual(pilot.ensure_pilot_jobs(), [pilot_job.worker_id])
+
+    def test_expired_pilot_job(self):
+        submission = self.make_submission("iter0")
+        submission.generate_jobs()
+        job = submission.belonging_jobs[0]
+        pilot = get_pilot(self.machine, self.resources)
+        with mock.patch.object(pilot, "ensure_pilot_jobs", return_value=[]):
+            job.submit_job()
+            self.assertEqual(pilot.check_status_batch([job]), [JobStatus.waiting])
+            # the job is claimed by a worker which has expired
+            os.rename(
+                os.path.join(pilot.pilot_dir, "queue", job.job_hash),
+                os.path.join(pilot.pilot_dir, "running", f"{job.job_hash}.worker"),
+            )
+            self.assertEqual(pilot.check_status_batch([job]), [JobStatus.terminated])
@@ -0,0 +1,103 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+__package__ = "tests"
+
+from .context import (
+    JobStatus,
+    PollPolicy,
+    StatusPoller,
+    setUpModule,  # noqa: F401
+)
+
+
+def make_submission(machine, job_ids):
+    jobs = [
+        SimpleNamespace(job_id=job_id, job_state=JobStatus.running)
+        for job_id in job_ids
+    ]
+    return SimpleNamespace(machine=machine, belonging_jobs=jobs)
+
+
+class TestStatusPoller(unittest.TestCase):
+    def setUp(self):
+        self.poller = StatusPoller()
+        self.machine = SimpleNamespace(
+            context=SimpleNamespace(
+                remote_profile={"hostname": "cluster", "username": "user"}
+            ),
+            query_job_states=mock.Mock(
+                side_effect=lambda job_ids: {
+                    job_id: JobStatus.running for job_id in job_ids
+                }
+            ),
+        )
+
+    def test_share_query(self):
+        submission1 = make_submission(self.machine, ["1", "2"])
+        submission2 = make_submission(self.machine, ["3"])
+        self.poller.register(submission1, 30)
+        self.poller.register(submission2, 30)
+        self.assertEqual(
+            self.poller.query_job_states(self.machine, ["1", "2"]),
+            {"1": JobStatus.running, "2": JobStatus.running},
+        )
+        self.assertEqual(
+            self.poller.query_job_states(self.machine, ["3"]),
+            {"3": JobStatus.running},
+        )
+        self.machine.query_job_states.assert_called_once_with(["1", "2", "3"])
+
+        # a new job id that has not been queried
+        self.poller.query_job_states(self.machine, ["4"])
+        self.assertEqual(self.machine.query_job_states.call_count, 2)
+
+    def test_unregistered(self):
+        submission = make_submission(self.machine, ["1"])
+        self.poller.register(submission, 30)
+        self.poller.unregister(submission)
+        self.poller.query_job_states(self.machine, ["1"])
+        self.poller.query_job_states(self.machine, ["1"])
+        self.assertEqual(self.machine.query_job_states.call_count, 2)
+
+    def test_key(self):
+        other_machine = SimpleNamespace(
+            context=SimpleNamespace(
+                remote_profile={"hostname": "cluster", "username": "other"}
+            ),
+        )
+        self.assertNotEqual(
+            self.poller.get_key(self.machine), self.poller.get_key(other_machine)
+        )
+
+
+class TestPollPolicy(unittest.TestCase):
+    def test_fixed_interval(self):
+        policy = PollPolicy(30)
+        for _ in range(3):
+            policy.update([("job1", JobStatus.waiting)])
+            self.assertEqual(policy.next_interval(), 30)
+
+    def test_backoff(self):
+        policy = PollPolicy(10, max_interval=35, backoff=2.0)
+        waiting = [("job1", JobStatus.waiting), ("job2", JobStatus.finished)]
+        intervals = []
+        for _ in range(5):
+            policy.update(waiting)
+            intervals.append(policy.next_interval())
+        self.assertEqual(intervals, [10, 20, 35, 35, 35])
+        # reset once a job starts running
+        policy.update([("job1", JobStatus.running), ("job2", JobStatus.finished)])
+        self.assertEqual(policy.next_interval(), 10)
+        # reset when the state has changed even if it is waiting
+        policy.update([("job1", JobStatus.waiting), ("job2", JobStatus.finished)])
+        self.assertEqual(policy.next_interval(), 10)
+
+    def test_jitter(self):
+        policy = PollPolicy(10, jitter=0.2)
+        for _ in range(20):
+            self.assertTrue(8 <= policy.next_interval() <= 12)
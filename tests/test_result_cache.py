@@ -0,0 +1,167 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+__package__ = "tests"
+
+from .context import (
+    JobStatus,
+    Machine,
+    Resources,
+    ResultCache,
+    Submission,
+    Task,
+    setUpModule,  # noqa: F401
+)
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.local_root = os.path.join(self.tmpdir.name, "work")
+        self.cache = ResultCache(root=os.path.join(self.tmpdir.name, "cache"))
+        self.resources = Resources.load_from_dict(
+            {
+                "number_node": 1,
+                "cpu_per_node": 1,
+                "gpu_per_node": 0,
+                "queue_name": "",
+                "group_size": 1,
+            }
+        )
+        self.task = Task(
+            command="cat in > out",
+            task_work_path="task/",
+            forward_files=["in"],
+            backward_files=["out"],
+        )
+        os.makedirs(os.path.join(self.local_root, "task"))
+        self.write("task/in", "1")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, path, content):
+        with open(os.path.join(self.local_root, path), "w") as f:
+            f.write(content)
+
+    def get_key(self):
+        return self.cache.get_key(self.task, self.local_root, [], self.resources)
+
+    def test_get_key(self):
+        key = self.get_key()
+        self.assertEqual(key, self.get_key())
+        self.write("task/in", "2")
+        self.assertNotEqual(key, self.get_key())
+        # missing forward files
+        self.task.forward_files = ["missing"]
+        self.assertIsNone(self.get_key())
+
+    def test_store_restore(self):
+        key = self.get_key()
+        task_dir = os.path.join(self.local_root, "task")
+        self.assertFalse(self.cache.restore(key, task_dir))
+        self.write("task/out", "result")
+        self.cache.store(key, task_dir, ["out"])
+        os.remove(os.path.join(task_dir, "out"))
+        self.assertTrue(self.cache.restore(key, task_dir))
+        with open(os.path.join(task_dir, "out")) as f:
+            self.assertEqual(f.read(), "result")
+
+    def test_evict(self):
+        self.cache.max_size = 15
+        task_dir = os.path.join(self.local_root, "task")
+        self.write("task/out", "0123456789")
+        self.cache.store("a", task_dir, ["out"])
+        # make "a" the least recently used entry
+        old_time = time.time() - 100
+        os.utime(self.cache.root / "entries" / "a" / "meta.json", (old_time, old_time))
+        self.cache.store("b", task_dir, ["out"])
+        self.cache.evict()
+        self.assertFalse(self.cache.restore("a", task_dir))
+        self.assertTrue(self.cache.restore("b", task_dir))
+
+
+@unittest.skipIf(sys.platform == "win32", "Shell is not supported on Windows")
+class TestResultCacheSubmission(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.local_root = os.path.join(self.tmpdir.name, "work")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_submission(self, work_base, inputs):
+        for ii, content in enumerate(inputs):
+            task_dir = os.path.join(self.local_root, work_base, f"task{ii}")
+            os.makedirs(task_dir)
+            with open(os.path.join(task_dir, "in"), "w") as f:
+                f.write(content)
+        machine = Machine.load_from_dict(
+            {
+                "batch_type": "Shell",
+                "context_type": "LazyLocalContext",
+                "local_root": self.local_root,
+            }
+        )
+        resources = Resources.load_from_dict(
+            {
+                "number_node": 1,
+                "cpu_per_node": 1,
+                "gpu_per_node": 0,
+                "queue_name": "",
+                "group_size": 1,
+                "strategy": {"result_cache": {}},
+            }
+        )
+        task_list = [
+            Task(
+                command="cat in > out; echo run > ran",
+                task_work_path=f"task{ii}/",
+                forward_files=["in"],
+                backward_files=["out"],
+            )
+            for ii in range(len(inputs))
+        ]
+        return Submission(
+            work_base=work_base,
+            machine=machine,
+            resources=resources,
+            task_list=task_list,
+        )
+
+    def test_run_submission(self):
+        # the default cache root is ~/.dpdispatcher/cache
+        with mock.patch.object(Path, "home", return_value=Path(self.tmpdir.name)):
+            self.make_submission("iter0", ["0", "1"]).run_submission(check_interval=1)
+            # the input of task 1 is changed
+            submission = self.make_submission("iter1", ["0", "changed"])
+            submission.run_submission(check_interval=1)
+        self.assertEqual(len(submission.belonging_jobs), 1)
+        self.assertEqual(
+            [task.task_state for task in submission.belonging_tasks],
+            [JobStatus.finished, JobStatus.finished],
+        )
+        for ii, (content, ran) in enumerate([("0", False), ("changed", True)]):
+            task_dir = os.path.join(self.local_root, "iter1", f"task{ii}")
+            with open(os.path.join(task_dir, "out")) as f:
+                self.assertEqual(f.read(), content)
+            self.assertEqual(os.path.isfile(os.path.join(task_dir, "ran")), ran)
+
+    def test_all_cached(self):
+        with mock.patch.object(Path, "home", return_value=Path(self.tmpdir.name)):
+            self.make_submission("iter0", ["0"]).run_submission(check_interval=1)
+            submission = self.make_submission("iter1", ["0"])
+            with mock.patch.object(
+                submission.machine, "do_submit", wraps=submission.machine.do_submit
+            ) as patch_do_submit:
+                submission.run_submission(check_interval=1)
+        patch_do_submit.assert_not_called()
+        self.assertEqual(submission.belonging_jobs, [])
+        with open(os.path.join(self.local_root, "iter1", "task0", "out")) as f:
+            self.assertEqual(f.read(), "0")
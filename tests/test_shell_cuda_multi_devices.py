@@ -58,6 +58,65 @@ class TestShellCudaMultiDevices(unittest.TestCase):
 
         self.assertTrue(os.path.isfile("test_if_cuda_multi_devices/test_dir/out.txt"))
 
+    def test_gen_script_command(self):
+        with open("jsons/machine_if_cuda_multi_devices.json") as f:
+            machine_dict = json.load(f)
+        machine = Machine.load_from_dict(machine_dict["machine"])
+        resources = Resources.load_from_dict(machine_dict["resources"])
+        task_list = [
+            Task(command=f"echo {ii}", task_work_path="./") for ii in range(16)
+        ]
+        submission = Submission(
+            work_base="test_dir/",
+            machine=machine,
+            resources=resources,
+            task_list=task_list,
+        )
+        submission.generate_jobs()
+        job = submission.belonging_jobs[0]
+        script = machine.gen_script_command(job)
+        # 2 tasks on each GPU at a time
+        for gpu in range(4):
+            self.assertEqual(script.count(f"export CUDA_VISIBLE_DEVICES={gpu};"), 4)
+        # the counters are not kept by the resources shared by the jobs
+        self.assertIs(job.resources, submission.resources)
+        self.assertEqual(machine.gen_script_command(job), script)
+
+    def test_gen_command_without_state(self):
+        # the machines written for the older versions do not pass a ScriptState
+        with open("jsons/machine_if_cuda_multi_devices.json") as f:
+            machine_dict = json.load(f)
+        machine = Machine.load_from_dict(machine_dict["machine"])
+        resources = Resources.load_from_dict(machine_dict["resources"])
+        submission = Submission(
+            work_base="test_dir/",
+            machine=machine,
+            resources=resources,
+            task_list=[Task(command="echo 0", task_work_path="./")],
+        )
+        submission.generate_jobs()
+        job = submission.belonging_jobs[0]
+        # the state is reset for each job script
+        for _ in range(2):
+            machine.gen_script(job)
+            commands = []
+            for _ in range(4):
+                commands.append(
+                    machine.gen_command_env_cuda_devices(resources=resources)
+                )
+                machine.gen_script_wait(resources=resources)
+            self.assertEqual(
+                commands,
+                [
+                    "export CUDA_VISIBLE_DEVICES=0;",
+                    "export CUDA_VISIBLE_DEVICES=0;",
+                    "export CUDA_VISIBLE_DEVICES=1;",
+                    "export CUDA_VISIBLE_DEVICES=1;",
+                ],
+            )
+        # the resources shared by the jobs keep no counters
+        self.assertFalse(hasattr(resources, "gpu_in_use"))
+
     @classmethod
     def tearDownClass(cls):
         shutil.rmtree("tmp_if_cuda_multi_devices/")
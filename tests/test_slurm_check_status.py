@@ -0,0 +1,104 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+__package__ = "tests"
+
+from .context import (
+    JobStatus,
+    Machine,
+    fake_block_call,
+    setUpModule,  # noqa: F401
+)
+
+
+class TestSlurmCheckStatus(unittest.TestCase):
+    def setUp(self):
+        self.machine = Machine(
+            batch_type="Slurm",
+            context_type="LazyLocalContext",
+            local_root="./",
+        )
+        self.jobs = [
+            SimpleNamespace(job_id="101", job_hash="hash101"),
+            SimpleNamespace(job_id="102", job_hash="hash102"),
+            SimpleNamespace(job_id="103", job_hash="hash103"),
+            SimpleNamespace(job_id="104", job_hash="hash104"),
+            SimpleNamespace(job_id="105", job_hash="hash105"),
+            SimpleNamespace(job_id="", job_hash="hash106"),
+        ]
+        self.finished_tags = {"hash104_job_tag_finished"}
+
+    def check_status_batch(self, outputs):
+        calls = []
+        with mock.patch.object(
+            self.machine.context,
+            "block_call",
+            side_effect=fake_block_call(outputs, calls),
+        ), mock.patch.object(
+            self.machine.context,
+            "check_file_exists",
+            side_effect=lambda fname: fname in self.finished_tags,
+        ):
+            return self.machine.check_status_batch(self.jobs), calls
+
+    def test_single_squeue_call(self):
+        outputs = {
+            "squeue": (
+                0,
+                b"               101 PD\n"
+                b"             102_1  R\n"
+                b"         102_[2-5] PD\n"
+                b"               103 CG\n",
+                b"",
+            ),
+            "sacct": (0, b"104|COMPLETED\n105|CANCELLED by 1000\n", b""),
+        }
+        job_states, calls = self.check_status_batch(outputs)
+        self.assertEqual(
+            job_states,
+            [
+                JobStatus.waiting,
+                JobStatus.running,
+                JobStatus.completing,
+                JobStatus.finished,
+                JobStatus.terminated,
+                JobStatus.unsubmitted,
+            ],
+        )
+        self.assertEqual(
+            calls,
+            [
+                'squeue -h -o "%.18i %.2t" -j 101,102,103,104,105',
+                "sacct -n -X -P -o JobID,State -j 104,105",
+            ],
+        )
+
+    def test_invalid_job_id(self):
+        outputs = {
+            "squeue": (
+                1,
+                b"",
+                b"slurm_load_jobs error: Invalid job id specified\n",
+            ),
+            "sacct": (1, b"", b"Slurm accounting storage is disabled\n"),
+        }
+        job_states, calls = self.check_status_batch(outputs)
+        self.assertEqual(
+            job_states,
+            [JobStatus.terminated] * 3
+            + [JobStatus.finished, JobStatus.terminated, JobStatus.unsubmitted],
+        )
+        self.assertEqual(len(calls), 2)
+
+    def test_chunked_query(self):
+        self.machine.max_query_job_ids = 2
+        outputs = {
+            "squeue": (0, b"101 R\n102 R\n103 R\n104 R\n105 R\n", b""),
+        }
+        job_states, calls = self.check_status_batch(outputs)
+        self.assertEqual(job_states[:5], [JobStatus.running] * 5)
+        self.assertEqual(len(calls), 3)
@@ -1,7 +1,16 @@
+import gzip
+import io
 import os
+import shutil
 import socket
+import subprocess
 import sys
+import tempfile
+import time
 import unittest
+from pathlib import Path
+from stat import S_IWUSR
+from unittest import mock
 
 from paramiko.ssh_exception import SSHException
 
@@ -10,10 +19,13 @@ __package__ = "tests"
 from .context import (
     Machine,
     Resources,
+    SSHContext,
     SSHSession,
     Submission,
     Task,
+    get_sha256,
     setUpModule,  # noqa: F401
+    split_ranges,
 )
 from .sample_class import SampleClass
 
@@ -236,3 +248,392 @@ class TestSSHContextNoCompress(unittest.TestCase):
 
     def test_download(self):
         self.context.download(self.__class__.submission)
+
+
+class LocalSFTPFile(io.FileIO):
+    """An SFTP file on the local filesystem."""
+
+    def set_pipelined(self, pipelined=True):
+        pass
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        return super().write(data)
+
+    def readv(self, chunks):
+        for offset, length in chunks:
+            self.seek(offset)
+            yield self.read(length)
+
+
+class LocalSFTP:
+    """An SFTP client on the local filesystem."""
+
+    def open(self, filename, mode="r"):
+        return LocalSFTPFile(filename, mode)
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def mkdir(self, path):
+        os.mkdir(path)
+
+    def remove(self, path):
+        os.remove(path)
+
+    def put(self, localpath, remotepath):
+        shutil.copyfile(localpath, remotepath)
+
+    def get(self, remotepath, localpath):
+        shutil.copyfile(remotepath, localpath)
+
+
+def local_exec_command(cmd):
+    proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
+    stdout = mock.MagicMock()
+    stdout.read.return_value = proc.communicate()[0]
+    stdout.channel.recv_exit_status.return_value = proc.returncode
+    return None, stdout, None
+
+
+class TestParallelTransfer(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.session = SSHSession.__new__(SSHSession)
+        self.session.parallel_channels = 3
+        self.session.parallel_chunk_size = 1
+        self.session.transfer_block_size = 256 * 1024
+        self.session.transfer_window = 2
+        self.session._sftp = LocalSFTP()
+        self.session._sftp_channels = []
+        self.session._channels_lock = mock.MagicMock()
+        self.session.ssh = mock.MagicMock()
+        self.session.ssh.open_sftp.side_effect = LocalSFTP
+        self.src = os.path.join(self.tmpdir.name, "src")
+        with open(self.src, "wb") as f:
+            f.write(os.urandom(3 * 1024**2 + 12345))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_split_ranges(self):
+        self.assertEqual(split_ranges(0, 4, 10), [(0, 0)])
+        self.assertEqual(split_ranges(25, 4, 10), [(0, 13), (13, 12)])
+        self.assertEqual(split_ranges(9, 4, 10), [(0, 9)])
+        self.assertEqual(
+            split_ranges(40, 4, 10), [(0, 10), (10, 10), (20, 10), (30, 10)]
+        )
+
+    def test_parallel_put_get(self):
+        dst = os.path.join(self.tmpdir.name, "dst")
+        back = os.path.join(self.tmpdir.name, "back")
+        with mock.patch.object(
+            self.session, "exec_command", side_effect=local_exec_command
+        ):
+            self.session.parallel_put(self.src, dst)
+            self.session.parallel_get(dst, back)
+        self.assertEqual(get_sha256(dst), get_sha256(self.src))
+        self.assertEqual(get_sha256(back), get_sha256(self.src))
+        # the channels are reused
+        self.assertEqual(self.session.ssh.open_sftp.call_count, 2)
+
+    def test_sha256_mismatch(self):
+        dst = os.path.join(self.tmpdir.name, "dst")
+        _, stdout, _ = local_exec_command("true")
+        stdout.read.return_value = b"0" * 64
+        with mock.patch.object(
+            self.session, "exec_command", return_value=(None, stdout, None)
+        ), mock.patch("time.sleep"):
+            with self.assertRaises(RuntimeError):
+                self.session.parallel_put(self.src, dst)
+
+
+class LocalChannelStdout:
+    """The stdout of a local process, in place of a channel file."""
+
+    def __init__(self, proc):
+        self.proc = proc
+        self.channel = mock.MagicMock()
+        self.channel.recv_exit_status.side_effect = proc.wait
+
+    def read(self, size=-1):
+        return self.proc.stdout.read(size)
+
+
+def local_exec_command_stream(cmd):
+    proc = subprocess.Popen(
+        cmd,
+        shell=True,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    return proc.stdin, LocalChannelStdout(proc), proc.stderr
+
+
+@unittest.skipIf(sys.platform == "win32", "tar is not available on Windows")
+class TestTarStream(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.context = SSHContext.__new__(SSHContext)
+        self.context.local_root = os.path.join(self.tmpdir.name, "local")
+        self.context.remote_root = os.path.join(self.tmpdir.name, "remote")
+        self.context.ssh_session = mock.MagicMock()
+        self.context.ssh_session.tar_stream = True
+        self.context.ssh_session.compress_codec = None
+        self.context.ssh_session.compress_level = None
+        self.context.ssh_session.compress_threads = 1
+        self.context.ssh_session.skip_compressed = True
+        self.context.ssh_session.exec_command.side_effect = local_exec_command_stream
+        os.makedirs(os.path.join(self.context.local_root, "task"))
+        os.makedirs(os.path.join(self.context.local_root, "empty"))
+        os.makedirs(self.context.remote_root)
+        with open(os.path.join(self.context.local_root, "task", "input"), "w") as f:
+            f.write("input")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_put_get_files(self):
+        for tar_compress in (True, False):
+            with self.subTest(tar_compress=tar_compress):
+                self.context._put_files(
+                    ["task/input"], directories=["empty"], tar_compress=tar_compress
+                )
+                with open(os.path.join(self.context.remote_root, "task", "input")) as f:
+                    self.assertEqual(f.read(), "input")
+                self.assertTrue(
+                    os.path.isdir(os.path.join(self.context.remote_root, "empty"))
+                )
+                with open(
+                    os.path.join(self.context.remote_root, "task", "output"), "w"
+                ) as f:
+                    f.write("output")
+                self.context._get_files(["task/output"], tar_compress=tar_compress)
+                with open(os.path.join(self.context.local_root, "task", "output")) as f:
+                    self.assertEqual(f.read(), "output")
+                # no temporary archive is left
+                self.assertEqual(
+                    sorted(os.listdir(self.context.local_root)), ["empty", "task"]
+                )
+
+    def test_get_missing_files(self):
+        with self.assertRaises(FileNotFoundError):
+            self.context._get_files(["task/missing"])
+
+    def test_get_many_files(self):
+        # the file list and the archive do not fit in the pipes at once
+        files = [f"task/{'output' * 20}{ii}" for ii in range(2000)]
+        os.makedirs(os.path.join(self.context.remote_root, "task"))
+        for ff in files:
+            with open(os.path.join(self.context.remote_root, ff), "w") as f:
+                f.write(ff)
+        self.context._get_files(files, tar_compress=False)
+        for ff in files:
+            with open(os.path.join(self.context.local_root, ff)) as f:
+                self.assertEqual(f.read(), ff)
+
+    def test_remote_exec_stdin(self):
+        # the output fills the pipe before the input is read
+        input_str = "input\n" * (1 << 16)
+        self.assertEqual(self.context._remote_exec_stdin("cat", input_str), input_str)
+        with self.assertRaises(RuntimeError):
+            self.context._remote_exec_stdin("cat >/dev/null; false", input_str)
+
+    def test_put_files_remote_error(self):
+        # the remote tar exits before reading the whole archive
+        with open(os.path.join(self.context.local_root, "task", "large"), "wb") as f:
+            f.write(os.urandom(1 << 20))
+        self.context.remote_root = os.path.join(self.tmpdir.name, "missing")
+        with self.assertRaises(RuntimeError) as cm:
+            self.context._put_files(["task/large"], tar_compress=False)
+        self.assertIn("missing", str(cm.exception))
+
+    def test_compress_codec(self):
+        session = self.context.ssh_session
+        # the archive is transferred as a file without streaming
+        self.context.submission = mock.MagicMock(submission_hash="hash")
+        session.sftp = LocalSFTP()
+        session.put.side_effect = shutil.copyfile
+        session.get.side_effect = shutil.copyfile
+        for codec in ("none", "gzip", "zstd", "lz4"):
+            if codec in ("zstd", "lz4") and shutil.which(codec) is None:
+                continue
+            for tar_stream in (True, False):
+                with self.subTest(codec=codec, tar_stream=tar_stream):
+                    session.compress_codec = codec
+                    # pigz is required by gzip with multiple threads
+                    session.compress_threads = 2 if codec == "zstd" else 1
+                    session.tar_stream = tar_stream
+                    output = f"output {codec} {tar_stream}"
+                    self.context._put_files(["task/input"])
+                    with open(
+                        os.path.join(self.context.remote_root, "task", "input")
+                    ) as f:
+                        self.assertEqual(f.read(), "input")
+                    with open(
+                        os.path.join(self.context.remote_root, "task", "output"), "w"
+                    ) as f:
+                        f.write(output)
+                    self.context._get_files(["task/output"])
+                    with open(
+                        os.path.join(self.context.local_root, "task", "output")
+                    ) as f:
+                        self.assertEqual(f.read(), output)
+                    self.assertEqual(
+                        sorted(os.listdir(self.context.local_root)), ["empty", "task"]
+                    )
+
+    def test_remote_program(self):
+        session = self.context.ssh_session
+        session.compress_threads = 2
+        with mock.patch.object(SSHContext, "_remote_has_program", return_value=False):
+            # gzip falls back to tar -z without pigz
+            session.compress_codec = "gzip"
+            codec = self.context._get_codec(True, lambda: 0.0)
+            self.assertEqual(codec.get_tar_option(), "-z")
+            session.compress_codec = "zstd"
+            with self.assertRaises(RuntimeError):
+                self.context._get_codec(True, lambda: 0.0)
+        self.assertTrue(self.context._remote_has_program("tar"))
+        self.assertFalse(self.context._remote_has_program("dpdispatcher-missing"))
+
+    def test_skip_compressed(self):
+        with gzip.open(
+            os.path.join(self.context.local_root, "task", "input.gz"), "wb"
+        ) as f:
+            f.write(b"input" * 1000)
+        with gzip.open(os.path.join(self.context.remote_root, "output.gz"), "wb") as f:
+            f.write(b"output" * 1000)
+        # the files are not sampled without compress_codec
+        codec = self.context._get_codec(True, mock.Mock(side_effect=AssertionError))
+        self.assertEqual(codec.name, "gzip")
+        self.context.ssh_session.compress_codec = "gzip"
+        for files, compressed_ratio in (
+            (["task/input", "task/input.gz"], self.context._local_compressed_ratio),
+            (["missing", "output.gz"], self.context._remote_compressed_ratio),
+        ):
+            with self.subTest(files=files):
+                self.assertGreater(compressed_ratio(files), 0.9)
+                codec = self.context._get_codec(True, lambda: compressed_ratio(files))
+                self.assertEqual(codec.name, "none")
+                self.assertEqual(compressed_ratio(files[:1]), 0.0)
+                codec = self.context._get_codec(
+                    True, lambda: compressed_ratio(files[:1])
+                )
+                self.assertEqual(codec.name, "gzip")
+
+
+@unittest.skipIf(sys.platform == "win32", "tar is not available on Windows")
+class TestIncrementalUpload(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.local_root = os.path.join(self.tmpdir.name, "local")
+        self.remote_base = os.path.join(self.tmpdir.name, "remote")
+        self.files = ["graph.pb", "task/input"]
+        os.makedirs(os.path.join(self.local_root, "task"))
+        for ff in self.files:
+            with open(os.path.join(self.local_root, ff), "w") as f:
+                f.write(f"content of {ff}")
+        patch_home = mock.patch.object(
+            Path, "home", return_value=Path(self.tmpdir.name)
+        )
+        patch_home.start()
+        self.addCleanup(patch_home.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def get_context(self, name, file_store=False):
+        context = SSHContext.__new__(SSHContext)
+        context.local_root = self.local_root
+        context.temp_remote_root = self.remote_base
+        context.remote_root = os.path.join(self.remote_base, name)
+        os.makedirs(context.remote_root, exist_ok=True)
+        context.ssh_session = mock.MagicMock()
+        context.ssh_session.tar_stream = True
+        context.ssh_session.incremental_upload = not file_store
+        context.ssh_session.file_store = file_store
+        context.ssh_session.compress_codec = None
+        context.ssh_session.compress_level = None
+        context.ssh_session.compress_threads = 1
+        context.ssh_session.skip_compressed = True
+        context.ssh_session.sftp = LocalSFTP()
+        context.ssh_session.exec_command.side_effect = local_exec_command_stream
+        return context
+
+    def upload(self, context):
+        file_list, local_hashes = context._filter_unchanged_files(
+            [os.path.join(self.local_root, ff) for ff in self.files]
+        )
+        context._put_files(file_list)
+        context._write_manifest(local_hashes)
+        for ff in self.files:
+            with open(os.path.join(context.remote_root, ff)) as f:
+                self.assertEqual(f.read(), f"content of {ff}")
+        return sorted(file_list)
+
+    def test_incremental_upload(self):
+        context = self.get_context("a")
+        self.assertEqual(self.upload(context), self.files)
+        # the unchanged files are skipped
+        self.assertEqual(self.upload(context), [])
+        # the file modified on the remote is uploaded again
+        with open(os.path.join(context.remote_root, "task/input"), "a") as f:
+            f.write("modified")
+        self.assertEqual(self.upload(context), ["task/input"])
+        # the files are copied to a new remote directory
+        self.assertEqual(self.upload(self.get_context("b")), [])
+        # the broken copy is uploaded
+        with open(os.path.join(self.remote_base, "b", "graph.pb"), "w") as f:
+            f.write("broken")
+        self.assertEqual(self.upload(self.get_context("c")), ["graph.pb"])
+        # the local hashes are cached
+        with mock.patch(
+            "dpdispatcher.utils.cache.get_sha256", side_effect=AssertionError
+        ):
+            self.assertEqual(self.upload(context), [])
+
+    def test_file_store(self):
+        # the local files were modified long ago
+        for ff in self.files:
+            old_time = time.time() - 30 * 86400
+            os.utime(os.path.join(self.local_root, ff), (old_time, old_time))
+        context_a = self.get_context("a", file_store=True)
+        self.assertEqual(self.upload(context_a), self.files)
+        # the store keeps copies; the uploaded files are left writable
+        for ff in self.files:
+            stat_a = os.stat(os.path.join(context_a.remote_root, ff))
+            self.assertEqual(stat_a.st_nlink, 1)
+            self.assertTrue(stat_a.st_mode & S_IWUSR)
+        # the files stored recently are kept, whatever their local mtimes
+        self.assertEqual(context_a.gc_file_store(), (0, 0))
+        # the files are hardlinked from the store
+        context_b = self.get_context("b", file_store=True)
+        self.assertEqual(self.upload(context_b), [])
+        for ff in self.files:
+            stat = os.stat(os.path.join(context_b.remote_root, ff))
+            self.assertEqual(stat.st_nlink, 2)
+            self.assertFalse(stat.st_mode & S_IWUSR)
+        # the referenced files are kept
+        self.assertEqual(context_a.gc_file_store(max_age=-1), (0, 0))
+        shutil.rmtree(context_a.remote_root)
+        shutil.rmtree(context_b.remote_root)
+        self.assertEqual(
+            context_a.gc_file_store(max_age=-1),
+            (2, sum(len(f"content of {ff}") for ff in self.files)),
+        )
+        self.assertEqual(
+            [
+                ff
+                for _, _, files in os.walk(
+                    os.path.join(self.remote_base, ".dpdispatcher_store")
+                )
+                for ff in files
+            ],
+            [],
+        )
+        self.assertEqual(
+            self.upload(self.get_context("c", file_store=True)), self.files
+        )
@@ -0,0 +1,135 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+__package__ = "tests"
+
+from .context import (
+    Machine,
+    Resources,
+    Submission,
+    Task,
+    setUpModule,  # noqa: F401
+)
+
+
+def make_submission(local_root, strategy, gpu_per_node=0, para_deg=2):
+    machine = Machine.load_from_dict(
+        {
+            "batch_type": "Shell",
+            "context_type": "LazyLocalContext",
+            "local_root": local_root,
+        }
+    )
+    resources = Resources.load_from_dict(
+        {
+            "number_node": 1,
+            "cpu_per_node": 2,
+            "gpu_per_node": gpu_per_node,
+            "queue_name": "",
+            "group_size": 0,
+            "para_deg": para_deg,
+            # the slow task runs first
+            "strategy": {"group_strategy": "lpt", **strategy},
+        }
+    )
+    task_list = [
+        # the first task is slow; the others should not wait for it
+        Task(
+            command="echo $CUDA_VISIBLE_DEVICES > gpu; date +%s.%N > start; sleep 3; date +%s.%N > end",
+            task_work_path="task0/",
+            cost=10,
+        )
+    ] + [
+        Task(
+            command="echo $CUDA_VISIBLE_DEVICES > gpu; date +%s.%N > start",
+            task_work_path=f"task{ii}/",
+        )
+        for ii in range(1, 5)
+    ]
+    for ii in range(5):
+        os.makedirs(os.path.join(local_root, f"task{ii}"))
+    return Submission(
+        work_base=".", machine=machine, resources=resources, task_list=task_list
+    )
+
+
+@unittest.skipIf(sys.platform == "win32", "Shell is not supported on Windows")
+class TestTaskSlotPool(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_gen_script(self):
+        submission = make_submission(self.tmpdir.name, {"task_slot_pool": True})
+        submission.generate_jobs()
+        script = submission.machine.gen_script_command(submission.belonging_jobs[0])
+        self.assertEqual(
+            script.count('while [ "$(jobs -pr | wc -l)" -ge 2 ]; do wait -n; done'), 5
+        )
+        self.assertNotIn("wait \n", script)
+
+    def test_gpu_per_task(self):
+        with self.assertRaises(RuntimeError):
+            Resources.load_from_dict(
+                {
+                    "number_node": 1,
+                    "cpu_per_node": 2,
+                    "gpu_per_node": 1,
+                    "queue_name": "",
+                    "group_size": 0,
+                    "strategy": {
+                        "task_slot_pool": True,
+                        "if_cuda_multi_devices": True,
+                        "gpu_per_task": 2,
+                    },
+                }
+            )
+
+    def test_gpu_slot_pool(self):
+        submission = make_submission(
+            self.tmpdir.name,
+            {"task_slot_pool": True, "if_cuda_multi_devices": True},
+            gpu_per_node=2,
+            para_deg=1,
+        )
+        submission.generate_jobs()
+        job = submission.belonging_jobs[0]
+        self.assertIn(
+            "dpdispatcher_acquire_gpus() {", submission.machine.gen_script_env(job)
+        )
+        script = submission.machine.gen_script_command(job)
+        self.assertEqual(script.count("dpdispatcher_acquire_gpus 1;"), 5)
+        self.assertEqual(
+            script.count('while [ "$(jobs -pr | wc -l)" -ge 2 ]; do wait -n; done'), 5
+        )
+        submission.run_submission(check_interval=1)
+        with open(os.path.join(self.tmpdir.name, "task0", "gpu")) as f:
+            slow_gpu = f.read().strip()
+        with open(os.path.join(self.tmpdir.name, "task0", "start")) as f:
+            start_time = float(f.read())
+        with open(os.path.join(self.tmpdir.name, "task0", "end")) as f:
+            end_time = float(f.read())
+        for ii in range(1, 5):
+            with open(os.path.join(self.tmpdir.name, f"task{ii}", "start")) as f:
+                task_start_time = float(f.read())
+            self.assertLess(task_start_time, end_time)
+            with open(os.path.join(self.tmpdir.name, f"task{ii}", "gpu")) as f:
+                # the GPU of the slow task is not shared while it is running;
+                # the slow task may also acquire a GPU after the fast tasks
+                if task_start_time > start_time:
+                    self.assertNotEqual(f.read().strip(), slow_gpu)
+
+    def test_run_submission(self):
+        submission = make_submission(self.tmpdir.name, {"task_slot_pool": True})
+        submission.run_submission(check_interval=1)
+        with open(os.path.join(self.tmpdir.name, "task0", "end")) as f:
+            end_time = float(f.read())
+        for ii in range(1, 5):
+            with open(os.path.join(self.tmpdir.name, f"task{ii}", "start")) as f:
+                # all the fast tasks run while the slow task is running
+                self.assertLess(float(f.read()), end_time)
@@ -0,0 +1,143 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+__package__ = "tests"
+
+from .context import (
+    Machine,
+    Resources,
+    Submission,
+    Task,
+    setUpModule,  # noqa: F401
+)
+
+
+@unittest.skipIf(sys.platform == "win32", "Shell is not supported on Windows")
+class TestTaskStealing(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        local_root = self.tmpdir.name
+        machine = Machine.load_from_dict(
+            {
+                "batch_type": "Shell",
+                "context_type": "LazyLocalContext",
+                "local_root": local_root,
+            }
+        )
+        resources = Resources.load_from_dict(
+            {
+                "number_node": 1,
+                "cpu_per_node": 1,
+                "gpu_per_node": 0,
+                "queue_name": "",
+                "group_size": 2,
+                # job 0: slow task and task 3; job 1: task 1 and task 2
+                "strategy": {"group_strategy": "lpt", "task_stealing": True},
+            }
+        )
+        task_list = [
+            Task(
+                command="sleep 3; date +%s.%N > end",
+                task_work_path="task0/",
+                cost=10,
+            )
+        ] + [
+            Task(command="date +%s.%N >> start", task_work_path=f"task{ii}/")
+            for ii in range(1, 4)
+        ]
+        for ii in range(4):
+            os.makedirs(os.path.join(local_root, f"task{ii}"))
+        self.submission = Submission(
+            work_base=".", machine=machine, resources=resources, task_list=task_list
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_gen_script(self):
+        self.submission.generate_jobs()
+        job0, job1 = self.submission.belonging_jobs
+        machine = self.submission.machine
+        script = machine.gen_script_command(job1)
+        # the job script only contains its own tasks
+        for task in job0.job_task_list:
+            self.assertNotIn(task.task_hash, script)
+        for task in job1.job_task_list:
+            self.assertIn(
+                f"dpdispatcher_try_run_task {job1.job_hash} {task.task_hash} ", script
+            )
+            self.assertIn(
+                f"dpdispatcher_wait_task {job1.job_hash} {task.task_hash} ", script
+            )
+        # the tasks of all the jobs are in the shared queue
+        task_queue = machine.gen_task_queue(self.submission)
+        for job in (job0, job1):
+            for task in job.job_task_list:
+                self.assertIn(f"dpdispatcher_task_{task.task_hash}() {{", task_queue)
+                self.assertIn(
+                    f"dpdispatcher_try_run_task {job.job_hash} {task.task_hash} ",
+                    task_queue,
+                )
+
+    def test_slurm_job_array(self):
+        self.submission.generate_jobs()
+        machine = Machine.load_from_dict(
+            {
+                "batch_type": "SlurmJobArray",
+                "context_type": "LazyLocalContext",
+                "local_root": self.tmpdir.name,
+            }
+        )
+        with self.assertRaises(RuntimeError):
+            machine.gen_script_command(self.submission.belonging_jobs[0])
+
+    def test_run_submission(self):
+        self.submission.run_submission(check_interval=1)
+        with open(os.path.join(self.tmpdir.name, "task0", "end")) as f:
+            end_time = float(f.read())
+        for ii in range(1, 4):
+            with open(os.path.join(self.tmpdir.name, f"task{ii}", "start")) as f:
+                start_times = f.read().split()
+            # each task runs once
+            self.assertEqual(len(start_times), 1)
+            # task 3 is run by job 1 while job 0 is running the slow task
+            self.assertLess(float(start_times[0]), end_time)
+        claims = os.listdir(os.path.join(self.tmpdir.name, "dpdispatcher_task_claims"))
+        self.assertEqual(len(claims), 4)
+
+    def test_failed_task(self):
+        self.submission.machine.retry_count = 0
+        self.submission.belonging_tasks[1].command = "exit 1"
+        with self.assertRaises(RuntimeError):
+            self.submission.run_submission(check_interval=1)
+        # the failed task is released
+        claims = os.listdir(os.path.join(self.tmpdir.name, "dpdispatcher_task_claims"))
+        self.assertNotIn(self.submission.belonging_tasks[1].task_hash, claims)
+
+    def test_expired_claim(self):
+        self.submission.generate_jobs()
+        task = self.submission.belonging_jobs[0].job_task_list[-1]
+        # the task is claimed by a job killed 10 minutes ago
+        claim = os.path.join(
+            self.tmpdir.name, "dpdispatcher_task_claims", task.task_hash
+        )
+        os.makedirs(claim)
+        with open(os.path.join(claim, "owner"), "w") as f:
+            f.write("killed\n")
+        job_alive = os.path.join(self.tmpdir.name, "killed_job_alive")
+        open(job_alive, "w").close()
+        os.utime(job_alive, (time.time() - 600,) * 2)
+        self.submission.run_submission(check_interval=1)
+        self.assertTrue(
+            os.path.isfile(
+                os.path.join(
+                    self.tmpdir.name,
+                    task.task_work_path,
+                    task.task_hash + "_task_tag_finished",
+                )
+            )
+        )